@@ -31,17 +31,20 @@ int leptonCount(vector<LorentzMock>* leptons)
 
 int main(int argc, char **argv)
 {
-  if(argc != 6){
+  if(argc != 6 && !(argc == 7 && string(argv[6]) == "compact")){
     for(int i=0; i<argc; i++){
       cout<<argv[i]<<"\t";
     }
     cout<<endl;
     
     cout<<"Usage:"<<endl;
-    cout<<"./SVJselection input_file_list sample_name output_dir first_event last_event"<<endl;
+    cout<<"./SVJselection input_file_list sample_name output_dir first_event last_event [compact]"<<endl;
+    cout<<"With \"compact\", selected events are stored in npy files referenced by the selection list."<<endl;
     exit(0);
   }
   
+  bool writeCompactSelection = argc == 7;
+  
   
   // declare core object and enable debug
   SVJFinder core(argv);
@@ -241,7 +244,7 @@ int main(int argc, char **argv)
   cout<<"Time elapsed: "<<duration(start, now())<<endl;
   
   core.WriteHists();
-  core.WriteSelectionIndex();
+  core.WriteSelectionIndex(writeCompactSelection);
   core.SaveCutFlow();
   core.PrintCutFlow();
   
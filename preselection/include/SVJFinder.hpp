@@ -47,7 +47,9 @@ public:
   
   void UpdateSelectionIndex(size_t entry);
   
-  void WriteSelectionIndex();
+  // writes selected entries of each tree to a text list. If compact, indices of each tree are stored in a separate
+  // npy file (sorted, 64-bit), referenced from the list instead of being written as text
+  void WriteSelectionIndex(bool compact=false);
   
   
   /// PUBLIC DATA
@@ -69,6 +71,8 @@ private:
   void SetVar(size_t leafIndex, size_t treeIndex);
   
   void SetVectorVar(size_t leafIndex, size_t treeIndex);
+  
+  void WriteNpy(string path, const vector<size_t> &values);
 
   
   int currentEntry; // general entry
@@ -206,7 +206,7 @@ void SVJFinder::UpdateSelectionIndex(size_t entry)
   selectionIndex[chain->currentTree].push_back(chain->currentEntry);
 }
 
-void SVJFinder::WriteSelectionIndex()
+void SVJFinder::WriteSelectionIndex(bool compact)
 {
   std::ofstream f(outputdir + "/" + sample + "_selection.txt");
   log(selectionIndex.size());
@@ -216,8 +216,16 @@ void SVJFinder::WriteSelectionIndex()
   if (f.is_open()) {
     for (size_t i = 0; i < selectionIndex.size(); i++){
       f << outputTrees[i] << ": ";
-      for (size_t j = 0; j < selectionIndex[i].size(); j++) {
-        f << selectionIndex[i][j] << " ";
+      if (compact) {
+        // path of the npy file is relative to the selection list
+        string npyName = sample + "_selection_" + to_string(i) + ".npy";
+        WriteNpy(outputdir + "/" + npyName, selectionIndex[i]);
+        f << npyName;
+      }
+      else {
+        for (size_t j = 0; j < selectionIndex[i].size(); j++) {
+          f << selectionIndex[i][j] << " ";
+        }
       }
       f << endl;
     }
@@ -225,6 +233,32 @@ void SVJFinder::WriteSelectionIndex()
   }
 }
 
+void SVJFinder::WriteNpy(string path, const vector<size_t> &values)
+{
+  std::ofstream f(path, std::ios::binary);
+  if (!f.is_open()) {
+    throw "Couldn't open file " + path + " for writing!";
+  }
+  
+  // npy format version 1.0: magic string, version, header length and header padded to a multiple of 64 bytes
+  string header = "{'descr': '<u8', 'fortran_order': False, 'shape': (" + to_string(values.size()) + ",), }";
+  size_t preambleLength = 10;
+  header += string(63 - (preambleLength + header.size()) % 64, ' ') + "\n";
+  uint16_t headerLength = header.size();
+  
+  f.write("\x93NUMPY\x01\x00", 8);
+  f.put(char(headerLength & 0xff));
+  f.put(char(headerLength >> 8));
+  f << header;
+  
+  // indices are written as little-endian unsigned 64-bit integers
+  for (size_t value : values) {
+    uint64_t entry = value;
+    for (int iByte = 0; iByte < 8; iByte++) f.put(char((entry >> (8 * iByte)) & 0xff));
+  }
+  f.close();
+}
+
 void SVJFinder::AddCompsBase(string& vectorName, vector<string>& components)
 {
   if(compIndex.find(vectorName) != compIndex.end()){
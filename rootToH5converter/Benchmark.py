@@ -0,0 +1,136 @@
+import os
+import json
+import time
+
+from Converter import Converter
+from DataProcessor import DataProcessor, InputTypes
+
+
+class Benchmark:
+    """
+    Measures throughput of the converter on synthetic inputs (see SyntheticTreeWriter). Each input type is converted
+    end to end with each of the option sets, and events/s and MB/s of the input file are recorded. Results can be
+    compared with a baseline to find regressions.
+    """
+
+    # converter options measured by default
+    default_option_sets = {
+        "jets": dict(max_n_constituents=-1, efp_degree=-1),
+        "constituents": dict(max_n_constituents=20, efp_degree=-1),
+        "efps": dict(max_n_constituents=-1, efp_degree=2),
+        "fat_jets": dict(max_n_constituents=20, efp_degree=-1, use_fat_jets=True),
+        "columnar": dict(max_n_constituents=20, efp_degree=-1, columnar=True),
+    }
+
+    def __init__(self, work_dir, tree_writer, option_sets=None, store_n_jets=2, jet_delta_r=0.8, verbosity_level=1):
+        """
+        Args:
+            work_dir (str): Directory for synthetic inputs and outputs of the conversion (created if needed).
+            tree_writer (SyntheticTreeWriter): Writer of synthetic inputs, defining number of events and objects.
+            option_sets (dict): Name and Converter arguments of each measured configuration (default_option_sets
+                                if None).
+            store_n_jets (int), jet_delta_r (float): Converter arguments common to all configurations.
+            verbosity_level (int): 0 - no output, 1 - basic output, 2 - detailed output (also of the converter).
+        """
+        self.work_dir = work_dir
+        self.tree_writer = tree_writer
+        self.option_sets = Benchmark.default_option_sets if option_sets is None else option_sets
+        self.store_n_jets = store_n_jets
+        self.jet_delta_r = jet_delta_r
+        self.verbosity_level = verbosity_level
+
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    def prepare_input(self, input_type):
+        """
+        Writes synthetic ROOT file of given input type and input list selecting all its events. Returns path of the
+        input list and size of the ROOT file in MB.
+        """
+        root_path = os.path.join(self.work_dir, input_type.name + ".root")
+        list_path = os.path.join(self.work_dir, input_type.name + ".txt")
+
+        self.tree_writer.write(root_path, input_type)
+
+        with open(list_path, "w") as list_file:
+            list_file.write("{0}: -1\n".format(root_path))
+
+        return list_path, os.path.getsize(root_path) / 1024 ** 2
+
+    @staticmethod
+    def is_supported(input_type, options):
+        """
+        Checks if given options can be used for given input type (e.g. nanoAOD has no fat jets).
+        """
+        if options.get("use_fat_jets", False) and "FatJet_eta" not in DataProcessor.variables[input_type]:
+            return False
+
+        return True
+
+    def run(self, input_types=None):
+        """
+        Runs all configurations for given input types (all by default) and returns dict with results of each input
+        type and option set: wall time, events/s, MB/s and stage times from the conversion report.
+        """
+        input_types = list(InputTypes) if input_types is None else input_types
+        results = {}
+
+        for input_type in input_types:
+            list_path, input_size = self.prepare_input(input_type)
+            results[input_type.name] = {}
+
+            for name, options in self.option_sets.items():
+                if not Benchmark.is_supported(input_type, options):
+                    continue
+
+                output_path = os.path.join(self.work_dir, "{0}_{1}.h5".format(input_type.name, name))
+                start = time.perf_counter()
+
+                converter = Converter(list_path, store_n_jets=self.store_n_jets, jet_delta_r=self.jet_delta_r,
+                                      verbosity_level=max(0, self.verbosity_level - 1), **options)
+                converter.convert(output_file_name=output_path)
+
+                wall_time = time.perf_counter() - start
+                report = converter.report.to_dict()
+
+                results[input_type.name][name] = {
+                    "n_events": report["n_processed_events"],
+                    "wall_time": wall_time,
+                    "events_per_second": report["n_processed_events"] / wall_time,
+                    "mb_per_second": input_size / wall_time,
+                    "stages": {stage: values["time"] for stage, values in report["stages"].items()},
+                }
+
+                if self.verbosity_level > 0:
+                    print("{0:<16} {1:<14} {2:>10.1f} events/s {3:>8.2f} MB/s".format(
+                        input_type.name, name, results[input_type.name][name]["events_per_second"],
+                        results[input_type.name][name]["mb_per_second"]))
+
+        return results
+
+    @staticmethod
+    def find_regressions(results, baseline, tolerance=0.2):
+        """
+        Returns list of (input type, option set, events/s, baseline events/s) for configurations which are slower
+        than in the baseline results by more than the tolerance (fraction of the baseline throughput).
+        """
+        regressions = []
+
+        for input_type, option_sets in results.items():
+            for name, result in option_sets.items():
+                if name not in baseline.get(input_type, {}):
+                    continue
+
+                baseline_rate = baseline[input_type][name]["events_per_second"]
+
+                if result["events_per_second"] < (1. - tolerance) * baseline_rate:
+                    regressions.append((input_type, name, result["events_per_second"], baseline_rate))
+
+        return regressions
+
+    @staticmethod
+    def save(results, path):
+        """
+        Saves results as json.
+        """
+        with open(path, "w") as results_file:
+            json.dump(results, results_file, indent=4)
@@ -0,0 +1,75 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ChunkReader:
+    """
+    Loads chunks of entries into a DataProcessor one after another, while they're processed. If prefetch is set,
+    the next chunk is read in a background thread while the current one is processed, so that reading (mostly
+    decompression, which releases the GIL) overlaps with the conversion.
+
+    Time spent waiting for each chunk is added to the read stage of the reports, while time of reading itself is
+    added to their I/O statistics (see ConversionReport.add_read), from which the overlap ratio is calculated.
+    """
+
+    def __init__(self, data_processor, chunks, prefetch=False, reports=None):
+        """
+        Args:
+            data_processor (DataProcessor): Processor to which chunks are loaded.
+            chunks (list): Tuples starting with the first and the last + 1 entry of each chunk (see
+                           Converter.get_chunks).
+            prefetch (bool): If true, the next chunk is read in the background.
+            reports (list): ConversionReports to which read times are added.
+        """
+        self.data_processor = data_processor
+        self.chunks = chunks
+        self.prefetch = prefetch
+        self.reports = [] if reports is None else reports
+
+    def __iter__(self):
+        """
+        Yields chunks after loading them to the data processor.
+        """
+        if not self.prefetch:
+            for chunk in self.chunks:
+                start = time.perf_counter()
+                self.data_processor.set_entries(chunk[0], self.data_processor.read_entries(chunk[0], chunk[1]))
+                read_time = time.perf_counter() - start
+
+                self.add_to_reports(read_time, read_time, chunk[1] - chunk[0])
+                yield chunk
+            return
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = None if len(self.chunks) == 0 else executor.submit(self.read_chunk, self.chunks[0])
+
+            for i_chunk, chunk in enumerate(self.chunks):
+                start = time.perf_counter()
+                branches, read_time = future.result()
+                wait_time = time.perf_counter() - start
+
+                self.data_processor.set_entries(chunk[0], branches)
+
+                # the next chunk is read while this one is processed
+                if i_chunk + 1 < len(self.chunks):
+                    future = executor.submit(self.read_chunk, self.chunks[i_chunk + 1])
+
+                self.add_to_reports(read_time, wait_time, chunk[1] - chunk[0])
+                yield chunk
+
+    def read_chunk(self, chunk):
+        """
+        Reads branches of the chunk, returns them with the time of reading.
+        """
+        start = time.perf_counter()
+        branches = self.data_processor.read_entries(chunk[0], chunk[1])
+
+        return branches, time.perf_counter() - start
+
+    def add_to_reports(self, read_time, wait_time, n_entries):
+        """
+        Adds time of reading a chunk and time the conversion waited for it to the reports.
+        """
+        for report in self.reports:
+            report.add_stage("read", wait_time, calls=1, count=n_entries)
+            report.add_read(read_time, wait_time)
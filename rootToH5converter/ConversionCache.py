@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import hashlib
+import numpy as np
+
+
+class ConversionCache:
+    """
+    Keeps h5 fragments with converted events of single input files in a cache directory. Fragments are keyed on
+    the identity of the input file (path, size and modification time, or checksum of its content), selected events,
+    input type and converter parameters, so that unchanged inputs don't have to be converted again. Total size of
+    the cache is limited by removing least recently used fragments.
+    """
+
+    # increase when format of the fragments changes, to invalidate old ones
+    version = 2
+
+    # fragments being written which weren't modified for this many seconds are left over from crashed conversions
+    stale_time = 3600.
+
+    def __init__(self, cache_dir, max_size_gb=10., use_checksums=False, verbosity_level=1):
+        """
+        Args:
+            cache_dir (str): Directory to store fragments in (created if needed).
+            max_size_gb (float): Maximum total size of fragments in the cache.
+            use_checksums (bool): If true, files are identified by checksum of their content instead of their path,
+                size and modification time. It's slower, but survives copying or touching files.
+            verbosity_level (int): 0 - no output, 1 - basic output, 2 - detailed output.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size_gb * 1024 ** 3
+        self.use_checksums = use_checksums
+        self.verbosity_level = verbosity_level
+
+        # fragments used in this run are never evicted
+        self.used_keys = set()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.remove_stale_fragments()
+
+    @staticmethod
+    def is_process_running(pid):
+        """
+        Checks if process with given pid is running on this machine. Always true on Windows, where it can't be
+        checked without side effects.
+        """
+        if os.name == "nt":
+            return True
+
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # running, but owned by another user
+            return True
+
+        return True
+
+    def remove_stale_fragments(self):
+        """
+        Removes fragments left at their temporary paths by conversions which crashed or were killed before adding
+        them to the cache. Only fragments which weren't modified recently and whose writing process isn't running
+        are removed, since other processes may be writing to the same cache (e.g. from another machine).
+        """
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".tmp.h5"):
+                continue
+
+            path = os.path.join(self.cache_dir, name)
+
+            try:
+                pid = int(name[:-len(".tmp.h5")].rsplit(".", 1)[-1])
+            except ValueError:
+                pid = None
+
+            if pid is not None and ConversionCache.is_process_running(pid):
+                continue
+
+            try:
+                if time.time() - os.stat(path).st_mtime < ConversionCache.stale_time:
+                    continue
+
+                os.remove(path)
+            except FileNotFoundError:
+                # removed by another process in the meantime
+                continue
+
+            if self.verbosity_level > 1:
+                print("Removed stale fragment from cache: ", path)
+
+    def get_file_identity(self, file_path):
+        """
+        Returns dict describing the state of the input file.
+        """
+        if not self.use_checksums:
+            stat = os.stat(file_path)
+            return {"path": os.path.abspath(file_path), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+        checksum = hashlib.sha256()
+
+        with open(file_path, "rb") as file:
+            for block in iter(lambda: file.read(16 * 1024 ** 2), b""):
+                checksum.update(block)
+
+        return {"sha256": checksum.hexdigest()}
+
+    def get_key(self, file_path, selection, input_type, parameters):
+        """
+        Returns key of the fragment with given selected events of the file, converted with given parameters (dict).
+        """
+        selection = np.sort(np.asarray(selection, dtype=np.int64))
+
+        description = {
+            "version": ConversionCache.version,
+            "file": self.get_file_identity(file_path),
+            "selection": hashlib.sha256(selection.tobytes()).hexdigest(),
+            "input_type": input_type.name,
+            "parameters": parameters,
+        }
+
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def get_path(self, key):
+        """
+        Returns path of the fragment with given key.
+        """
+        return os.path.join(self.cache_dir, key + ".h5")
+
+    def get_temporary_path(self, key):
+        """
+        Returns path where a new fragment can be written, before it's added to the cache.
+        """
+        return os.path.join(self.cache_dir, "{0}.{1}.tmp.h5".format(key, os.getpid()))
+
+    def get(self, key):
+        """
+        Returns path of the fragment with given key or None if it's not in the cache.
+        """
+        path = self.get_path(key)
+
+        if not os.path.exists(path):
+            return None
+
+        # mark as recently used
+        os.utime(path)
+        self.used_keys.add(key)
+
+        if self.verbosity_level > 0:
+            print("Using cached conversion: ", path)
+
+        return path
+
+    def add(self, key, temporary_path):
+        """
+        Moves fragment written to the temporary path into the cache and evicts old fragments if needed.
+        """
+        os.replace(temporary_path, self.get_path(key))
+        self.used_keys.add(key)
+        self.evict()
+
+    def evict(self):
+        """
+        Removes least recently used fragments until the cache fits in the maximum size.
+        """
+        fragments = []
+
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+
+            if not name.endswith(".h5") or name.endswith(".tmp.h5"):
+                continue
+
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # removed by another process in the meantime
+                continue
+
+            fragments.append((stat.st_mtime, stat.st_size, name[:-len(".h5")], path))
+
+        total_size = sum(fragment[1] for fragment in fragments)
+
+        for _, size, key, path in sorted(fragments):
+            if total_size <= self.max_size:
+                break
+
+            if key in self.used_keys:
+                continue
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+            total_size -= size
+
+            if self.verbosity_level > 1:
+                print("Removed from cache: ", path)
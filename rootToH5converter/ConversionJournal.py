@@ -0,0 +1,143 @@
+import os
+import json
+
+from H5Writer import H5Writer
+
+
+class ConversionJournal:
+    """
+    Keeps track of converted chunks committed to disk, so that a conversion killed before the end (e.g. by
+    preemption or wall-time limit) can be resumed. Converted chunks are written to segment h5 files next to the
+    output. Each segment is closed before it's recorded in the json journal ('<output>_journal.json'), together with
+    the position of the conversion (input file and number of its chunks done), so the journal only lists complete
+    segments. The report of the conversion up to each commit is recorded as well, so that a resumed conversion
+    reports the whole conversion. When the conversion is done, segments are merged into the output file and removed
+    with the journal.
+    """
+
+    # increase when format of the journal changes, so that old journals are not resumed
+    version = 2
+
+    def __init__(self, output_file_name, key, resume=False, verbosity_level=1):
+        """
+        Args:
+            output_file_name (str): Path of the final output file.
+            key (str): Description of inputs and converter parameters. Journal is only resumed if it matches.
+            resume (bool): If true, continues conversion recorded in existing journal. Otherwise, starts from
+                           scratch, removing segments of the existing journal.
+            verbosity_level (int): 0 - no output, 1 - basic output, 2 - detailed output.
+        """
+        self.output_file_name = H5Writer.prepare_output_path(output_file_name)
+        self.base_path = self.output_file_name[:-len(".h5")]
+        self.path = self.base_path + "_journal.json"
+        self.verbosity_level = verbosity_level
+
+        existing_state = None
+
+        if os.path.exists(self.path):
+            with open(self.path, "r") as journal_file:
+                existing_state = json.load(journal_file)
+
+        if resume and existing_state is not None:
+            if existing_state.get("version") != ConversionJournal.version or existing_state.get("key") != key:
+                print("ERROR -- journal ", self.path, " was written for different inputs or options, can't resume")
+                exit()
+
+            self.state = existing_state
+
+            if self.verbosity_level > 0:
+                print("Resuming conversion after {0} committed event(s) from journal: {1}".format(
+                    self.state["n_events"], self.path))
+        else:
+            if resume and self.verbosity_level > 0:
+                print("WARNING -- no journal found in ", self.path, ", starting conversion from scratch")
+
+            if existing_state is not None:
+                ConversionJournal.remove_files(existing_state["segments"])
+
+            self.state = {
+                "version": ConversionJournal.version,
+                "key": key,
+                "segments": [],
+                "i_file": 0,
+                "n_file_chunks": 0,
+                "file": None,
+                "entry_stop": 0,
+                "n_events": 0,
+                "n_jets_without_constituents": 0,
+                "report": None,
+            }
+            self.save()
+
+    def get_segment_path(self):
+        """
+        Returns path of the next segment to be written.
+        """
+        return "{0}_segment{1}.h5".format(self.base_path, len(self.state["segments"]))
+
+    def is_file_done(self, i_file):
+        """
+        Checks if all chunks of input file with given index were committed.
+        """
+        return i_file < self.state["i_file"]
+
+    def is_chunk_done(self, i_file, i_chunk):
+        """
+        Checks if chunk with given index of input file with given index was committed.
+        """
+        return self.is_file_done(i_file) or (i_file == self.state["i_file"] and i_chunk < self.state["n_file_chunks"])
+
+    def commit(self, segment_path, i_file, n_file_chunks, file_name, entry_stop, n_events,
+               n_jets_without_constituents, report=None):
+        """
+        Records closed segment and position of the conversion after it: index of the current input file and number
+        of its chunks done (i_file is the next file and n_file_chunks is 0 after the last chunk of a file), with
+        name of the file and last entry read for information. Numbers of events and jets without constituents
+        are totals of all committed segments, and report (dict from ConversionReport.to_dict()) describes the
+        conversion up to this commit.
+        """
+        self.state["segments"].append(segment_path)
+        self.state["i_file"] = i_file
+        self.state["n_file_chunks"] = n_file_chunks
+        self.state["file"] = file_name
+        self.state["entry_stop"] = int(entry_stop)
+        self.state["n_events"] = int(n_events)
+        self.state["n_jets_without_constituents"] = int(n_jets_without_constituents)
+        self.state["report"] = report
+        self.save()
+
+        if self.verbosity_level > 1:
+            print("Committed segment: ", segment_path, " (", n_events, " events in total)")
+
+    def save(self):
+        """
+        Writes the journal, replacing the previous one only when the new one is complete.
+        """
+        temporary_path = self.path + ".tmp"
+
+        with open(temporary_path, "w") as journal_file:
+            json.dump(self.state, journal_file, indent=4)
+
+        os.replace(temporary_path, self.path)
+
+    def finalize(self, h5_layout=None, chunk_size=10000):
+        """
+        Merges committed segments into the output file (with H5Writer arguments from h5_layout) and removes them,
+        together with the journal.
+        """
+        writer = H5Writer(self.output_file_name, self.verbosity_level, **(h5_layout or {}))
+        writer.add_sections_from_file(self.state["segments"][0])
+        writer.append_files(self.state["segments"], chunk_size)
+        writer.close()
+
+        ConversionJournal.remove_files(self.state["segments"])
+        os.remove(self.path)
+
+    @staticmethod
+    def remove_files(paths):
+        """
+        Removes files which exist from the list.
+        """
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,280 @@
+import sys
+import json
+import time
+import numpy as np
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, peak memory is not reported there
+    resource = None
+
+
+class ConversionReport:
+    """
+    Collects wall time and counts of processed items for each stage of the conversion (e.g. opening trees, reading
+    branches, building events, matching constituents, calculating EFPs, writing h5), numbers of processed, stored
+    and skipped events (with reasons), cutflow of the preselection, unrecognized PDG IDs of PF candidates, peak
+    memory and overlap of reading with processing. Prints rate-limited progress and saves everything to a json report.
+
+    Stages can be nested: time of each stage excludes time of stages measured inside it, so that the sum of all
+    stage times doesn't exceed the wall time.
+    """
+
+    def __init__(self, verbosity_level=1, progress_interval=10.):
+        """
+        Args:
+            verbosity_level (int): 0 - no output, 1 - basic output, 2 - detailed output.
+            progress_interval (float): Minimum number of seconds between two progress lines.
+        """
+        self.verbosity_level = verbosity_level
+        self.progress_interval = progress_interval
+
+        self.start_time = time.perf_counter()
+        self.last_progress_time = self.start_time
+
+        # wall time of earlier parts of the same conversion (e.g. before it was resumed)
+        self.previous_wall_time = 0.
+
+        self.stages = {}
+        self.skipped_events = {}
+        self.n_processed_events = 0
+        self.n_stored_events = 0
+        self.n_jets_without_constituents = 0
+        self.unrecognized_pids = {}
+
+        # numbers of events passing and failing each cut of the preselection, in order of the cuts
+        self.cutflow = {}
+
+        # time of reading chunks and time the conversion waited for them (less if they were prefetched)
+        self.read_time = 0.
+        self.read_wait_time = 0.
+
+        # peak memory of other processes whose reports were added (e.g. workers converting shards)
+        self.peak_memory_of_added_reports = None
+
+        # time spent in stages nested in the currently measured ones
+        self.nested_times = []
+
+    @contextmanager
+    def measure(self, stage, count=0):
+        """
+        Context manager measuring time of the code inside it as given stage, which processed count items.
+        """
+        start = time.perf_counter()
+        self.nested_times.append(0.)
+
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested_time = self.nested_times.pop()
+
+            if len(self.nested_times) > 0:
+                self.nested_times[-1] += elapsed
+
+            self.add_stage(stage, elapsed - nested_time, calls=1, count=count)
+
+    def add_stage(self, stage, time_s, calls=0, count=0):
+        """
+        Adds time, number of calls and number of processed items to given stage.
+        """
+        stage = self.stages.setdefault(stage, {"time": 0., "calls": 0, "count": 0})
+        stage["time"] += time_s
+        stage["calls"] += calls
+        stage["count"] += count
+
+    def add_read(self, read_time, wait_time):
+        """
+        Adds time of reading a chunk of entries and time the conversion was waiting for it. They differ when the
+        chunk was read in the background, while the previous one was processed.
+        """
+        self.read_time += read_time
+        self.read_wait_time += wait_time
+
+    def get_read_overlap(self):
+        """
+        Returns fraction of the reading time which overlapped with processing, or None if nothing was read.
+        """
+        if self.read_time <= 0:
+            return None
+
+        return max(0., 1. - self.read_wait_time / self.read_time)
+
+    def add_skipped_events(self, reason, n_events=1):
+        """
+        Counts events skipped for given reason.
+        """
+        if n_events > 0:
+            self.skipped_events[reason] = self.skipped_events.get(reason, 0) + n_events
+
+    def add_cut(self, cut, n_passed, n_failed):
+        """
+        Adds numbers of events passing and failing given cut of the preselection.
+        """
+        counts = self.cutflow.setdefault(cut, {"passed": 0, "failed": 0})
+        counts["passed"] += n_passed
+        counts["failed"] += n_failed
+
+    def print_cutflow(self):
+        """
+        Prints numbers of events passing each cut of the preselection, with absolute and relative efficiencies.
+        """
+        if self.verbosity_level == 0 or len(self.cutflow) == 0:
+            return
+
+        n_all = next(iter(self.cutflow.values()))
+        n_all = n_all["passed"] + n_all["failed"]
+        n_previous = n_all
+
+        print("Cutflow (cut: passed events, absolute efficiency, relative efficiency):")
+        print("\tnone: ", n_all)
+
+        for cut, counts in self.cutflow.items():
+            print("\t{0}: {1}, {2:.2f}%, {3:.2f}%".format(cut, counts["passed"],
+                                                         100. * counts["passed"] / max(n_all, 1),
+                                                         100. * counts["passed"] / max(n_previous, 1)))
+            n_previous = counts["passed"]
+
+    def add_unrecognized_pids(self, pids):
+        """
+        Counts occurrences of given unrecognized PDG IDs.
+        """
+        if len(pids) == 0:
+            return
+
+        for pid, count in zip(*np.unique(pids, return_counts=True)):
+            self.unrecognized_pids[int(pid)] = self.unrecognized_pids.get(int(pid), 0) + int(count)
+
+    def print_unrecognized_pids(self):
+        """
+        Prints numbers of candidates with each unrecognized PDG ID, if there were any.
+        """
+        if self.verbosity_level > 0 and len(self.unrecognized_pids) > 0:
+            print("WARNING -- unrecognized PIDs (PID: number of candidates): ", self.unrecognized_pids)
+
+    def get_wall_time(self):
+        """
+        Returns number of seconds since the report was created, plus wall time of earlier parts of the conversion.
+        """
+        return time.perf_counter() - self.start_time + self.previous_wall_time
+
+    @staticmethod
+    def get_peak_memory():
+        """
+        Returns peak resident memory of this process in MB, or None if it's not available.
+        """
+        if resource is None:
+            return None
+
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        # ru_maxrss is in bytes on macOS and in kB on Linux
+        return max_rss / 1024 ** 2 if sys.platform == "darwin" else max_rss / 1024
+
+    def print_progress(self, n_total_events, force=False):
+        """
+        Prints number of processed events and processing rate, at most once every progress_interval seconds.
+        """
+        if self.verbosity_level == 0:
+            return
+
+        now = time.perf_counter()
+
+        if not force and now - self.last_progress_time < self.progress_interval:
+            return
+
+        self.last_progress_time = now
+        rate = self.n_processed_events / max(now - self.start_time + self.previous_wall_time, 1e-9)
+
+        print("Processed events: {0}/{1} ({2:.1f} events/s), stored: {3}, skipped: {4}, "
+              "jets without constituents: {5}".format(self.n_processed_events, n_total_events, rate,
+                                                      self.n_stored_events, sum(self.skipped_events.values()),
+                                                      self.n_jets_without_constituents))
+
+    def to_dict(self):
+        """
+        Returns summary of the conversion as a dict.
+        """
+        wall_time = self.get_wall_time()
+        peak_memory = ConversionReport.get_peak_memory()
+
+        if self.peak_memory_of_added_reports is not None:
+            peak_memory = max(peak_memory or 0., self.peak_memory_of_added_reports)
+
+        stages = {}
+        for name, stage in self.stages.items():
+            stages[name] = dict(stage)
+            stages[name]["fraction"] = stage["time"] / wall_time if wall_time > 0 else 0.
+            stages[name]["per_second"] = stage["count"] / stage["time"] if stage["time"] > 0 else None
+
+        return {
+            "wall_time": wall_time,
+            "n_processed_events": self.n_processed_events,
+            "n_stored_events": self.n_stored_events,
+            "events_per_second": self.n_processed_events / wall_time if wall_time > 0 else None,
+            "skipped_events": dict(self.skipped_events),
+            "n_jets_without_constituents": self.n_jets_without_constituents,
+            "unrecognized_pids": {str(pid): count for pid, count in sorted(self.unrecognized_pids.items())},
+            "peak_memory_mb": peak_memory,
+            "cutflow": [dict(cut=cut, **counts) for cut, counts in self.cutflow.items()],
+            "read_time": self.read_time,
+            "read_wait_time": self.read_wait_time,
+            "read_overlap": self.get_read_overlap(),
+            "stages": stages,
+        }
+
+    def add_report(self, report, sequential=False):
+        """
+        Adds counts and stage times from another report (dict returned by to_dict(), e.g. from one of the shards
+        converted in parallel). Stage times are summed over all processes, while peak memory is the maximum. If
+        sequential is set, the other report describes an earlier part of the same conversion (e.g. before it was
+        resumed), so its wall time is added as well.
+        """
+        if sequential:
+            self.previous_wall_time += report["wall_time"]
+
+        self.n_processed_events += report["n_processed_events"]
+        self.n_stored_events += report["n_stored_events"]
+        self.n_jets_without_constituents += report["n_jets_without_constituents"]
+
+        for reason, n_events in report["skipped_events"].items():
+            self.add_skipped_events(reason, n_events)
+
+        for pid, count in report["unrecognized_pids"].items():
+            self.unrecognized_pids[int(pid)] = self.unrecognized_pids.get(int(pid), 0) + count
+
+        for counts in report["cutflow"]:
+            self.add_cut(counts["cut"], counts["passed"], counts["failed"])
+
+        self.add_read(report["read_time"], report["read_wait_time"])
+
+        for name, stage in report["stages"].items():
+            self.add_stage(name, stage["time"], stage["calls"], stage["count"])
+
+        if report["peak_memory_mb"] is not None:
+            self.peak_memory_of_added_reports = max(self.peak_memory_of_added_reports or 0., report["peak_memory_mb"])
+
+    @staticmethod
+    def get_path(output_file_name):
+        """
+        Returns path of the report for given output file.
+        """
+        for extension in [".h5", ".parquet"]:
+            if output_file_name.endswith(extension):
+                output_file_name = output_file_name[:-len(extension)]
+
+        return output_file_name + "_report.json"
+
+    def save(self, output_file_name):
+        """
+        Saves the report as json next to given output file.
+        """
+        path = ConversionReport.get_path(output_file_name)
+
+        with open(path, "w") as report_file:
+            json.dump(self.to_dict(), report_file, indent=4)
+
+        if self.verbosity_level > 0:
+            print("Conversion report saved to: ", path)
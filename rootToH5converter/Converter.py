@@ -1,10 +1,21 @@
-import uproot
-import numpy as np
-import energyflow as ef
 import os
+import json
 import h5py
+import hashlib
+import uproot
+import numpy as np
 from Jet import Jet
 from Event import Event
+from EventBatch import EventBatch
+from H5Writer import H5Writer
+from ChunkReader import ChunkReader
+from EFPSetCache import EFPSetCache
+from EventSelection import EventSelection
+from InputFilePool import InputFilePool
+from ParquetWriter import ParquetWriter
+from ConversionCache import ConversionCache
+from ConversionJournal import ConversionJournal
+from ConversionReport import ConversionReport
 from DataProcessor import *
 from enum import Enum
 
@@ -14,33 +25,94 @@ class OutputTypes(Enum):
     JetFeatures = 1,
     EPFs = 2,
     JetConstituents = 3
+    EventIndex = 4
     
 
 class Converter:
 
-    def __init__(self, input_path, store_n_jets, jet_delta_r, max_n_constituents, efp_degree, use_fat_jets=False, verbosity_level=1, force_delta_r_usage=False):
+    def __init__(self, input_path, store_n_jets, jet_delta_r, max_n_constituents, efp_degree, use_fat_jets=False, verbosity_level=1, force_delta_r_usage=False,
+                 columnar=False, chunk_size=10000, selections=None, efp_n_jobs=1, cache_dir=None, cache_size_gb=10.,
+                 cache_checksums=False, h5_layout=None, ragged_constituents=False, journal_chunks=0, max_open_files=64,
+                 tree_manifest_path=None, file_pool=None, decompression_threads=0, interpretation_threads=0,
+                 prefetch=False, efp_cache_dir=None, selection=None, file_table=None, substructure=True):
         """
-        Reads input trees, recognizes input types, initializes EFP processor and prepares all arrays needed to
-        store output variables.
+        Reads input trees, recognizes input types, initializes EFP processor and prepares names, labels and shapes
+        of output variables. Input trees are read in chunks of chunk_size entries. If columnar is set, events of each
+        chunk are processed at once with EventBatch instead of building Event objects one by one.
+        If selections (dict with selected events for each ROOT file path) is given, it's used instead of input_path.
+        EFPs of all jets stored from a chunk are calculated at once, using efp_n_jobs processes (None - all CPUs).
+        If cache_dir is given, converted events of each input file are cached there (see ConversionCache) and reused
+        as long as the file, its selection and converter parameters don't change.
+        h5_layout (dict with dtype, compression, compression_level, shuffle and chunk_events) is passed to H5Writer
+        of the output file. If ragged_constituents is set, jet constituents are stored as a flat table with offsets
+        and counts of constituents for each jet, instead of an array padded to max_n_constituents.
+        Time spent in each stage of the conversion, throughput and skipped events are collected in self.report
+        (see ConversionReport) and saved next to the output file. If journal_chunks is set, streamed conversion is
+        committed every journal_chunks chunks, so that it can be resumed (see convert()).
+        Input files are opened only when their events are converted, with at most max_open_files open at once. Trees
+        and numbers of entries of input files are stored in a manifest (tree_manifest_path, by default in cache_dir
+        if it's given), so that they're not opened to plan the next conversion. Converters can share file_pool
+        (see InputFilePool) instead.
+        Baskets are decompressed and interpreted by pools of decompression_threads and interpretation_threads threads
+        (0 - in the reading thread). If prefetch is set, the next chunk is read in the background while the current
+        one is converted (see ChunkReader).
+        Prepared EFP sets are stored in efp_cache_dir (by default in cache_dir, if it's given) and reused by later
+        runs (see EFPSetCache).
+        If selection (list of expressions, e.g. "Pt[1] > 200" or "MET / MT > 0.15") is given, cuts are applied to
+        all events of each chunk at once before they're converted, and their cutflow is added to the report (see
+        EventSelection).
+        Source of each stored event (id of the input file and entry number) is stored in the event index, together
+        with the table of input files, whose positions in file_table (by default input files of this converter) are
+        their ids.
+        If substructure is not set, ptD and axis2 jet features are stored as zeros. Then, if neither EFPs nor jet
+        constituents are requested, constituent collections are not read at all and jets are stored whether they
+        have constituents or not.
         """
         self.verbosity_level = verbosity_level
+        self.report = ConversionReport(verbosity_level)
         self.force_delta_r_usage = force_delta_r_usage
-        self.set_input_paths_and_selections(input_path=input_path)
-
-        # read files, trees and recognize input type
-        self.files = {path: uproot.open(path) for path in self.input_file_paths}
-        self.trees = {}
-        self.input_types = {}
-        self.read_trees()
+        self.columnar = columnar
+        self.chunk_size = chunk_size
+        self.efp_n_jobs = efp_n_jobs
+        self.h5_layout = {} if h5_layout is None else h5_layout
+        self.ragged_constituents = ragged_constituents
+        self.journal_chunks = journal_chunks
+        self.prefetch = prefetch
+        self.decompression_executor = Converter.get_executor(decompression_threads)
+        self.interpretation_executor = Converter.get_executor(interpretation_threads)
+        self.cache = None if cache_dir is None else ConversionCache(cache_dir, cache_size_gb, cache_checksums,
+                                                                    verbosity_level)
+        
+        if selections is None:
+            self.set_input_paths_and_selections(input_path=input_path)
+        else:
+            self.selections = dict(selections)
+            self.input_file_paths = list(self.selections.keys())
+
+        if tree_manifest_path is None and cache_dir is not None:
+            tree_manifest_path = os.path.join(cache_dir, "trees.json")
+        
+        if file_pool is None:
+            file_pool = InputFilePool(max_open_files, tree_manifest_path, verbosity_level)
+        
+        self.file_pool = file_pool
+        
+        # find trees and recognize input types (files are opened only if they're not in the manifest)
+        with self.report.measure("open", count=len(self.input_file_paths)):
+            self.input_types = {}
+            self.n_entries = {}
+            self.read_trees()
         self.set_selections_all_events()
-        self.n_all_events = sum([tree.num_entries for tree in self.trees.values()])
+        self.file_table = list(self.input_file_paths if file_table is None else file_table)
+        self.file_ids = {path: i_file for i_file, path in enumerate(self.file_table)}
+        self.n_all_events = sum(self.n_entries.values())
         self.n_events = sum(map(len, list(self.selections.values()))) + 1
 
         
 
         if self.verbosity_level > 0:
-            print("Found {0} file(s)".format(len(self.files)))
-            print("Found {0} tree(s)".format(len(self.trees)))
+            print("Found {0} file(s)".format(len(self.input_file_paths)))
+            print("Found {0} tree(s)".format(len(self.input_types)))
             print("Found ", self.n_events - 1, " selected events, out of a total of ", self.n_all_events)
 
         # set internal parameters
@@ -49,46 +121,60 @@ class Converter:
         self.max_n_jets = store_n_jets
         self.EFP_size = 0
         self.use_fat_jets = use_fat_jets
+        self.efp_degree = efp_degree
+        self.selection = EventSelection(selection, use_fat_jets) if selection else None
+        self.substructure = substructure
+        self.needs_constituents = substructure or efp_degree >= 0 or max_n_constituents >= 0
         
         # initialize EFP set
         if efp_degree >= 0:
             if self.verbosity_level > 0:
                 print("\n\n=======================================================")
                 print("Creating energyflow particle set with degree d <= {0}...".format(efp_degree))
-            verbose = True if self.verbosity_level>0 else False
-            self.efpset = ef.EFPSet("d<={0}".format(efp_degree), measure='hadr', beta=1.0, normed=True, verbose=verbose)
+            if efp_cache_dir is None and cache_dir is not None:
+                efp_cache_dir = os.path.join(cache_dir, "efpsets")
+            self.efpset = EFPSetCache(efp_cache_dir, self.verbosity_level).get(efp_degree)
             self.EFP_size = self.efpset.count()
             if self.verbosity_level > 0:
                 print("EFP set is size: {}".format(self.EFP_size))
                 print("=======================================================\n\n")    
-        # prepare arrays for event & jet features, EFPs and jet constituents
-
-        self.output_arrays = {
-            OutputTypes.EventFeatures: np.empty((self.n_events, len(Event.get_features_names()))),
-            OutputTypes.JetFeatures: np.empty((self.n_events, self.max_n_jets, len(Jet.get_feature_names()))),
-            OutputTypes.JetConstituents: np.empty((self.n_events, self.max_n_jets, self.max_n_constituents, len(Jet.get_constituent_feature_names()))),
-            OutputTypes.EPFs: np.empty((self.n_events, self.max_n_jets, self.EFP_size))
+        # prepare shapes of event & jet features, EFPs and jet constituents (per event)
+        self.output_shapes = {
+            OutputTypes.EventFeatures: (len(Event.get_features_names()), ),
+            OutputTypes.JetFeatures: (self.max_n_jets, len(Jet.get_feature_names())),
+            OutputTypes.JetConstituents: (self.max_n_jets, self.max_n_constituents, len(Jet.get_constituent_feature_names())),
+            OutputTypes.EPFs: (self.max_n_jets, self.EFP_size),
+            OutputTypes.EventIndex: (2, )
+        }
+        
+        # other outputs are stored as float64 (or type given in h5_layout)
+        self.output_dtypes = {
+            OutputTypes.EventIndex: np.int64
         }
+        self.output_arrays = {}
         
         self.output_names = {
             OutputTypes.EventFeatures: "event_features",
             OutputTypes.JetFeatures: "jet_features",
             OutputTypes.JetConstituents: "jet_constituents",
-            OutputTypes.EPFs: "jet_eflow_variables"
+            OutputTypes.EPFs: "jet_eflow_variables",
+            OutputTypes.EventIndex: "event_index"
         }
 
         self.output_labels = {
             OutputTypes.EventFeatures: np.string_(Event.get_features_names()),
             OutputTypes.JetFeatures: np.string_(Jet.get_feature_names()),
             OutputTypes.JetConstituents: np.string_(Jet.get_constituent_feature_names()),
-            OutputTypes.EPFs: np.string_([str(i) for i in range(self.EFP_size)])
+            OutputTypes.EPFs: np.string_([str(i) for i in range(self.EFP_size)]),
+            OutputTypes.EventIndex: np.string_(["file_id", "entry"])
         }
 
         self.save_outputs = {
             OutputTypes.EventFeatures: True,
             OutputTypes.JetFeatures: True,
             OutputTypes.JetConstituents: False if max_n_constituents < 0 else True,
-            OutputTypes.EPFs: False if efp_degree < 0 else True
+            OutputTypes.EPFs: False if efp_degree < 0 else True,
+            OutputTypes.EventIndex: True
         }
         
         
@@ -96,50 +182,62 @@ class Converter:
         """
         Reads input file with paths to ROOT files and corresponding event selections.
         """
-        self.selections = {}
-        self.input_file_paths = []
+        self.selections = Converter.read_input_list(input_path)
+        self.input_file_paths = list(self.selections.keys())
+
+    @staticmethod
+    def read_input_list(input_path):
+        """
+        Reads input file with paths to ROOT files and corresponding event selections. Returns dict with selected
+        events for each ROOT file path (a single -1 means all events).
+        """
+        selections = {}
         
         with open(input_path, 'r') as file:
             line = [lines.strip('\n') for lines in file.readlines()]
         for elements in line:
-            file_name, selections = elements.split(': ')
-            self.input_file_paths.append(file_name)
-            self.selections[file_name] = list(map(int, selections.split()))
+            file_name, file_selections = elements.split(': ')
+            selections[file_name] = Converter.parse_selection(file_selections, os.path.dirname(input_path))
+        
+        return selections
 
+    @staticmethod
+    def parse_selection(file_selections, input_directory):
+        """
+        Parses selection of a single ROOT file. It's a list of space-separated elements, each of them being:
+          - event index (-1 alone means all events),
+          - inclusive range of event indices, e.g. 100-250,
+          - path to npy file (relative to the input list) with sorted event indices or boolean mask of events.
+        """
+        selections = []
+        
+        for element in file_selections.split():
+            if element.endswith(".npy"):
+                selection = np.load(os.path.join(input_directory, element))
+                if selection.dtype == bool:
+                    selection = np.nonzero(selection)[0]
+                selections.append(np.asarray(selection, dtype=np.int64))
+            elif "-" in element[1:]:
+                first, last = element.split("-")
+                selections.append(np.arange(int(first), int(last) + 1, dtype=np.int64))
+            else:
+                selections.append(np.array([int(element)], dtype=np.int64))
+        
+        return np.concatenate(selections) if len(selections) > 0 else np.zeros(0, dtype=np.int64)
 
     def read_trees(self):
         """
-        Reads input ROOT files, extracts trees and recognizes type of the input file (Delphes/nanoAOD/PFnanoAOD/scoutingAtHlt).
-        """
-        for path, file in self.files.items():
-            print(file.keys()) 
-            for key in file.keys():
-                if key.startswith("Delphes"):
-                    self.trees[path] = file["Delphes"]
-                    self.input_types[path] = InputTypes.Delphes
-                    if self.verbosity_level > 0:
-                        print("Adding Delphes tree")
-                elif key.startswith("Events"):
-                    self.trees[path] = file[key]
-                
-                    if "JetPFCandsAK4_jetIdx" in file[key].keys() or "JetPFCandsAK8_jetIdx" in file[key].keys():
-                        self.input_types[path] = InputTypes.PFnanoAOD106X
-                    elif "FatJetPFCands_jetIdx" in file[key].keys():
-                        self.input_types[path] = InputTypes.PFnanoAOD102X
-                    elif "double_hltScoutingPFPacker_pfMetPhi_HLT2018." in file[key].keys():
-                        self.input_types[path] = InputTypes.scoutingAtHlt
-                        if self.verbosity_level > 0:
-                            print("Adding scoutingAtHlt tree: ", key)
-                    else:
-                        self.input_types[path] = InputTypes.nanoAOD
-
-                    if self.verbosity_level > 0:
-                        print("Adding nanoAOD tree: ", key)
-                else:
-                    if self.verbosity_level > 0:
-                        print("Unknown tree type: ", key, ". Skipping...")
-                
-
+        Finds trees in input ROOT files and recognizes their types (Delphes/nanoAOD/PFnanoAOD/scoutingAtHlt), with
+        numbers of entries, using the manifest of the file pool when possible.
+        """
+        for path in self.input_file_paths:
+            input_type = self.file_pool.get_input_type(path)
+            
+            if input_type is not None:
+                self.input_types[path] = input_type
+                self.n_entries[path] = self.file_pool.get_n_entries(path)
+        
+        self.file_pool.save_manifest()
 
     def set_selections_all_events(self):
         """
@@ -147,135 +245,616 @@ class Converter:
         Set selection to all events here.
         """
         for file_name in self.selections.keys():
-            if self.selections[file_name] == [-1]:
-                self.selections[file_name] = list(range(self.trees[file_name].num_entries))
+            if len(self.selections[file_name]) == 1 and self.selections[file_name][0] == -1:
+                self.selections[file_name] = np.arange(self.n_entries[file_name])
 
 
-    def convert(self):
+    def convert(self, output_file_name=None, resume=False):
         """
-        Reads all selected events from input trees and stores requested features in arrays prepared in the constructor.
+        Reads all selected events from input trees and stores requested features. If output_file_name is specified,
+        each processed chunk is appended to the output h5 file right away, so that memory usage depends on the chunk
+        size rather than the number of events. Otherwise, features are stored in output arrays (see save()).
+        If journal_chunks is set, chunks are committed to segments of the output every journal_chunks chunks (see
+        ConversionJournal) and, if resume is true, conversion continues after the last committed chunk of previous
+        run with the same inputs and options.
         """
-	        
-        total_count = 0
-        n_jets_without_constituents = 0
         
-        for file_name, tree in self.trees.items(): 
-            input_type = self.input_types[file_name]
-            data_processor = DataProcessor(tree, input_type)
+        self.prepare_outputs(output_file_name, resume)
+        
+        for i_file, (file_name, input_type) in enumerate(self.input_types.items()):
+            
+            if self.journal is not None and self.journal.is_file_done(i_file):
+                continue
+            
+            resuming_file = self.journal is not None and self.journal.is_chunk_done(i_file, 0)
 
             if self.verbosity_level > 0:
                 print("\n\n=======================================================")
                 print("Loading events from file: ", file_name)
                 print("Input type was recognised to be: ", input_type)
+            
+            # part of the file was already converted, so it's neither read from nor added to the cache
+            if self.cache is not None and not resuming_file:
+                cache_key = self.cache.get_key(file_name, self.selections[file_name], input_type,
+                                               self.get_cache_parameters())
+                cached_path = self.cache.get(cache_key)
+                
+                if cached_path is not None:
+                    self.store_cached_outputs(cached_path, file_name)
+                    self.finish_chunk(i_file, 1, True, file_name, self.n_entries[file_name])
+                    continue
+                
+                # converted events of this file will be also written to a new cache fragment
+                self.cache_writer = H5Writer(self.cache.get_temporary_path(cache_key), verbosity_level=0)
+                self.add_sections_to_writer(self.cache_writer, ragged=False)
+                n_jets_without_constituents_before = self.n_jets_without_constituents
+                cutflow_before = {cut: dict(counts) for cut, counts in self.report.cutflow.items()}
+
+            data_processor = DataProcessor(self.file_pool.get_tree(file_name), input_type, preload=False,
+                                           variables=self.get_required_variables(input_type, self.columnar),
+                                           decompression_executor=self.decompression_executor,
+                                           interpretation_executor=self.interpretation_executor)
+            
+            if self.verbosity_level > 1:
+                print("Branches to be read: ", list(data_processor.branch_names.values()))
+
+            entry_offsets = data_processor.get_entry_offsets()
+            chunks = self.get_chunks(file_name, entry_offsets)
+            
+            i_chunks = [i_chunk for i_chunk in range(len(chunks))
+                        if self.journal is None or not self.journal.is_chunk_done(i_file, i_chunk)]
+            reader = ChunkReader(data_processor, [chunks[i_chunk] for i_chunk in i_chunks], self.prefetch,
+                                 reports=[self.report])
+
+            for i_chunk, (entry_start, entry_stop, i_events) in zip(i_chunks, reader):
+                self.convert_chunk(file_name, input_type, data_processor, i_events)
+                self.finish_chunk(i_file, i_chunk + 1, i_chunk == len(chunks) - 1, file_name, entry_stop)
+                self.report.print_progress(self.n_events - 1)
+            
+            if self.cache_writer is not None:
+                self.cache_writer.set_attribute("n_jets_without_constituents",
+                                                self.n_jets_without_constituents - n_jets_without_constituents_before)
+                self.cache_writer.set_attribute("cutflow", json.dumps(
+                    [{"cut": cut, "passed": counts["passed"] - cutflow_before.get(cut, {}).get("passed", 0),
+                      "failed": counts["failed"] - cutflow_before.get(cut, {}).get("failed", 0)}
+                     for cut, counts in self.report.cutflow.items()]))
+                self.cache_writer.close()
+                self.cache.add(cache_key, self.cache_writer.output_file_name)
+                self.cache_writer = None
+
+            if self.verbosity_level > 0:
+                print("Total jets without constituents: ", self.n_jets_without_constituents)
 
-            for iEvent in self.selections[file_name]:
+            if self.verbosity_level > 1:
+                print("\n\n=======================================================")
+
+        self.finish_outputs()
+
+    @staticmethod
+    def get_executor(n_threads):
+        """
+        Returns pool of n_threads threads for reading baskets, or None (baskets are processed in the reading thread)
+        if n_threads is 0.
+        """
+        return uproot.ThreadPoolExecutor(max_workers=n_threads) if n_threads > 0 else None
+
+    def prepare_outputs(self, output_file_name=None, resume=False):
+        """
+        Prepares output arrays or output file (or journal, see convert()) before the first chunk is converted.
+        """
+        
+        self.total_count = 0
+        self.n_jets_without_constituents = 0
+        self.writer = None
+        self.cache_writer = None
+        self.journal = None
+        
+        if output_file_name is None:
+            self.output_arrays = {output_type: np.empty((self.n_events, ) + self.output_shapes[output_type],
+                                                        dtype=self.output_dtypes.get(output_type, np.float64))
+                                  for output_type in OutputTypes if self.save_outputs[output_type]}
+        elif self.journal_chunks > 0:
+            # writers of segments are opened when there is something to store
+            self.journal = ConversionJournal(output_file_name, self.get_journal_key(), resume, self.verbosity_level)
+            self.total_count = self.journal.state["n_events"]
+            self.n_jets_without_constituents = self.journal.state["n_jets_without_constituents"]
+            self.n_segment_chunks = 0
+            self.journal_position = (self.journal.state["i_file"], self.journal.state["n_file_chunks"],
+                                     self.journal.state["file"], self.journal.state["entry_stop"])
+            
+            # report of the committed part of a resumed conversion, so that the final one covers all of it
+            if self.journal.state["report"] is not None:
+                self.report.add_report(self.journal.state["report"], sequential=True)
+        else:
+            self.writer = H5Writer(output_file_name, self.verbosity_level, **self.h5_layout)
+            self.add_sections_to_writer(self.writer, self.ragged_constituents)
+
+    def convert_chunk(self, file_name, input_type, data_processor, i_events):
+        """
+        Converts selected events of a chunk of the input file loaded in the data processor and stores the outputs.
+        """
+        
+        n_events = len(i_events)
+        
+        # preselection is applied before anything else is done with the events
+        if self.selection is not None:
+            with self.report.measure("selection", count=n_events):
+                i_events = self.selection.select(data_processor, i_events, self.report)
+        
+        if self.columnar:
+            outputs = self.convert_event_batch(input_type, data_processor, i_events, self.file_ids[file_name])
+        else:
+            outputs = self.convert_events(input_type, data_processor, i_events, self.file_ids[file_name])
+        
+        self.report.n_processed_events += n_events
+        self.store_outputs(outputs)
+
+    def finish_outputs(self):
+        """
+        Closes output file (merging journaled segments) and saves the report, or trims output arrays to the number
+        of stored events, after the last chunk was converted.
+        """
+        
+        self.report.print_progress(self.n_events - 1, force=True)
+        self.report.print_unrecognized_pids()
+        self.report.print_cutflow()
+
+        if self.journal is not None:
+            # make sure that there is at least one segment, even if no events were selected
+            if self.writer is None and len(self.journal.state["segments"]) == 0:
+                self.open_segment_writer()
+            
+            if self.writer is not None:
+                self.commit_segment()
+            
+            with self.report.measure("merge", count=self.total_count):
+                self.journal.finalize(self.h5_layout, self.chunk_size)
+            
+            self.report.save(self.journal.output_file_name)
+        elif self.writer is not None:
+            self.writer.close()
+            self.report.save(self.writer.output_file_name)
+        else:
+            # remove redundant rows for events that didn't meet some criteria
+            for output_type in self.output_arrays.keys():
+                self.output_arrays[output_type] = self.output_arrays[output_type][:self.total_count]
+
+    def open_segment_writer(self):
+        """
+        Opens writer of the next segment of journaled conversion.
+        """
+        self.writer = H5Writer(self.journal.get_segment_path(), verbosity_level=0, **self.h5_layout)
+        self.add_sections_to_writer(self.writer, self.ragged_constituents)
+
+    def finish_chunk(self, i_file, n_file_chunks, is_last_chunk, file_name, entry_stop):
+        """
+        Marks chunk as done in journaled conversion and commits current segment every journal_chunks chunks.
+        n_file_chunks is the number of chunks of the input file done so far.
+        """
+        if self.journal is None:
+            return
+        
+        if is_last_chunk:
+            self.journal_position = (i_file + 1, 0, file_name, entry_stop)
+        else:
+            self.journal_position = (i_file, n_file_chunks, file_name, entry_stop)
+        
+        self.n_segment_chunks += 1
+        
+        if self.n_segment_chunks >= self.journal_chunks:
+            self.commit_segment()
+
+    def commit_segment(self):
+        """
+        Closes current segment of journaled conversion and records it in the journal.
+        """
+        self.writer.close()
+        self.journal.commit(self.writer.output_file_name, *self.journal_position, self.total_count,
+                            self.n_jets_without_constituents, self.report.to_dict())
+        self.writer = None
+        self.n_segment_chunks = 0
+
+    def get_journal_key(self):
+        """
+        Returns description of inputs and parameters of the conversion, used to check that journaled conversion is
+        resumed with the same ones.
+        """
+        description = {
+            "parameters": self.get_cache_parameters(),
+            "chunk_size": self.chunk_size,
+            "ragged_constituents": self.ragged_constituents,
+            "h5_layout": {key: str(value) for key, value in self.h5_layout.items()},
+            "files": list(self.input_types.keys()),
+            "selections": {path: hashlib.sha256(np.asarray(selection, dtype=np.int64).tobytes()).hexdigest()
+                           for path, selection in self.selections.items()},
+        }
+        
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def get_cache_parameters(self):
+        """
+        Returns converter parameters which affect the output, used to find cached conversions of input files.
+        """
+        return {
+            "jet_delta_r": self.jet_delta_r,
+            "store_n_jets": self.max_n_jets,
+            "max_n_constituents": self.max_n_constituents if self.save_outputs[OutputTypes.JetConstituents] else -1,
+            "efp_degree": self.efp_degree,
+            "use_fat_jets": self.use_fat_jets,
+            "force_delta_r_usage": self.force_delta_r_usage,
+            "columnar": self.columnar,
+            "selection": [] if self.selection is None else self.selection.expressions,
+            "substructure": self.substructure,
+        }
+
+    def store_cached_outputs(self, cached_path, file_name):
+        """
+        Stores outputs read from a cached conversion of the input file, chunk_size events at a time.
+        """
+        with h5py.File(cached_path, "r") as cached_file:
+            data = {output_type: cached_file[self.output_names[output_type]]['data']
+                    for output_type in OutputTypes if self.save_outputs[output_type]}
+            n_events = data[OutputTypes.EventFeatures].shape[0]
+            
+            for first in range(0, n_events, self.chunk_size):
+                with self.report.measure("cache", count=min(self.chunk_size, n_events - first)):
+                    outputs = {output_type: values[first:first + self.chunk_size]
+                               for output_type, values in data.items()}
+                    
+                    # id of the file in the fragment refers to the conversion which created it
+                    outputs[OutputTypes.EventIndex][:, 0] = self.file_ids[file_name]
+                    self.store_outputs(outputs)
+            
+            self.n_jets_without_constituents += int(cached_file.attrs["n_jets_without_constituents"])
+            
+            for counts in json.loads(cached_file.attrs["cutflow"]):
+                self.report.add_cut(counts["cut"], counts["passed"], counts["failed"])
+
+    def get_required_variables(self, input_type, use_event_batches):
+        """
+        Returns names of DataProcessor variables needed to produce requested outputs from given input type, so that
+        other branches (e.g. the other jet collection, PDG IDs or unused links) are never read. Constituent
+        collections are only read if EFPs, constituents or substructure jet features (ptD and axis2) are requested.
+        """
+        
+        variables = ["MET_pt", "MET_eta", "MET_phi", "Gen_weight"]
+        
+        jet_prefix = "Fat" if self.use_fat_jets else ""
+        jet_radius = "AK8" if self.use_fat_jets else "AK4"
+        variables += [jet_prefix + "Jet_" + field for field in ["eta", "phi", "pt", "mass", "flavor",
+                                                                "nCharged", "nNeutral", "chHEF"]]
+        
+        track_suffix = "_" + jet_radius if input_type == InputTypes.PFnanoAOD102X else ""
+        
+        if self.needs_constituents:
+            variables += ["Track_" + field + track_suffix for field in ["eta", "phi", "pt", "mass"]]
+            variables += [collection + "_" + field for collection in ["Neutral", "Photon"]
+                          for field in ["eta", "phi", "pt", "mass"]]
+            
+            if not self.force_delta_r_usage:
+                variables += ["Track_jet_index_" + jet_radius, "Track_cand_index_" + jet_radius]
+            elif input_type != InputTypes.Delphes:
+                # PDG IDs are needed to move photons and neutral hadrons out of tracks
+                variables.append("Track_pid" + track_suffix)
+        
+        if not use_event_batches:
+            # Event objects are built based on numbers of objects
+            variables.append("N_fat_jets" if self.use_fat_jets else "N_jets")
+            
+            if self.needs_constituents:
+                variables += ["N_tracks" + track_suffix, "N_neutral_hadrons", "N_photons"]
+            
+            if input_type == InputTypes.scoutingAtHlt:
+                variables.append("Jet_eta")
+        
+        if self.selection is not None:
+            variables += self.selection.get_required_variables()
+        
+        return variables
+
+    def get_chunks(self, file_name, entry_offsets=None):
+        """
+        Splits selected entries of the file into chunks of at most chunk_size entries. Returns list of
+        (entry_start, entry_stop, selected events) for chunks, each starting at a selected event, so that entries
+        between chunks are never read. If entry_offsets (first entries of baskets of each of the read branches) are
+        given, chunks are also split between selected events with whole baskets without selected events between
+        them, if more baskets would be skipped this way than decompressed twice (baskets of any branch containing
+        both events, which would be read by both chunks).
+        """
+        
+        selection = np.sort(np.asarray(self.selections[file_name], dtype=np.int64))
+        chunks = []
+        
+        if len(selection) == 0:
+            return chunks
+        
+        if entry_offsets is None or len(entry_offsets) == 0:
+            breaks = []
+        else:
+            n_shared_baskets = np.zeros(len(selection) - 1, dtype=np.int64)
+            n_skipped_baskets = np.zeros(len(selection) - 1, dtype=np.int64)
+            
+            for branch_offsets in entry_offsets:
+                basket_step = np.diff(np.searchsorted(branch_offsets, selection, side="right"))
+                n_shared_baskets += basket_step == 0
+                n_skipped_baskets += np.maximum(basket_step - 1, 0)
+            
+            breaks = np.nonzero(n_skipped_baskets > n_shared_baskets)[0] + 1
+        
+        for segment in np.split(selection, breaks):
+            last = 0
+            
+            while last < len(segment):
+                entry_start = int(segment[last])
+                first, last = last, np.searchsorted(segment, entry_start + self.chunk_size)
+                chunks.append((entry_start, int(segment[last - 1]) + 1, segment[first:last]))
+        
+        return chunks
+
+    def get_empty_outputs(self, n_events):
+        """
+        Returns dict with zero-initialized arrays for all requested outputs, for given number of events.
+        """
+        return {output_type: np.zeros((n_events, ) + self.output_shapes[output_type],
+                                      dtype=self.output_dtypes.get(output_type, np.float64))
+                for output_type in OutputTypes if self.save_outputs[output_type]}
+
+    def store_outputs(self, outputs):
+        """
+        Appends outputs of a processed chunk to the output file or to the output arrays (and to the cache fragment
+        of the current input file, if it's being written).
+        """
+        
+        n_events = len(outputs[OutputTypes.EventFeatures])
+        
+        if self.journal is not None and self.writer is None:
+            self.open_segment_writer()
+        
+        with self.report.measure("write", count=n_events):
+            for output_type, data in outputs.items():
+                if self.writer is not None:
+                    self.append_to_writer(self.writer, output_type, data, self.ragged_constituents)
+                else:
+                    self.output_arrays[output_type][self.total_count:self.total_count + n_events] = data
+                
+                if self.cache_writer is not None:
+                    self.append_to_writer(self.cache_writer, output_type, data, ragged=False)
+        
+        self.total_count += n_events
+        self.report.n_stored_events = self.total_count
+        self.report.n_jets_without_constituents = self.n_jets_without_constituents
+
+    def convert_events(self, input_type, data_processor, i_events, file_id=0):
+        """
+        Builds Event object for each selected event of the chunk and returns their features in a dict of arrays.
+        """
+        
+        outputs = self.get_empty_outputs(len(i_events))
+        n_stored = 0
+        
+        # constituents of stored jets and their (event, jet) positions, for the EFP calculation
+        EFP_inputs = []
+        EFP_positions = []
+        
+        for iEvent in i_events:
+            with self.report.measure("build", count=1):
                 if self.verbosity_level > 1:
                     print("\n\n------------------------------")
                     print("Event: ", iEvent)
-
-                if self.verbosity_level > 0 and total_count%100==0:
-                    print("Processed events:", total_count, "\tcurrent event number: ", iEvent)
-                    print("Jets without constituents so far: ", n_jets_without_constituents)
                 
                 # load event
+                # only leading jets which are stored are loaded, and rejected events are not loaded at all
                 event = Event(input_type, data_processor, iEvent, self.jet_delta_r, self.use_fat_jets,
-                              self.verbosity_level, self.force_delta_r_usage)
+                              self.verbosity_level, self.force_delta_r_usage, self.report, self.max_n_jets,
+                              self.needs_constituents)
 
                 if self.verbosity_level > 1:
                     event.print()
                 
                 # check event properties
-                if event.nJets < 2:
-                    if self.verbosity_level > 0:
-                        print("WARNING -- event has less than 2 jets! Skipping...")
+                if event.rejection_reason == "less_than_two_jets":
+                    self.report.add_skipped_events("less_than_two_jets")
                     if self.verbosity_level > 1:
+                        print("WARNING -- event has less than 2 jets! Skipping...")
                         print("------------------------------\n\n")
                     continue
-    
-                if not event.are_jets_ordered_by_pt():
-                    if self.verbosity_level > 0:
+
+                if event.rejection_reason == "jets_not_ordered_by_pt":
+                    self.report.add_skipped_events("jets_not_ordered_by_pt")
+                    if self.verbosity_level > 1:
                         print("WARNING -- jets in the event are not ordered by pt! Skipping...")
                     continue
                 
+                self.report.add_unrecognized_pids(event.unrecognized_pids)
+                
                 # fill feature arrays
-                self.output_arrays[OutputTypes.EventFeatures][total_count, :] = np.asarray(event.get_features())
+                outputs[OutputTypes.EventFeatures][n_stored, :] = np.asarray(event.get_features())
+                outputs[OutputTypes.EventIndex][n_stored, :] = (file_id, iEvent)
 
                 for iJet, jet in enumerate(event.jets):
                     if iJet == self.max_n_jets:
                         break
                     
-                    if len(jet.constituents)==0:
-                        if self.verbosity_level > 0:
+                    if self.needs_constituents and len(jet.constituents)==0:
+                        self.n_jets_without_constituents += 1
+                        if self.verbosity_level > 1:
                             print("Jet has no constituents! Skipping...")
-                            n_jets_without_constituents += 1
                         continue
                     
-                    self.output_arrays[OutputTypes.JetFeatures][total_count, iJet, :] = jet.get_features()
+                    outputs[OutputTypes.JetFeatures][n_stored, iJet, :] = jet.get_features(self.substructure)
 
                     if self.save_outputs[OutputTypes.JetConstituents]:
-                        self.output_arrays[OutputTypes.JetConstituents][total_count, iJet, :] = jet.get_constituents(self.max_n_constituents)
+                        outputs[OutputTypes.JetConstituents][n_stored, iJet, :] = jet.get_constituents(self.max_n_constituents)
 
                     if self.save_outputs[OutputTypes.EPFs]:
-                        self.output_arrays[OutputTypes.EPFs][total_count, iJet, :] = jet.get_EFPs(self.efpset)
-                        
+                        EFP_inputs.append(jet.get_EFP_inputs())
+                        EFP_positions.append((n_stored, iJet))
                 
                 if self.verbosity_level > 1:
                     print("------------------------------\n\n")
 
-                total_count += 1
-
-            if self.verbosity_level > 0:
-                print("Total jets without constituents: ", n_jets_without_constituents)
+                n_stored += 1
+        
+        if len(EFP_inputs) > 0:
+            with self.report.measure("efp", count=len(EFP_inputs)):
+                i_stored, i_jets = np.asarray(EFP_positions).T
+                outputs[OutputTypes.EPFs][i_stored, i_jets, :] = self.efpset.batch_compute(EFP_inputs,
+                                                                                           self.efp_n_jobs)
+        
+        return {output_type: data[:n_stored] for output_type, data in outputs.items()}
 
-            if self.verbosity_level > 1:
-                print("\n\n=======================================================")
+    def convert_event_batch(self, input_type, data_processor, i_events, file_id=0):
+        """
+        Processes all selected events of the chunk at once with EventBatch and returns their features in a dict
+        of arrays. Jets without constituents and missing jets are stored as zeros.
+        """
+        
+        with self.report.measure("build", count=len(i_events)):
+            batch = EventBatch(input_type, data_processor, i_events, self.jet_delta_r, self.max_n_jets,
+                               self.use_fat_jets, self.verbosity_level, self.force_delta_r_usage, self.report,
+                               self.needs_constituents)
+            
+            outputs = {
+                OutputTypes.EventFeatures: batch.get_features(),
+                OutputTypes.JetFeatures: batch.get_jet_features(self.substructure),
+                OutputTypes.EventIndex: np.stack((np.full(batch.n_events, file_id), batch.i_events),
+                                                 axis=1).astype(np.int64),
+            }
+            
+            if self.save_outputs[OutputTypes.JetConstituents]:
+                outputs[OutputTypes.JetConstituents] = batch.get_constituents(self.max_n_constituents)
+        
+        if self.save_outputs[OutputTypes.EPFs]:
+            with self.report.measure("efp", count=len(batch.jet_event) - batch.n_jets_without_constituents):
+                outputs[OutputTypes.EPFs] = batch.get_EFPs(self.efpset, self.efp_n_jobs)
+        
+        self.n_jets_without_constituents += batch.n_jets_without_constituents
+        self.report.add_unrecognized_pids(batch.unrecognized_pids)
+        self.report.add_skipped_events("less_than_two_jets", batch.n_events_with_less_than_two_jets)
+        self.report.add_skipped_events("jets_not_ordered_by_pt", batch.n_events_with_unordered_jets)
+        
+        return outputs
 
-        # remove redundant rows for events that didn't meet some criteria
+    def add_sections_to_writer(self, writer, ragged=False):
+        """
+        Adds sections with proper names, labels and shapes for all requested output types (could be event features,
+        jet features, jet constituents etc.) to the h5 writer. If ragged is set, jet constituents section contains
+        a flat table of constituents ('data'), with 'offsets' and 'counts' of constituents for each jet. Event index
+        contains id of the input file and entry number of each event ('data'), its 'event_id' (row in the output)
+        and paths of input files in 'files' attribute.
+        """
         for output_type in OutputTypes:
-            for i in range(0, self.n_events - total_count):
-                self.output_arrays[output_type] = np.delete(self.output_arrays[output_type], -1, axis=0)
+            if not self.save_outputs[output_type]:
+                continue
             
-    def add_section_to_h5_file(self, file, output_type):
+            name = self.output_names[output_type]
+            
+            if ragged and output_type == OutputTypes.JetConstituents:
+                writer.add_section(name, self.output_labels[output_type], self.output_shapes[output_type][2:])
+                writer.add_dataset(name, 'offsets', (self.max_n_jets, ), np.int64, offsets_of='data')
+                writer.add_dataset(name, 'counts', (self.max_n_jets, ), np.int64)
+                writer.set_attribute('max_n_constituents', self.max_n_constituents, section=name)
+            elif output_type == OutputTypes.EventIndex:
+                # event id is the row of the event in the output, so it's shifted when outputs are merged
+                writer.add_section(name, self.output_labels[output_type], self.output_shapes[output_type], np.int64)
+                writer.add_dataset(name, 'event_id', (), np.int64, offsets_of='data')
+                writer.set_attribute('files', np.string_(self.file_table), section=name)
+            else:
+                writer.add_section(name, self.output_labels[output_type], self.output_shapes[output_type])
+
+    def append_to_writer(self, writer, output_type, data, ragged=False):
         """
-        Adds section with proper name, labels and data to the h5 file, given the output type requested (could be
-        event features, jet features, jet constituents etc.)
+        Appends data of given output type to the h5 writer, converting padded jet constituents to the ragged format
+        if needed.
         """
-        if not self.save_outputs[output_type]:
-            return
+        name = self.output_names[output_type]
         
-        features = file.create_group(self.output_names[output_type])
-        features.create_dataset('data', data=self.output_arrays[output_type])
-        features.create_dataset('labels', data=self.output_labels[output_type])
+        if ragged and output_type == OutputTypes.JetConstituents:
+            constituents, counts = Converter.to_ragged(data)
+            offsets = writer.get_n_rows(name) + np.cumsum(counts).reshape(counts.shape) - counts
+            
+            writer.append(name, constituents)
+            writer.append(name, offsets, 'offsets')
+            writer.append(name, counts, 'counts')
+        elif output_type == OutputTypes.EventIndex:
+            event_ids = writer.get_n_rows(name) + np.arange(len(data), dtype=np.int64)
+            
+            writer.append(name, data)
+            writer.append(name, event_ids, 'event_id')
+        else:
+            writer.append(name, data)
 
-    def save(self, output_file_name):
+    @staticmethod
+    def to_ragged(constituents):
         """
-        Creates output h5 file, populates it with data stored in features array and saves it to the disk.
+        Converts array of constituents of shape (n_events, n_jets, max_n_constituents, n_features), padded with
+        zeros, to a flat table of constituents (ordered by event, jet and constituent) and array with number of
+        constituents of each jet.
         """
         
-        # make sure that the output directory exists and that the file name ends with h5
-        path_directory = os.path.dirname(output_file_name)
-    
-        if not os.path.exists(path_directory) and path_directory is not None and path_directory != '':
-            os.mkdir(path_directory)
+        is_filled = np.any(constituents != 0, axis=3)
+        max_n_constituents = constituents.shape[2]
         
-        if not output_file_name.endswith(".h5"):
-            output_file_name += ".h5"
-
-        if self.verbosity_level > 0:
-            print("\n\n=======================================================")
-            print("Saving h5 data to file: ", output_file_name)
+        # padding is always at the end, so the count is given by the last filled entry
+        counts = np.where(np.any(is_filled, axis=2), max_n_constituents - np.argmax(is_filled[:, :, ::-1], axis=2), 0)
+        kept = np.arange(max_n_constituents) < counts[:, :, np.newaxis]
+        
+        return constituents[kept], counts.astype(np.int64)
 
-        # create output file
-        file = h5py.File(output_file_name, "w")
+    def save(self, output_file_name, output_format="h5"):
+        """
+        Creates output h5 file, populates it with data stored in output arrays and saves it to the disk. If
+        output_format is "parquet", a Parquet dataset with tables of events and jets is written instead (see
+        ParquetWriter).
+        """
+        
+        if output_format == "parquet":
+            self.save_parquet(output_file_name)
+            return
+        
+        writer = H5Writer(output_file_name, self.verbosity_level, **self.h5_layout)
+        self.add_sections_to_writer(writer, self.ragged_constituents)
 
-        # add feature arrays to the output file
-        for output_type in OutputTypes:
-            self.add_section_to_h5_file(file, output_type)
+        with self.report.measure("write", count=self.total_count):
+            for output_type, data in self.output_arrays.items():
+                self.append_to_writer(writer, output_type, data, self.ragged_constituents)
         
-        # save the file
-        file.close()
+        writer.close()
+        self.report.save(writer.output_file_name)
 
-        if self.verbosity_level > 0:
-            print("Successfully saved!")
-            print("=======================================================\n\n")
+    def save_parquet(self, output_path):
+        """
+        Saves data stored in output arrays as Parquet tables of events and jets, with dtype, compression and number
+        of events per row group taken from h5_layout.
+        """
+        
+        compression = {None: None, "gzip": "gzip", "lzf": "snappy"}[self.h5_layout.get("compression")]
+        compression_level = self.h5_layout.get("compression_level") if compression == "gzip" else None
+        
+        writer = ParquetWriter(output_path,
+                               event_labels=self.output_labels[OutputTypes.EventFeatures],
+                               jet_labels=self.output_labels[OutputTypes.JetFeatures],
+                               efp_labels=self.output_labels[OutputTypes.EPFs]
+                               if self.save_outputs[OutputTypes.EPFs] else None,
+                               constituent_labels=self.output_labels[OutputTypes.JetConstituents]
+                               if self.save_outputs[OutputTypes.JetConstituents] else None,
+                               verbosity_level=self.verbosity_level,
+                               dtype=self.h5_layout.get("dtype"),
+                               compression=compression,
+                               compression_level=compression_level,
+                               row_group_events=self.h5_layout.get("chunk_events"),
+                               files=self.file_table)
+        
+        with self.report.measure("write", count=self.total_count):
+            constituents, counts = None, None
+            
+            if OutputTypes.JetConstituents in self.output_arrays:
+                constituents, counts = Converter.to_ragged(self.output_arrays[OutputTypes.JetConstituents])
+            
+            writer.append(self.output_arrays[OutputTypes.EventFeatures], self.output_arrays[OutputTypes.JetFeatures],
+                          efps=self.output_arrays.get(OutputTypes.EPFs),
+                          constituents=constituents, constituent_counts=counts,
+                          event_index=self.output_arrays[OutputTypes.EventIndex])
+            writer.close()
         
+        self.report.save(writer.output_path)
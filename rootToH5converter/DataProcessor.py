@@ -1,3 +1,5 @@
+import copy
+import numpy as np
 from enum import Enum
 
 
@@ -9,195 +11,258 @@ class InputTypes(Enum):
     scoutingAtHlt = 4
 
 class DataProcessor:
-    def __init__(self, tree, input_type):
+    # names of branches in the tree for variables used by the converter, for each input type
+    variables = {
+        InputTypes.Delphes: {
+            # number of objects
+            "N_jets": "Jet_size",
+            "N_fat_jets": "FatJet_size",
+            "N_tracks": "EFlowTrack_size",
+            "N_neutral_hadrons": "EFlowNeutralHadron_size",
+            "N_photons": "Photon_size",
+            # event features
+            "MET_pt": "MissingET/MissingET.MET",
+            "MET_eta": "MissingET/MissingET.Eta",
+            "MET_phi": "MissingET/MissingET.Phi",
+            # jet features
+            "Jet_eta": "Jet/Jet.Eta",
+            "Jet_phi": "Jet/Jet.Phi",
+            "Jet_pt": "Jet/Jet.PT",
+            "Jet_mass": "Jet/Jet.Mass",
+            "Jet_nCharged": "Jet/Jet.NCharged",
+            "Jet_nNeutral": "Jet/Jet.NNeutrals",
+            "Jet_flavor": "Jet/Jet.Flavor",
+            # fat jet features
+            "FatJet_eta": "FatJet/FatJet.Eta",
+            "FatJet_phi": "FatJet/FatJet.Phi",
+            "FatJet_pt": "FatJet/FatJet.PT",
+            "FatJet_mass": "FatJet/FatJet.Mass",
+            "FatJet_nCharged": "FatJet/FatJet.NCharged",
+            "FatJet_nNeutral": "FatJet/FatJet.NNeutrals",
+            "FatJet_flavor": "FatJet/FatJet.Flavor",
+            # tracks
+            "Track_eta": "EFlowTrack/EFlowTrack.Eta",
+            "Track_phi": "EFlowTrack/EFlowTrack.Phi",
+            "Track_pt": "EFlowTrack/EFlowTrack.PT",
+            # neutral hadrons
+            "Neutral_eta": "EFlowNeutralHadron/EFlowNeutralHadron.Eta",
+            "Neutral_phi": "EFlowNeutralHadron/EFlowNeutralHadron.Phi",
+            "Neutral_pt": "EFlowNeutralHadron/EFlowNeutralHadron.ET",
+            # photons
+            "Photon_eta": "Photon/Photon.Eta",
+            "Photon_phi": "Photon/Photon.Phi",
+            "Photon_pt": "Photon/Photon.PT",
+        },
+        InputTypes.nanoAOD: {
+            # number of objects
+            "N_jets": "nJet",
+            "N_fat_jets": "nFatJet",
+            "N_photons": "nPhoton",
+            # event features
+            "MET_pt": "MET_pt",
+            "MET_phi": "MET_phi",
+            "Gen_weight": "genWeight",
+            # jet features
+            "Jet_eta": "Jet_eta",
+            "Jet_phi": "Jet_phi",
+            "Jet_pt": "Jet_pt",
+            "Jet_mass": "Jet_mass",
+            "Jet_chHEF": "Jet_chHEF",
+            "Jet_neHEF": "Jet_neHEF",
+            # photons
+            "Photon_eta": "Photon_eta",
+            "Photon_phi": "Photon_phi",
+            "Photon_pt": "Photon_pt",
+            "Photon_mass": "Photon_mass",
+        },
+        InputTypes.PFnanoAOD102X: {
+            # number of objects
+            "N_jets": "nJet",
+            "N_fat_jets": "nFatJet",
+            "N_tracks_AK4": "nJetPFCands",
+            "N_tracks_AK8": "nFatJetPFCands",
+            "N_photons": "nPhoton",
+            # event features
+            "MET_pt": "MET_pt",
+            "MET_phi": "MET_phi",
+            "Gen_weight": "genWeight",
+            # jet features
+            "Jet_eta": "Jet_eta",
+            "Jet_phi": "Jet_phi",
+            "Jet_pt": "Jet_pt",
+            "Jet_mass": "Jet_mass",
+            "Jet_chHEF": "Jet_chHEF",
+            "Jet_neHEF": "Jet_neHEF",
+            # fat jet features
+            "FatJet_eta": "FatJet_eta",
+            "FatJet_phi": "FatJet_phi",
+            "FatJet_pt": "FatJet_pt",
+            "FatJet_mass": "FatJet_mass",
+            # tracks for jets
+            "Track_eta_AK4": "JetPFCands_eta",
+            "Track_phi_AK4": "JetPFCands_phi",
+            "Track_pt_AK4": "JetPFCands_pt",
+            "Track_mass_AK4": "JetPFCands_mass",
+            "Track_jet_index_AK4": "JetPFCands_jetIdx",
+            "Track_pid_AK4": "JetPFCands_pdgId",
+            # tracks for fat jets
+            "Track_eta_AK8": "FatJetPFCands_eta",
+            "Track_phi_AK8": "FatJetPFCands_phi",
+            "Track_pt_AK8": "FatJetPFCands_pt",
+            "Track_mass_AK8": "FatJetPFCands_mass",
+            "Track_jet_index_AK8": "FatJetPFCands_jetIdx",
+            "Track_pid_AK8": "FatJetPFCands_pdgId",
+            # photons
+            "Photon_eta": "Photon_eta",
+            "Photon_phi": "Photon_phi",
+            "Photon_pt": "Photon_pt",
+            "Photon_mass": "Photon_mass",
+        },
+        InputTypes.PFnanoAOD106X: {
+            # number of objects
+            "N_jets": "nJet",
+            "N_fat_jets": "nFatJet",
+            "N_tracks": "nJetPFCands",
+            "N_photons": "nPhoton",
+            # event features
+            "MET_pt": "MET_pt",
+            "MET_phi": "MET_phi",
+            "Gen_weight": "genWeight",
+            # jet features
+            "Jet_eta": "Jet_eta",
+            "Jet_phi": "Jet_phi",
+            "Jet_pt": "Jet_pt",
+            "Jet_mass": "Jet_mass",
+            "Jet_chHEF": "Jet_chHEF",
+            "Jet_neHEF": "Jet_neHEF",
+            # fat jet features
+            "FatJet_eta": "FatJet_eta",
+            "FatJet_phi": "FatJet_phi",
+            "FatJet_pt": "FatJet_pt",
+            "FatJet_mass": "FatJet_mass",
+            # tracks
+            "Track_eta": "JetPFCands_eta",
+            "Track_phi": "JetPFCands_phi",
+            "Track_pt": "JetPFCands_pt",
+            "Track_mass": "JetPFCands_mass",
+            "Track_jet_index_AK4": "JetPFCandsAK4_jetIdx",
+            "Track_cand_index_AK4": "JetPFCandsAK4_candIdx",
+            "Track_jet_index_AK8": "JetPFCandsAK8_jetIdx",
+            "Track_cand_index_AK8": "JetPFCandsAK8_candIdx",
+            "Track_pid": "JetPFCands_pdgId",
+            # photons
+            "Photon_eta": "Photon_eta",
+            "Photon_phi": "Photon_phi",
+            "Photon_pt": "Photon_pt",
+            "Photon_mass": "Photon_mass",
+        },
+        InputTypes.scoutingAtHlt:{
+            # number of objects
+            #"N_jets": "Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018./Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj.pt_",
+            #"N_tracks": "Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018./Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018.obj.pt_",
+            #"N_photons": "Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018./Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018.obj.pt_",
+            # event features
+            "MET_pt": "double_hltScoutingPFPacker_pfMetPt_HLT2018./double_hltScoutingPFPacker_pfMetPt_HLT2018.obj",
+            "MET_phi": "double_hltScoutingPFPacker_pfMetPhi_HLT2018./double_hltScoutingPFPacker_pfMetPhi_HLT2018.obj",
+            # jet features
+            "Jet_eta": "Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018./Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj/Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj.eta_",
+            "Jet_phi": "Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018./Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj/Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj.phi_",
+            "Jet_pt": "Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018./Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj/Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj.pt_",
+            "Jet_mass": "Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018./Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj/Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj.m_",
+            "Jet_nCharged": "Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018./Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj/Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj.chargedHadronMultiplicity_",# ! only take hadrons into account !
+            "Jet_nNeutral": "Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018./Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj/Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj.neutralHadronMultiplicity_",# ! only take hadrons into account !
+            # tracks
+            "Track_eta": "Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018./Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018.obj/Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018.obj.tk_eta_",
+            "Track_phi": "Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018./Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018.obj/Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018.obj.tk_phi_",
+            "Track_pt": "Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018./Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018.obj/Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018.obj.tk_pt_",
+            # photons
+            "Photon_eta": "Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018./Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018.obj/Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018.obj.eta_",
+            "Photon_phi": "Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018./Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018.obj/Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018.obj.phi_",
+            "Photon_pt": "Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018./Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018.obj/Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018.obj.pt_",     
+        }
+    }
+
+    def __init__(self, tree, input_type, preload=True, variables=None, decompression_executor=None,
+                 interpretation_executor=None):
         """
         Creates DataProcessor objects which knows names of branches for different input types.
-        Pre-loads all branches for later use.
+        Pre-loads all branches for later use, unless preload is False (then entries have to be loaded
+        chunk by chunk with load_entries). If variables are specified, only branches of those variables
+        are read, other variables are treated as not available in the tree. Baskets are decompressed and
+        interpreted by given executors (e.g. uproot.ThreadPoolExecutor), by default in the calling thread.
         """
         
         if input_type not in InputTypes:
             print("\n\nERROR -- DataProcessor: unknown input type: ", input_type, "\n\n")
             exit(0)
         
-        self.variables = {
-            InputTypes.Delphes: {
-                # number of objects
-                "N_jets": "Jet_size",
-                "N_fat_jets": "FatJet_size",
-                "N_tracks": "EFlowTrack_size",
-                "N_neutral_hadrons": "EFlowNeutralHadron_size",
-                "N_photons": "Photon_size",
-                # event features
-                "MET_pt": "MissingET/MissingET.MET",
-                "MET_eta": "MissingET/MissingET.Eta",
-                "MET_phi": "MissingET/MissingET.Phi",
-                # jet features
-                "Jet_eta": "Jet/Jet.Eta",
-                "Jet_phi": "Jet/Jet.Phi",
-                "Jet_pt": "Jet/Jet.PT",
-                "Jet_mass": "Jet/Jet.Mass",
-                "Jet_nCharged": "Jet/Jet.NCharged",
-                "Jet_nNeutral": "Jet/Jet.NNeutrals",
-                "Jet_flavor": "Jet/Jet.Flavor",
-                # fat jet features
-                "FatJet_eta": "FatJet/FatJet.Eta",
-                "FatJet_phi": "FatJet/FatJet.Phi",
-                "FatJet_pt": "FatJet/FatJet.PT",
-                "FatJet_mass": "FatJet/FatJet.Mass",
-                "FatJet_nCharged": "FatJet/FatJet.NCharged",
-                "FatJet_nNeutral": "FatJet/FatJet.NNeutrals",
-                "FatJet_flavor": "FatJet/FatJet.Flavor",
-                # tracks
-                "Track_eta": "EFlowTrack/EFlowTrack.Eta",
-                "Track_phi": "EFlowTrack/EFlowTrack.Phi",
-                "Track_pt": "EFlowTrack/EFlowTrack.PT",
-                # neutral hadrons
-                "Neutral_eta": "EFlowNeutralHadron/EFlowNeutralHadron.Eta",
-                "Neutral_phi": "EFlowNeutralHadron/EFlowNeutralHadron.Phi",
-                "Neutral_pt": "EFlowNeutralHadron/EFlowNeutralHadron.ET",
-                # photons
-                "Photon_eta": "Photon/Photon.Eta",
-                "Photon_phi": "Photon/Photon.Phi",
-                "Photon_pt": "Photon/Photon.PT",
-            },
-            InputTypes.nanoAOD: {
-                # number of objects
-                "N_jets": "nJet",
-                "N_fat_jets": "nFatJet",
-                "N_photons": "nPhoton",
-                # event features
-                "MET_pt": "MET_pt",
-                "MET_phi": "MET_phi",
-                "Gen_weight": "genWeight",
-                # jet features
-                "Jet_eta": "Jet_eta",
-                "Jet_phi": "Jet_phi",
-                "Jet_pt": "Jet_pt",
-                "Jet_mass": "Jet_mass",
-                "Jet_chHEF": "Jet_chHEF",
-                "Jet_neHEF": "Jet_neHEF",
-                # photons
-                "Photon_eta": "Photon_eta",
-                "Photon_phi": "Photon_phi",
-                "Photon_pt": "Photon_pt",
-                "Photon_mass": "Photon_mass",
-            },
-            InputTypes.PFnanoAOD102X: {
-                # number of objects
-                "N_jets": "nJet",
-                "N_fat_jets": "nFatJet",
-                "N_tracks_AK4": "nJetPFCands",
-                "N_tracks_AK8": "nFatJetPFCands",
-                "N_photons": "nPhoton",
-                # event features
-                "MET_pt": "MET_pt",
-                "MET_phi": "MET_phi",
-                "Gen_weight": "genWeight",
-                # jet features
-                "Jet_eta": "Jet_eta",
-                "Jet_phi": "Jet_phi",
-                "Jet_pt": "Jet_pt",
-                "Jet_mass": "Jet_mass",
-                "Jet_chHEF": "Jet_chHEF",
-                "Jet_neHEF": "Jet_neHEF",
-                # fat jet features
-                "FatJet_eta": "FatJet_eta",
-                "FatJet_phi": "FatJet_phi",
-                "FatJet_pt": "FatJet_pt",
-                "FatJet_mass": "FatJet_mass",
-                # tracks for jets
-                "Track_eta_AK4": "JetPFCands_eta",
-                "Track_phi_AK4": "JetPFCands_phi",
-                "Track_pt_AK4": "JetPFCands_pt",
-                "Track_mass_AK4": "JetPFCands_mass",
-                "Track_jet_index_AK4": "JetPFCands_jetIdx",
-                "Track_pid_AK4": "JetPFCands_pdgId",
-                # tracks for fat jets
-                "Track_eta_AK8": "FatJetPFCands_eta",
-                "Track_phi_AK8": "FatJetPFCands_phi",
-                "Track_pt_AK8": "FatJetPFCands_pt",
-                "Track_mass_AK8": "FatJetPFCands_mass",
-                "Track_jet_index_AK8": "FatJetPFCands_jetIdx",
-                "Track_pid_AK8": "FatJetPFCands_pdgId",
-                # photons
-                "Photon_eta": "Photon_eta",
-                "Photon_phi": "Photon_phi",
-                "Photon_pt": "Photon_pt",
-                "Photon_mass": "Photon_mass",
-            },
-            InputTypes.PFnanoAOD106X: {
-                # number of objects
-                "N_jets": "nJet",
-                "N_fat_jets": "nFatJet",
-                "N_tracks": "nJetPFCands",
-                "N_photons": "nPhoton",
-                # event features
-                "MET_pt": "MET_pt",
-                "MET_phi": "MET_phi",
-                "Gen_weight": "genWeight",
-                # jet features
-                "Jet_eta": "Jet_eta",
-                "Jet_phi": "Jet_phi",
-                "Jet_pt": "Jet_pt",
-                "Jet_mass": "Jet_mass",
-                "Jet_chHEF": "Jet_chHEF",
-                "Jet_neHEF": "Jet_neHEF",
-                # fat jet features
-                "FatJet_eta": "FatJet_eta",
-                "FatJet_phi": "FatJet_phi",
-                "FatJet_pt": "FatJet_pt",
-                "FatJet_mass": "FatJet_mass",
-                # tracks
-                "Track_eta": "JetPFCands_eta",
-                "Track_phi": "JetPFCands_phi",
-                "Track_pt": "JetPFCands_pt",
-                "Track_mass": "JetPFCands_mass",
-                "Track_jet_index_AK4": "JetPFCandsAK4_jetIdx",
-                "Track_cand_index_AK4": "JetPFCandsAK4_candIdx",
-                "Track_jet_index_AK8": "JetPFCandsAK8_jetIdx",
-                "Track_cand_index_AK8": "JetPFCandsAK8_candIdx",
-                "Track_pid": "JetPFCands_pdgId",
-                # photons
-                "Photon_eta": "Photon_eta",
-                "Photon_phi": "Photon_phi",
-                "Photon_pt": "Photon_pt",
-                "Photon_mass": "Photon_mass",
-            },
-	    InputTypes.scoutingAtHlt:{
-                # number of objects
-                #"N_jets": "Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018./Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj.pt_",
-                #"N_tracks": "Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018./Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018.obj.pt_",
-                #"N_photons": "Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018./Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018.obj.pt_",
-                # event features
-                "MET_pt": "double_hltScoutingPFPacker_pfMetPt_HLT2018./double_hltScoutingPFPacker_pfMetPt_HLT2018.obj",
-                "MET_phi": "double_hltScoutingPFPacker_pfMetPhi_HLT2018./double_hltScoutingPFPacker_pfMetPhi_HLT2018.obj",
-                # jet features
-                "Jet_eta": "Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018./Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj/Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj.eta_",
-                "Jet_phi": "Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018./Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj/Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj.phi_",
-                "Jet_pt": "Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018./Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj/Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj.pt_",
-                "Jet_mass": "Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018./Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj/Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj.m_",
-                "Jet_nCharged": "Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018./Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj/Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj.chargedHadronMultiplicity_",# ! only take hadrons into account !
-                "Jet_nNeutral": "Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018./Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj/Run3ScoutingPFJets_hltScoutingPFPacker__HLT2018.obj.neutralHadronMultiplicity_",# ! only take hadrons into account !
-                # tracks
-                "Track_eta": "Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018./Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018.obj/Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018.obj.tk_eta_",
-                "Track_phi": "Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018./Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018.obj/Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018.obj.tk_phi_",
-                "Track_pt": "Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018./Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018.obj/Run3ScoutingTracks_hltScoutingTrackPacker__HLT2018.obj.tk_pt_",
-                # photons
-                "Photon_eta": "Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018./Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018.obj/Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018.obj.eta_",
-                "Photon_phi": "Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018./Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018.obj/Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018.obj.phi_",
-                "Photon_pt": "Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018./Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018.obj/Run3ScoutingPhotons_hltScoutingEgammaPacker__HLT2018.obj.pt_",	
-	    }
-        }
+        # find branches available in this tree
+        self.tree = tree
+        self.branch_names = {}
+        self.decompression_executor = decompression_executor
+        self.interpretation_executor = interpretation_executor
+        
+        for key, value in self.variables[input_type].items():
+            if variables is not None and key not in variables:
+                continue
+            if value in tree.keys():
+                self.branch_names[key] = value
         
         # pre-load all branches for this tree to avoid calling this for every event/track/jet
         self.branches = {}
+        self.entry_start = 0
         
-        print("Keys found in the tree:", tree.keys())
-         
-        for key, value in self.variables[input_type].items():
-            if value in tree.keys():
-                self.branches[key] = tree[value].array()
+        if preload:
+            self.load_entries(0, tree.num_entries)
+        
+    def load_entries(self, entry_start, entry_stop):
+        """
+        Loads all branches for entries in range [entry_start, entry_stop), replacing previously loaded ones.
+        Event indices passed to other methods are still global entry numbers in the tree.
+        """
+        self.set_entries(entry_start, self.read_entries(entry_start, entry_stop))
+    
+    def read_entries(self, entry_start, entry_stop):
+        """
+        Reads all branches for entries in range [entry_start, entry_stop) and returns them in a dict, without
+        replacing loaded ones (so that the next chunk can be read while the current one is used).
+        """
+        branches = {}
         
+        for key, value in self.branch_names.items():
+            branches[key] = self.tree[value].array(entry_start=entry_start, entry_stop=entry_stop,
+                                                   decompression_executor=self.decompression_executor,
+                                                   interpretation_executor=self.interpretation_executor)
+        
+        return branches
+    
+    def set_entries(self, entry_start, branches):
+        """
+        Replaces loaded branches with the ones returned by read_entries for entries starting at entry_start.
+        """
+        self.entry_start = entry_start
+        self.branches = branches
+        
+    def get_view(self, variables):
+        """
+        Returns DataProcessor sharing branches loaded by this one, but limited to given variables, so that the
+        same entries can be used by a few consumers which need different variables, without reading them again.
+        Entries loaded later with load_entries are not seen by the view.
+        """
+        view = copy.copy(self)
+        view.branch_names = {key: value for key, value in self.branch_names.items() if key in variables}
+        view.branches = {key: value for key, value in self.branches.items() if key in variables}
+
+        return view
+
+    def get_entry_offsets(self):
+        """
+        Returns list with first entries of baskets (and the number of entries at the end) for each of the branches
+        to be loaded. Baskets of different branches are rarely aligned, so they are kept separately, see
+        Converter.get_chunks.
+        """
+        return [np.asarray(self.tree[value].entry_offsets) for value in sorted(set(self.branch_names.values()))]
+
     def get_value_from_tree(self, variable, i_event=None, i_entry=None):
         """
         Returns value of given variable for given event. If event contains an array of such variable (e.g. jets pt),
@@ -207,10 +272,26 @@ class DataProcessor:
             return None
         
         if i_entry is None:
-            return self.branches[variable][i_event]
+            return self.branches[variable][i_event - self.entry_start]
         else:
-            return self.branches[variable][i_event][i_entry]
+            return self.branches[variable][i_event - self.entry_start][i_entry]
         
+    def get_values_for_events(self, variable, i_events):
+        """
+        Returns values of given variable for all events in i_events (numpy array of event indices), or None if the
+        variable is not available in the tree.
+        """
+        if variable not in self.branches.keys():
+            return None
+
+        return self.branches[variable][i_events - self.entry_start]
+
+    def has_variable(self, variable):
+        """
+        Checks if given variable was found in the tree.
+        """
+        return variable in self.branches.keys()
+
     def get_array_n_dimensions(self, variable):
         """
         Returns number of dimensions of the tree leaf for given variable (1 is a number, 2 is a vector etc.)
@@ -0,0 +1,96 @@
+import numpy as np
+
+from Kinematics import Kinematics
+
+
+class DeltaRMatcher:
+    """
+    Finds (jet, candidate) pairs within delta R from each other, for many events at once. Candidates are binned in
+    an (event, eta, phi) grid with cells not smaller than delta R, with phi wrapping around, so that each jet only
+    needs to be compared with candidates from the 3x3 cells around it instead of all candidates of the event.
+    """
+
+    def __init__(self, eta, phi, event, delta_r):
+        """
+        Bins candidates with given eta, phi and event index in the grid.
+        """
+        self.eta = eta
+        self.phi = phi
+        self.delta_r = delta_r
+
+        self.n_phi_cells = max(1, int(np.floor(2 * np.pi / delta_r)))
+        self.phi_cell_size = 2 * np.pi / self.n_phi_cells
+
+        # neighbouring phi cells, without repeating cells when there are less than three of them
+        if self.n_phi_cells < 3:
+            self.phi_cell_shifts = np.arange(self.n_phi_cells)
+        else:
+            self.phi_cell_shifts = np.array([-1, 0, 1])
+
+        eta_cell = self.get_eta_cell(eta)
+        self.min_eta_cell = eta_cell.min() - 1 if len(eta_cell) > 0 else 0
+        self.n_eta_cells = eta_cell.max() - self.min_eta_cell + 2 if len(eta_cell) > 0 else 1
+
+        keys = self.get_keys(event, eta_cell, self.get_phi_cell(phi))
+        self.order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[self.order]
+
+    def get_eta_cell(self, eta):
+        """
+        Returns index of the eta cell for given eta values.
+        """
+        return np.floor(np.asarray(eta) / self.delta_r).astype(np.int64)
+
+    def get_phi_cell(self, phi):
+        """
+        Returns index of the phi cell for given phi values, after wrapping phi to [0, 2pi).
+        """
+        phi_cell = np.floor(np.mod(phi, 2 * np.pi) / self.phi_cell_size).astype(np.int64)
+        return np.minimum(phi_cell, self.n_phi_cells - 1)
+
+    def get_keys(self, event, eta_cell, phi_cell):
+        """
+        Returns unique key of (event, eta cell, phi cell) grid cells. Eta cells are clipped to the range of
+        candidates extended by one cell on each side, which doesn't change any of the matches.
+        """
+        eta_cell = np.clip(eta_cell, self.min_eta_cell, self.min_eta_cell + self.n_eta_cells - 1) - self.min_eta_cell
+        return (np.asarray(event, dtype=np.int64) * self.n_eta_cells + eta_cell) * self.n_phi_cells + phi_cell
+
+    def match(self, jet_eta, jet_phi, jet_event):
+        """
+        Returns indices of jets and candidates of all pairs within delta R, ordered by jet and then by candidate.
+        """
+        jet_eta_cell = self.get_eta_cell(jet_eta)
+        jet_phi_cell = self.get_phi_cell(jet_phi)
+
+        first, last, cell_jets = [], [], []
+
+        for eta_shift in [-1, 0, 1]:
+            for phi_shift in self.phi_cell_shifts:
+                keys = self.get_keys(jet_event, jet_eta_cell + eta_shift,
+                                     np.mod(jet_phi_cell + phi_shift, self.n_phi_cells))
+                first.append(np.searchsorted(self.sorted_keys, keys, side="left"))
+                last.append(np.searchsorted(self.sorted_keys, keys, side="right"))
+                cell_jets.append(np.arange(len(jet_eta)))
+
+        first, last, cell_jets = np.concatenate(first), np.concatenate(last), np.concatenate(cell_jets)
+        not_empty = last > first
+        first, last, cell_jets = first[not_empty], last[not_empty], cell_jets[not_empty]
+
+        # clipping of eta cells can map different shifts to the same cell, so each cell is visited only once
+        _, unique = np.unique(np.stack((cell_jets, first)), axis=1, return_index=True)
+        first, last, cell_jets = first[unique], last[unique], cell_jets[unique]
+
+        n_pairs = last - first
+        pair_jet = np.repeat(cell_jets, n_pairs)
+        pair_position = np.arange(n_pairs.sum()) - np.repeat(np.cumsum(n_pairs) - n_pairs, n_pairs)
+        pair_candidate = self.order[np.repeat(first, n_pairs) + pair_position]
+
+        delta_eta = self.eta[pair_candidate] - jet_eta[pair_jet]
+        delta_phi = Kinematics.get_delta_phi(jet_phi[pair_jet], self.phi[pair_candidate])
+        in_cone = delta_eta ** 2. + delta_phi ** 2. < self.delta_r ** 2.
+
+        pair_jet, pair_candidate = pair_jet[in_cone], pair_candidate[in_cone]
+        order = np.lexsort((pair_candidate, pair_jet))
+
+        return pair_jet[order], pair_candidate[order]
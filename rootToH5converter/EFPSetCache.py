@@ -0,0 +1,110 @@
+import os
+import json
+import pickle
+import hashlib
+import energyflow as ef
+
+
+class EFPSetCache:
+    """
+    Keeps prepared EFP sets (graphs, computation plans and their ordering) pickled in a cache directory, keyed on
+    their parameters and the version of energyflow, so that jobs don't enumerate graphs again and all of them use
+    exactly the same ordering of EFPs. Sets are also kept in memory, shared by all converters of the process.
+    """
+
+    # increase when format of the cached sets changes, to invalidate old ones
+    version = 1
+
+    # EFP sets already loaded or created in this process
+    loaded_sets = {}
+
+    def __init__(self, cache_dir=None, verbosity_level=1):
+        """
+        Args:
+            cache_dir (str): Directory to store EFP sets in (created if needed). If None, sets are only kept
+                             in memory.
+            verbosity_level (int): 0 - no output, 1 - basic output, 2 - detailed output.
+        """
+        self.cache_dir = cache_dir
+        self.verbosity_level = verbosity_level
+
+    @staticmethod
+    def get_parameters(efp_degree):
+        """
+        Returns parameters of the EFP set used by the converter for given degree.
+        """
+        return {"degree": efp_degree, "measure": "hadr", "beta": 1.0, "normed": True}
+
+    @staticmethod
+    def get_key(efp_degree):
+        """
+        Returns key of the EFP set with given degree.
+        """
+        description = {
+            "version": EFPSetCache.version,
+            "energyflow": ef.__version__,
+            "parameters": EFPSetCache.get_parameters(efp_degree),
+        }
+
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def get_path(self, key):
+        """
+        Returns path of the EFP set with given key.
+        """
+        return os.path.join(self.cache_dir, "efpset_" + key + ".pkl")
+
+    def get(self, efp_degree):
+        """
+        Returns EFP set with given degree, from memory or cache directory if possible. Otherwise, the set is created
+        and stored in the cache.
+        """
+        key = EFPSetCache.get_key(efp_degree)
+
+        if key in EFPSetCache.loaded_sets:
+            return EFPSetCache.loaded_sets[key]
+
+        efpset = self.load(key)
+
+        if efpset is None:
+            parameters = EFPSetCache.get_parameters(efp_degree)
+            efpset = ef.EFPSet("d<={0}".format(efp_degree), measure=parameters["measure"], beta=parameters["beta"],
+                               normed=parameters["normed"], verbose=self.verbosity_level > 0)
+            self.store(key, efpset)
+        elif self.verbosity_level > 0:
+            print("Loaded EFP set with degree d <= {0} from cache: {1}".format(efp_degree, self.get_path(key)))
+
+        EFPSetCache.loaded_sets[key] = efpset
+
+        return efpset
+
+    def load(self, key):
+        """
+        Returns cached EFP set with given key, or None if it's not in the cache (or can't be read).
+        """
+        if self.cache_dir is None or not os.path.exists(self.get_path(key)):
+            return None
+
+        try:
+            with open(self.get_path(key), "rb") as efpset_file:
+                return pickle.load(efpset_file)
+        except Exception as error:
+            if self.verbosity_level > 0:
+                print("WARNING -- couldn't load cached EFP set ", self.get_path(key), ": ", error)
+            return None
+
+    def store(self, key, efpset):
+        """
+        Stores EFP set in the cache directory. The file appears only when it's complete, so that jobs running at
+        the same time never read a partial one.
+        """
+        if self.cache_dir is None:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temporary_path = "{0}.{1}.tmp".format(self.get_path(key), os.getpid())
+
+        with open(temporary_path, "wb") as efpset_file:
+            pickle.dump(efpset, efpset_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(temporary_path, self.get_path(key))
@@ -1,14 +1,25 @@
 import numpy as np
+from contextlib import nullcontext
 from Jet import Jet
+from Kinematics import Kinematics
 from PhysObject import PhysObject
+from PFCandidateClassifier import PFCandidateClassifier
 from DataProcessor import InputTypes
 
 
 class Event:
-    def __init__(self, input_type, data_processor, i_event, delta_r, use_fat_jets=False, verbosity_level=1, force_delta_r_usage=False):
+    def __init__(self, input_type, data_processor, i_event, delta_r, use_fat_jets=False, verbosity_level=1, force_delta_r_usage=False,
+                 report=None, max_n_jets=None, fill_constituents=True):
         """
         Reads/calculates event level features, loads jets, tracks, photons and neutral hadrons.
-        Adds jet constituents to jets.
+        Adds jet constituents to jets. If report (ConversionReport) is given, loading jets with their constituents
+        is measured as the matching stage.
+        
+        Events with less than two jets or with jets not ordered by pt are rejected right after reading numbers of
+        objects and jet pts (see rejection_reason), without loading anything else. If max_n_jets is given, only
+        leading max_n_jets jets are loaded with their constituents (and the second jet, needed for Mjj and MT).
+        If fill_constituents is not set, tracks, photons and neutral hadrons are not loaded and jets have no
+        constituents.
         """
     
         self.i_event = i_event
@@ -18,6 +29,7 @@ class Event:
     
         self.verbosity_level = verbosity_level
         self.force_delta_r_usage = force_delta_r_usage
+        self.fill_constituents = fill_constituents
     
         # account for the fact that in Delphes MET is stored in an array with just one element
         i_object = None
@@ -32,9 +44,51 @@ class Event:
        
         
         if input_type == InputTypes.scoutingAtHlt:
-            self.nJets = len(data_processor.branches["Jet_eta"][i_event])
+            self.nJets = len(data_processor.get_value_from_tree("Jet_eta", i_event))
         else:
             self.nJets = data_processor.get_value_from_tree("N_fat_jets" if use_fat_jets else "N_jets", i_event)
+        self.nTracks, self.nNeutralHadrons, self.nPhotons = 0, 0, 0
+        
+        if fill_constituents:
+            self.read_numbers_of_candidates(input_type, use_fat_jets)
+        
+        self.tracks = []
+        self.neutral_hadrons = []
+        self.photons = []
+        self.jets = []
+        self.unrecognized_pids = np.zeros(0, dtype=np.int64)
+        self.Mjj = None
+        self.MT = None
+        
+        # cheap event-level cuts, before anything else is loaded
+        self.jet_pts = data_processor.get_value_from_tree(("Fat" if use_fat_jets else "") + "Jet_pt", i_event)
+        self.rejection_reason = self.get_rejection_reason()
+        
+        if self.rejection_reason is not None:
+            return
+        
+        if fill_constituents:
+            # load tracks, neutral hadrons and photons from tree
+            self.fill_tracks(use_fat_jets)
+            self.fill_neutral_hadrons()
+            self.fill_photons()
+            
+            if input_type is not InputTypes.Delphes and force_delta_r_usage:
+                self.find_photons_and_neutrals()
+        
+        # load jets from tree
+        with nullcontext() if report is None else report.measure("matching", count=1):
+            self.fill_jets(use_fat_jets=use_fat_jets, max_n_jets=max_n_jets)
+
+        # calculate remaining event features
+        self.calculate_internals()
+    
+    def read_numbers_of_candidates(self, input_type, use_fat_jets):
+        """
+        Reads numbers of tracks, neutral hadrons and photons in the event.
+        """
+        data_processor, i_event = self.data_processor, self.i_event
+        
         if input_type == InputTypes.PFnanoAOD102X:
             if use_fat_jets:
                 N_tracks_variable = "N_tracks_AK8"
@@ -44,41 +98,16 @@ class Event:
             N_tracks_variable = "N_tracks"
         
         if input_type == InputTypes.scoutingAtHlt:
-            self.nTracks = len(data_processor.branches["Track_eta"][i_event])
+            self.nTracks = len(data_processor.get_value_from_tree("Track_eta", i_event))
         else:
             self.nTracks = data_processor.get_value_from_tree(N_tracks_variable, i_event)
         
         self.nNeutralHadrons = data_processor.get_value_from_tree("N_neutral_hadrons", i_event)
         
         if input_type == InputTypes.scoutingAtHlt:
-            self.nPhotons = len(data_processor.branches["Photon_eta"][i_event])
+            self.nPhotons = len(data_processor.get_value_from_tree("Photon_eta", i_event))
         else:        
             self.nPhotons = data_processor.get_value_from_tree("N_photons", i_event)
-        
-        # load tracks from tree
-        self.tracks = []
-        self.fill_tracks(use_fat_jets)
-        
-        # load neutral hadrons from tree
-        self.neutral_hadrons = []
-        self.fill_neutral_hadrons()
-
-        # load photons from tree
-        self.photons = []
-        self.fill_photons()
-        
-        if input_type is not InputTypes.Delphes and force_delta_r_usage:
-            self.find_photons_and_neutrals()
-        
-        # load jets from tree
-        self.jets = []
-        self.fill_jets(use_fat_jets=use_fat_jets)
-
-        # calculate remaining event features
-        self.Mjj = None
-        self.MT = None
-        if self.nJets >= 2:
-            self.calculate_internals()
     
     def print(self):
         """
@@ -139,39 +168,69 @@ class Event:
             self.photons.append(photon)
     
     def find_photons_and_neutrals(self):
-    
-        photon_id = 22
-        neutral_hardons_ids = [111, 130, 310]
-        charged_ids = [211, 11, 13]
-        weird_ids = [1, 2]
+        """
+        Moves tracks which are photons or neutral hadrons according to their PDG ID to the corresponding collections.
+        PDG IDs which are not recognized are stored in self.unrecognized_pids.
+        """
+        if len(self.tracks) == 0 or self.tracks[0].pid is None:
+            return
         
-        n_weird = 0
-    
-        for track in self.tracks:
-            if track.pid == photon_id:
-                self.photons.append(self.tracks.pop(self.tracks.index(track)))
-            elif track.pid in neutral_hardons_ids:
-                self.neutral_hadrons.append(self.tracks.pop(self.tracks.index(track)))
-            elif abs(track.pid) not in charged_ids:
-                if abs(track.pid) not in weird_ids:
-                    print("Unrecognized PID: ", track.pid)
-                else:
-                   n_weird += 1
-            
-        # print("There were ", n_weird, " weird PID's")
+        pids = np.array([track.pid for track in self.tracks])
+        is_photon, is_neutral_hadron, is_unrecognized = PFCandidateClassifier.classify(pids)
+        is_charged = ~(is_photon | is_neutral_hadron)
+        
+        self.photons += [track for track, selected in zip(self.tracks, is_photon) if selected]
+        self.neutral_hadrons += [track for track, selected in zip(self.tracks, is_neutral_hadron) if selected]
+        self.tracks = [track for track, selected in zip(self.tracks, is_charged) if selected]
+        self.unrecognized_pids = pids[is_unrecognized]
         
         self.nTracks = len(self.tracks)
         self.nNeutralHadrons = len(self.neutral_hadrons)
         self.nPhotons = len(self.photons)
     
-    def fill_jets(self, use_fat_jets=False):
+    def get_rejection_reason(self):
+        """
+        Returns reason why the event is not stored ("less_than_two_jets" or "jets_not_ordered_by_pt"), or None if
+        it passes the cuts. Only numbers of jets and jet pts are used.
+        """
+        if self.nJets is None or self.nJets < 2:
+            return "less_than_two_jets"
+        
+        if not self.are_jets_ordered_by_pt():
+            return "jets_not_ordered_by_pt"
+        
+        return None
+    
+    def fill_jets(self, use_fat_jets=False, max_n_jets=None):
+        """
+        Loads jets and adds constituents to them. If max_n_jets is given, only leading max_n_jets jets (and at least
+        two, for Mjj and MT) are loaded and constituents are added only to the leading max_n_jets ones.
+        """
         if self.nJets is None:
             return
+        
+        n_jets_with_constituents = self.nJets if max_n_jets is None else min(self.nJets, max_n_jets)
+        n_jets = min(self.nJets, max(n_jets_with_constituents, 2))
+        
+        if not self.fill_constituents:
+            n_jets_with_constituents = 0
             
         prefix = "Fat" if use_fat_jets else ""
         jet_radius = "AK8" if use_fat_jets else "AK4"
 
-        for i_jet in range(0, self.nJets):
+        # check if tree contains links between tracks and jets
+        track_jet_index, track_cand_index = None, None
+        
+        if self.fill_constituents:
+            track_jet_index = self.data_processor.get_value_from_tree("Track_jet_index_"+jet_radius, self.i_event)
+            track_cand_index = self.data_processor.get_value_from_tree("Track_cand_index_"+jet_radius, self.i_event)
+        
+        if track_jet_index is None or self.force_delta_r_usage:
+            tracks_per_jet = None
+        else:
+            tracks_per_jet = self.group_tracks_by_jet(track_jet_index, track_cand_index)
+
+        for i_jet in range(0, n_jets):
             jet = Jet(eta=self.data_processor.get_value_from_tree(prefix+"Jet_eta", self.i_event, i_jet),
                       phi=self.data_processor.get_value_from_tree(prefix+"Jet_phi", self.i_event, i_jet),
                       pt=self.data_processor.get_value_from_tree(prefix+"Jet_pt", self.i_event, i_jet),
@@ -182,15 +241,74 @@ class Event:
                       ch_hef=self.data_processor.get_value_from_tree(prefix+"Jet_chHEF", self.i_event, i_jet),
                       ne_hef=self.data_processor.get_value_from_tree(prefix+"Jet_neHEF", self.i_event, i_jet))
 
-            # check if tree contains links between tracks and jets
-            track_jet_index = self.data_processor.get_value_from_tree("Track_jet_index_"+jet_radius, self.i_event)
-            jet_index = -1 if track_jet_index is None or self.force_delta_r_usage else i_jet
-            track_cand_index = self.data_processor.get_value_from_tree("Track_cand_index_"+jet_radius, self.i_event)
-            
-            # fill jet constituents
-            jet.fill_constituents(self.tracks, self.neutral_hadrons, self.photons, self.delta_r, jet_index, track_jet_index, track_cand_index)
-            
             self.jets.append(jet)
+        
+        if n_jets_with_constituents == 0:
+            return
+        
+        # fill jet constituents, matching candidates with all jets at once instead of checking all of them for each jet
+        jets = self.jets[:n_jets_with_constituents]
+        tracks, neutral_hadrons, photons = [Event.get_kinematics(objects)
+                                            for objects in [self.tracks, self.neutral_hadrons, self.photons]]
+        
+        if tracks_per_jet is None:
+            tracks_per_jet = self.match_by_delta_r(tracks, 0.1, jets)
+        
+        neutral_hadrons_per_jet = self.match_by_delta_r(neutral_hadrons, 0.5, jets)
+        photons_per_jet = self.match_by_delta_r(photons, 0.2, jets)
+        
+        for i_jet, jet in enumerate(jets):
+            jet.fill_constituents(tracks, neutral_hadrons, photons,
+                                  tracks_per_jet[i_jet], neutral_hadrons_per_jet[i_jet], photons_per_jet[i_jet])
+    
+    @staticmethod
+    def get_kinematics(physObjects):
+        """
+        Returns array with pt, eta, phi and mass of each of physObjects.
+        """
+        
+        return np.array([(object.pt, object.eta, object.phi, object.mass) for object in physObjects],
+                        dtype=float).reshape(-1, 4)
+    
+    def match_by_delta_r(self, objects, pt_cut, jets):
+        """
+        Returns list with indices of objects (array of pt, eta, phi, mass) passing the pt cut and within delta_r from
+        each of the jets, in the order of objects. Distances of all (jet, object) pairs are calculated at once.
+        """
+        
+        jet_eta = np.array([jet.eta for jet in jets], dtype=float)[:, np.newaxis]
+        jet_phi = np.array([jet.phi for jet in jets], dtype=float)[:, np.newaxis]
+        
+        delta_eta = objects[np.newaxis, :, 1] - jet_eta
+        delta_phi = Kinematics.get_delta_phi(jet_phi, objects[np.newaxis, :, 2])
+        selected = (objects[np.newaxis, :, 0] > pt_cut) & (delta_eta ** 2. + delta_phi ** 2. < self.delta_r ** 2.)
+        
+        return [np.nonzero(jet_selected)[0] for jet_selected in selected]
+    
+    def group_tracks_by_jet(self, track_jet_index, track_cand_index=None):
+        """
+        Returns list with indices of tracks linked to each jet, in the order of tracks. Links are given by jet index
+        of each track, or by (jet index, track index) pairs if track_cand_index is specified. Tracks are grouped
+        with a single sort, instead of checking all links for each jet.
+        """
+        
+        n_tracks = len(self.tracks)
+        jet_index = np.asarray(track_jet_index, dtype=np.int64)
+        
+        if track_cand_index is None:
+            jet_index = jet_index[:n_tracks]
+            track_index = np.arange(len(jet_index))
+        else:
+            track_index = np.asarray(track_cand_index, dtype=np.int64)
+        
+        valid = (jet_index >= 0) & (jet_index < self.nJets) & (track_index >= 0) & (track_index < n_tracks)
+        jet_index, track_index = jet_index[valid], track_index[valid]
+        
+        # sort by jet, then by track, and remove duplicated links
+        key = np.unique(jet_index * max(n_tracks, 1) + track_index)
+        jet_index, track_index = np.divmod(key, max(n_tracks, 1))
+        
+        return np.split(track_index, np.cumsum(np.bincount(jet_index, minlength=self.nJets))[:-1])
     
     def has_jets_with_no_constituents(self, max_n_jets):
         """
@@ -222,29 +340,16 @@ class Event:
         
         dijet_vector = self.jets[0].get_four_vector() + self.jets[1].get_four_vector()
         
-        met_py = self.metPt * np.sin(self.metPhi)
-        met_px = self.metPt * np.cos(self.metPhi)
-    
-        Mjj = dijet_vector.M()
-        Mjj2 = Mjj * Mjj
-        ptjj = dijet_vector.Pt()
-        ptjj2 = ptjj * ptjj
-        ptMet = dijet_vector.Px() * met_px + dijet_vector.Py() * met_py
-    
-        MT = np.sqrt(Mjj2 + 2. * (np.sqrt(Mjj2 + ptjj2) * self.metPt - ptMet))
-        
-        self.Mjj = Mjj
-        self.MT = MT
+        self.Mjj = Kinematics.get_mass(*dijet_vector)
+        self.MT = Kinematics.get_transverse_mass(*dijet_vector, self.metPt, self.metPhi)
 
     def are_jets_ordered_by_pt(self):
         """
         Checks if all jets in the event are ordered by pt.
         """
-        for i_jet in range(1, self.nJets):
-            if self.jets[i_jet].get_four_vector().Pt() > self.jets[i_jet-1].get_four_vector().Pt():
-                return False
-            
-        return True
+        pts = np.abs(np.asarray(self.jet_pts)[:self.nJets])
+        
+        return bool(np.all(pts[1:] <= pts[:-1]))
 
     def get_features(self):
         """
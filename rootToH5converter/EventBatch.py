@@ -0,0 +1,467 @@
+import numpy as np
+import awkward as ak
+from contextlib import nullcontext
+import energyflow as ef
+
+from DataProcessor import InputTypes
+from DeltaRMatcher import DeltaRMatcher
+from PFCandidateClassifier import PFCandidateClassifier
+from Kinematics import Kinematics
+
+
+class EventBatch:
+    """
+    Columnar counterpart of Event. Reads/calculates event and jet level features for a whole chunk of events at once,
+    using array operations instead of building Python objects for every event, jet and constituent.
+    """
+
+    def __init__(self, input_type, data_processor, i_events, delta_r, max_n_jets, use_fat_jets=False,
+                 verbosity_level=1, force_delta_r_usage=False, report=None, fill_constituents=True):
+        """
+        Reads event features and jets for all events in i_events, drops events with less than 2 jets or with jets
+        not ordered by pt, and adds constituents to the leading max_n_jets jets of the remaining events.
+        If report (ConversionReport) is given, matching of constituents is measured as a separate stage.
+        If fill_constituents is not set, candidates are not read, jets have no constituents and all of them are
+        stored.
+        """
+
+        self.input_type = input_type
+        self.data_processor = data_processor
+        self.i_events = np.asarray(i_events, dtype=np.int64)
+        self.delta_r = delta_r
+        self.max_n_jets = max_n_jets
+        self.verbosity_level = verbosity_level
+        self.force_delta_r_usage = force_delta_r_usage
+        self.constituents_matched = fill_constituents
+
+        self.jet_prefix = "Fat" if use_fat_jets else ""
+        self.jet_radius = "AK8" if use_fat_jets else "AK4"
+
+        if input_type == InputTypes.PFnanoAOD102X:
+            self.track_suffix = "_" + self.jet_radius
+        else:
+            self.track_suffix = ""
+
+        # load jets and apply event-level requirements before doing any constituent work
+        self.jets = self.get_collection(self.jet_prefix + "Jet", ["eta", "phi", "pt", "mass"])
+
+        if self.jets is None:
+            print("\n\nERROR -- EventBatch: jets branches not found for input type: ", input_type, "\n\n")
+            exit(0)
+
+        n_jets = ak.to_numpy(ak.num(self.jets["pt"]))
+        has_two_jets = n_jets >= 2
+        are_ordered = ~ak.to_numpy(ak.any(self.jets["pt"][:, 1:] > self.jets["pt"][:, :-1], axis=1))
+
+        self.n_events_with_less_than_two_jets = int(np.sum(~has_two_jets))
+        self.n_events_with_unordered_jets = int(np.sum(has_two_jets & ~are_ordered))
+
+        selected = np.nonzero(has_two_jets & are_ordered)[0]
+        self.i_events = self.i_events[selected]
+        self.jets = {key: values[selected] for key, values in self.jets.items()}
+        self.n_events = len(self.i_events)
+        self.n_jets = n_jets[selected]
+
+        # read event features and calculate Mjj and MT
+        self.met_pt = self.get_event_values("MET_pt")
+        self.met_eta = self.get_event_values("MET_eta")
+        self.met_phi = self.get_event_values("MET_phi")
+        self.gen_weight = self.get_event_values("Gen_weight")
+
+        self.Mjj = np.full(self.n_events, np.nan)
+        self.MT = np.full(self.n_events, np.nan)
+        self.calculate_internals()
+
+        # flatten jets that will be stored and match their constituents
+        self.fill_stored_jets()
+        
+        if fill_constituents:
+            with nullcontext() if report is None else report.measure("matching", count=len(self.jet_event)):
+                self.fill_constituents()
+        else:
+            self.set_no_constituents()
+
+    def get_values(self, variable):
+        """
+        Returns values of given variable for all events in the batch, or None if it's not available in the tree.
+        """
+        return self.data_processor.get_values_for_events(variable, self.i_events)
+
+    def get_event_values(self, variable):
+        """
+        Returns event-level variable as float array (nan if not available in the tree). Accounts for the fact that
+        in Delphes event features like MET are stored in an array with just one element.
+        """
+
+        values = self.get_values(variable)
+
+        if values is None:
+            return np.full(self.n_events, np.nan)
+
+        if self.data_processor.get_array_n_dimensions(variable) == 2:
+            values = values[:, 0]
+
+        return np.asarray(ak.to_numpy(values), dtype=np.float64)
+
+    def get_collection(self, name, fields, suffix=""):
+        """
+        Returns dict of jagged arrays with requested fields of given collection (e.g. Jet, Track, Photon), or None
+        if the collection is not available in the tree. Missing mass is set to zero.
+        """
+
+        collection = {}
+
+        for field in fields:
+            values = self.get_values(name + "_" + field + suffix)
+
+            if values is None and field == "mass" and "pt" in collection:
+                values = collection["pt"] * 0
+            elif values is None:
+                return None
+
+            collection[field] = values
+
+        return collection
+
+    def calculate_internals(self):
+        """
+        Calculates Mjj and MT for the two leading jets.
+        """
+
+        if self.n_events == 0:
+            return
+
+        leading = [
+            Kinematics.get_four_vectors(*[np.asarray(ak.to_numpy(self.jets[field][:, i_jet]), dtype=np.float64)
+                                          for field in ["pt", "eta", "phi", "mass"]])
+            for i_jet in range(2)
+        ]
+
+        dijet_vector = [leading[0][i] + leading[1][i] for i in range(4)]
+
+        self.Mjj = Kinematics.get_mass(*dijet_vector)
+        self.MT = Kinematics.get_transverse_mass(*dijet_vector, self.met_pt, self.met_phi)
+
+    def fill_stored_jets(self):
+        """
+        Flattens leading max_n_jets jets of each event into a jet table, keeping event and position indices.
+        """
+
+        stored = {field: values[:, :self.max_n_jets] for field, values in self.jets.items()}
+        counts = ak.to_numpy(ak.num(stored["pt"]))
+
+        self.jet_event = np.repeat(np.arange(self.n_events), counts)
+        self.jet_slot = np.asarray(ak.to_numpy(ak.flatten(ak.local_index(stored["pt"], axis=1))), dtype=np.int64)
+        self.jet_offsets = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+        self.jet_counts = counts
+
+        for field in ["pt", "eta", "phi", "mass"]:
+            setattr(self, "jet_" + field, EventBatch.to_flat_array(stored[field]))
+
+        self.jet_flavor = self.get_stored_jet_values("Jet_flavor")
+
+        # use energy fractions if available, otherwise try to re-calculate them (for Delphes)
+        self.jet_charged_fraction = self.get_stored_jet_values("Jet_chHEF")
+        n_charged = self.get_stored_jet_values("Jet_nCharged")
+        n_neutral = self.get_stored_jet_values("Jet_nNeutral")
+
+        if not self.data_processor.has_variable(self.jet_prefix + "Jet_chHEF") and \
+                self.data_processor.has_variable(self.jet_prefix + "Jet_nCharged") and \
+                self.data_processor.has_variable(self.jet_prefix + "Jet_nNeutral"):
+            n_total = n_charged + n_neutral
+            with np.errstate(divide="ignore", invalid="ignore"):
+                self.jet_charged_fraction = np.where(n_total > 0, n_charged / n_total, -1)
+
+    def get_stored_jet_values(self, variable):
+        """
+        Returns flat array with given jet variable for stored jets (nan if not available in the tree).
+        """
+
+        values = self.get_values(self.jet_prefix + variable)
+
+        if values is None:
+            return np.full(len(self.jet_event), np.nan)
+
+        return EventBatch.to_flat_array(values[:, :self.max_n_jets])
+
+    def fill_constituents(self):
+        """
+        Matches tracks, neutral hadrons and photons to stored jets and builds a flat table of constituents, grouped
+        by jet. Uses links between tracks and jets if available, otherwise constituents within delta_r are added.
+        """
+
+        matches = []
+
+        tracks = self.get_collection("Track", ["eta", "phi", "pt", "mass"], self.track_suffix)
+        neutral_hadrons = self.get_collection("Neutral", ["eta", "phi", "pt", "mass"])
+        photons = self.get_collection("Photon", ["eta", "phi", "pt", "mass"])
+        self.unrecognized_pids = np.zeros(0, dtype=np.int64)
+
+        if self.input_type != InputTypes.Delphes and self.force_delta_r_usage and tracks is not None:
+            tracks, neutral_hadrons, photons = self.find_photons_and_neutrals(tracks, neutral_hadrons, photons)
+
+        if tracks is not None:
+            track_jet_index = self.get_values("Track_jet_index_" + self.jet_radius)
+            track_cand_index = self.get_values("Track_cand_index_" + self.jet_radius)
+
+            if track_jet_index is None or self.force_delta_r_usage:
+                matches.append(self.match_by_delta_r(tracks, 0.1))
+            elif track_cand_index is None:
+                matches.append(self.match_by_jet_index(tracks, track_jet_index))
+            else:
+                matches.append(self.match_by_links(tracks, track_jet_index, track_cand_index))
+
+        for collection, pt_cut in [(neutral_hadrons, 0.5), (photons, 0.2)]:
+            if collection is not None:
+                matches.append(self.match_by_delta_r(collection, pt_cut))
+
+        # stable sort keeps the order of tracks, neutral hadrons and photons within each jet
+        constituent_jet = np.concatenate([match[0] for match in matches] + [np.zeros(0, dtype=np.int64)])
+        order = np.argsort(constituent_jet, kind="stable")
+        self.constituent_jet = constituent_jet[order]
+
+        for i_field, field in enumerate(["pt", "eta", "phi", "mass"]):
+            values = np.concatenate([match[1][i_field] for match in matches] + [np.zeros(0)])
+            setattr(self, "constituent_" + field, values[order])
+
+        self.n_constituents = np.bincount(self.constituent_jet, minlength=len(self.jet_event))
+        self.constituent_offsets = np.concatenate(([0], np.cumsum(self.n_constituents)[:-1])).astype(np.int64)
+        self.n_jets_without_constituents = int(np.sum(self.n_constituents == 0))
+
+    def set_no_constituents(self):
+        """
+        Sets empty table of constituents, for conversions which don't need them.
+        """
+
+        self.unrecognized_pids = np.zeros(0, dtype=np.int64)
+        self.constituent_jet = np.zeros(0, dtype=np.int64)
+
+        for field in ["pt", "eta", "phi", "mass"]:
+            setattr(self, "constituent_" + field, np.zeros(0))
+
+        self.n_constituents = np.zeros(len(self.jet_event), dtype=np.int64)
+        self.constituent_offsets = np.zeros(len(self.jet_event), dtype=np.int64)
+        self.n_jets_without_constituents = 0
+
+    def find_photons_and_neutrals(self, tracks, neutral_hadrons, photons):
+        """
+        Moves tracks which are photons or neutral hadrons according to their PDG ID to the corresponding collections
+        (after candidates already there) and returns the updated collections. PDG IDs which are not recognized are
+        stored in self.unrecognized_pids.
+        """
+
+        pid = self.get_values("Track_pid" + self.track_suffix)
+
+        if pid is None:
+            return tracks, neutral_hadrons, photons
+
+        counts = ak.num(pid)
+        flat_pid = EventBatch.to_flat_array(pid, dtype=np.int64)
+        is_photon, is_neutral_hadron, is_unrecognized = PFCandidateClassifier.classify(flat_pid)
+        self.unrecognized_pids = flat_pid[is_unrecognized]
+
+        def move(mask, collection):
+            mask = ak.unflatten(mask, counts)
+            moved = {field: values[mask] for field, values in tracks.items()}
+
+            if collection is None:
+                return moved
+
+            return {field: ak.concatenate([collection[field], moved[field]], axis=1) for field in collection}
+
+        neutral_hadrons = move(is_neutral_hadron, neutral_hadrons)
+        photons = move(is_photon, photons)
+        tracks = {field: values[ak.unflatten(~(is_photon | is_neutral_hadron), counts)]
+                  for field, values in tracks.items()}
+
+        return tracks, neutral_hadrons, photons
+
+    def get_flat_collection(self, collection):
+        """
+        Flattens jagged collection to arrays of pt, eta, phi, mass, event index and offsets of each event.
+        """
+
+        counts = ak.to_numpy(ak.num(collection["pt"]))
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+        event = np.repeat(np.arange(self.n_events), counts)
+        kinematics = [EventBatch.to_flat_array(collection[field]) for field in ["pt", "eta", "phi", "mass"]]
+
+        return kinematics, event, counts, offsets
+
+    def match_by_delta_r(self, collection, pt_cut):
+        """
+        Returns stored jet indices and kinematics of candidates passing the pt cut and within delta_r from the jet.
+        """
+
+        (pt, eta, phi, mass), event, _, _ = self.get_flat_collection(collection)
+
+        passing = pt > pt_cut
+        pt, eta, phi, mass, event = pt[passing], eta[passing], phi[passing], mass[passing], event[passing]
+
+        matcher = DeltaRMatcher(eta, phi, event, self.delta_r)
+        pair_jet, pair_candidate = matcher.match(self.jet_eta, self.jet_phi, self.jet_event)
+
+        return pair_jet, [pt[pair_candidate], eta[pair_candidate], phi[pair_candidate], mass[pair_candidate]]
+
+    def match_by_jet_index(self, collection, track_jet_index):
+        """
+        Returns stored jet indices and kinematics of tracks with jet index pointing to the jet.
+        """
+
+        (pt, eta, phi, mass), event, _, _ = self.get_flat_collection(collection)
+        jet_index = EventBatch.to_flat_array(track_jet_index, dtype=np.int64)
+
+        linked = (jet_index >= 0) & (jet_index < self.jet_counts[event])
+        pair_jet = self.jet_offsets[event[linked]] + jet_index[linked]
+        pair_candidate = np.nonzero(linked)[0]
+
+        # stable sort groups tracks by jet, keeping their order within each jet
+        order = np.argsort(pair_jet, kind="stable")
+        pair_jet, pair_candidate = pair_jet[order], pair_candidate[order]
+
+        return pair_jet, [pt[pair_candidate], eta[pair_candidate], phi[pair_candidate], mass[pair_candidate]]
+
+    def match_by_links(self, collection, track_jet_index, track_cand_index):
+        """
+        Returns stored jet indices and kinematics of tracks linked to jets by (jet index, candidate index) pairs.
+        Each track is added at most once per jet, in the order of tracks in the event.
+        """
+
+        (pt, eta, phi, mass), _, counts, offsets = self.get_flat_collection(collection)
+
+        link_counts = ak.to_numpy(ak.num(track_jet_index))
+        link_event = np.repeat(np.arange(self.n_events), link_counts)
+        link_jet = EventBatch.to_flat_array(track_jet_index, dtype=np.int64)
+        link_candidate = EventBatch.to_flat_array(track_cand_index, dtype=np.int64)
+
+        valid = (link_jet >= 0) & (link_jet < self.jet_counts[link_event]) & \
+                (link_candidate >= 0) & (link_candidate < counts[link_event])
+
+        pair_jet = self.jet_offsets[link_event[valid]] + link_jet[valid]
+        pair_candidate = offsets[link_event[valid]] + link_candidate[valid]
+
+        # a single sort of (jet, candidate) keys orders links by jet, then by candidate, and removes duplicates
+        n_candidates = max(len(pt), 1)
+        pair_jet, pair_candidate = np.divmod(np.unique(pair_jet * n_candidates + pair_candidate), n_candidates)
+
+        return pair_jet, [pt[pair_candidate], eta[pair_candidate], phi[pair_candidate], mass[pair_candidate]]
+
+    def get_features(self):
+        """
+        Returns event features for all events in the batch.
+        """
+        return np.stack((
+            self.met_pt,
+            self.met_eta,
+            self.met_phi,
+            self.MT,
+            self.Mjj,
+            self.gen_weight,
+        ), axis=1)
+
+    def get_jet_ptD(self):
+        """
+        Calculates and returns the ptD variable of all stored jets based on their constituents.
+        """
+
+        return Kinematics.get_ptD(self.constituent_pt, self.constituent_jet, len(self.jet_event))
+
+    def get_jet_axis2(self):
+        """
+        Calculates and returns the axis2 variable of all stored jets based on their constituents.
+        """
+
+        return Kinematics.get_axis2(self.constituent_pt, self.constituent_eta, self.constituent_phi,
+                                    self.jet_eta, self.jet_phi, self.constituent_jet)
+
+    def to_padded_jet_array(self, values):
+        """
+        Puts per-jet values into array of shape (n_events, max_n_jets, ...). Jets without constituents are skipped
+        (unless constituents were not matched at all), so their entries (as well as entries of missing jets) are
+        left as zeros.
+        """
+
+        values = np.asarray(values)
+        padded = np.zeros((self.n_events, self.max_n_jets) + values.shape[1:])
+
+        stored = self.n_constituents > 0 if self.constituents_matched else np.ones(len(self.jet_event), dtype=bool)
+        padded[self.jet_event[stored], self.jet_slot[stored]] = values[stored]
+
+        return padded
+
+    def get_jet_features(self, substructure=True):
+        """
+        Returns jet features of stored jets, in the format of Jet.get_features(). If substructure is not set, ptD
+        and axis2 are not calculated and set to zero.
+        """
+
+        jet_energy = Kinematics.get_four_vectors(self.jet_pt, self.jet_eta, self.jet_phi, self.jet_mass)[0]
+        no_substructure = np.zeros(len(self.jet_event))
+
+        return self.to_padded_jet_array(np.stack((
+            self.jet_eta,
+            self.jet_phi,
+            self.jet_pt,
+            self.jet_mass,
+            self.jet_charged_fraction,
+            self.get_jet_ptD() if substructure else no_substructure,
+            self.get_jet_axis2() if substructure else no_substructure,
+            self.jet_flavor,
+            jet_energy,
+        ), axis=1))
+
+    def get_constituents(self, max):
+        """
+        Returns array with constituents of stored jets, ordered by pt and limited to specified maximum, in the
+        format of Jet.get_constituents(). If there are less constituents than max, remaining entries are zeros.
+        """
+
+        energy, _, _, pz = Kinematics.get_four_vectors(self.constituent_pt, self.constituent_eta,
+                                                       self.constituent_phi, self.constituent_mass)
+        rapidity = Kinematics.get_rapidity(energy, pz)
+
+        features = np.stack((
+            self.constituent_eta,
+            self.constituent_phi,
+            self.constituent_pt,
+            rapidity,
+            energy,
+            self.constituent_eta - self.jet_eta[self.constituent_jet],
+            Kinematics.get_delta_phi(self.jet_phi[self.constituent_jet], self.constituent_phi),
+        ), axis=1)
+
+        order = np.lexsort((-self.constituent_pt, self.constituent_jet))
+        rank = np.arange(len(order)) - self.constituent_offsets[self.constituent_jet]
+        kept = rank < max
+
+        constituents = np.zeros((len(self.jet_event), max, features.shape[1]))
+        constituents[self.constituent_jet[kept], rank[kept]] = features[order][kept]
+
+        return self.to_padded_jet_array(constituents)
+
+    def get_EFPs(self, EFP_set, n_jobs=1):
+        """
+        Calculates and returns EFPs of stored jets from their constituents with the provided EFP set. All jets of
+        the batch are evaluated at once with EFPSet.batch_compute, using n_jobs processes (None - all CPUs).
+        """
+
+        p4s = np.stack(Kinematics.get_four_vectors(self.constituent_pt, self.constituent_eta,
+                                                   self.constituent_phi, self.constituent_mass), axis=1)
+        ptyphims = ef.utils.ptyphims_from_p4s(p4s)
+
+        efps = np.zeros((len(self.jet_event), EFP_set.count()))
+        has_constituents = self.n_constituents > 0
+
+        if np.any(has_constituents):
+            jets_ptyphims = np.split(ptyphims, self.constituent_offsets[1:])
+            efps[has_constituents] = EFP_set.batch_compute([jets_ptyphims[i_jet] for i_jet
+                                                            in np.nonzero(has_constituents)[0]], n_jobs)
+
+        return self.to_padded_jet_array(efps)
+
+    @staticmethod
+    def to_flat_array(values, dtype=np.float64):
+        """
+        Flattens jagged array to numpy array of given type.
+        """
+        return np.asarray(ak.to_numpy(ak.flatten(values)), dtype=dtype)
@@ -0,0 +1,235 @@
+import ast
+import numpy as np
+import awkward as ak
+
+from Kinematics import Kinematics
+
+
+class JetVariable:
+    """
+    Values of a jet variable for all events of a chunk, indexed by position of the jet, e.g. Pt[0] is pt of the
+    leading jet of each event (nan if the event has no such jet, so that cuts on it fail).
+    """
+
+    def __init__(self, values):
+        self.values = values
+
+    def __getitem__(self, i_jet):
+        padded = ak.fill_none(ak.pad_none(self.values, i_jet + 1, axis=1, clip=True), np.nan)
+
+        return np.asarray(ak.to_numpy(padded[:, i_jet]), dtype=np.float64)
+
+
+class LogicalToBitwise(ast.NodeTransformer):
+    """
+    Replaces and, or and not in the syntax tree of a cut with &, | and ~, which work element-wise on arrays.
+    """
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        operator = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        result = node.values[0]
+
+        for value in node.values[1:]:
+            result = ast.BinOp(left=result, op=operator, right=value)
+
+        return ast.copy_location(result, node)
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+
+        if isinstance(node.op, ast.Not):
+            return ast.copy_location(ast.UnaryOp(op=ast.Invert(), operand=node.operand), node)
+
+        return node
+
+
+class EventSelection:
+    """
+    Preselection of events with declarative expressions over event and jet variables, evaluated for all events
+    of a chunk at once, before anything else is done with them. Each expression is a cut, e.g.:
+        Pt[1] > 200
+        (abs(Eta[0]) < 2.4) & (abs(Eta[1]) < 2.4)
+        abs(Eta[0] - Eta[1]) < 1.5 or MET / MT > 0.15
+    Comparisons are combined with &, | and ~ (which bind tighter than comparisons, so comparisons have to be in
+    parentheses) or with and, or and not (which are evaluated as &, | and ~ for all events). Cuts are applied one
+    after another and numbers of events passing and failing each of them are added to the cutflow of the report.
+
+    Available variables are event features (MET, METPhi, genWeight, Mjj and MT of two leading jets, nJets) and
+    jet features indexed by position of the jet (Pt, Eta, Phi, M), with functions abs, sqrt, minimum and maximum.
+    """
+
+    event_variables = {
+        "MET": "MET_pt",
+        "METPhi": "MET_phi",
+        "genWeight": "Gen_weight",
+    }
+
+    jet_variables = {
+        "Pt": "pt",
+        "Eta": "eta",
+        "Phi": "phi",
+        "M": "mass",
+    }
+
+    dijet_variables = ["Mjj", "MT"]
+
+    functions = {
+        "abs": np.abs,
+        "sqrt": np.sqrt,
+        "minimum": np.minimum,
+        "maximum": np.maximum,
+    }
+
+    allowed_nodes = (ast.Expression, ast.BoolOp, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name, ast.Load,
+                     ast.Constant, ast.Subscript, ast.And, ast.Or, ast.BitAnd, ast.BitOr, ast.Invert,
+                     ast.Not, ast.USub, ast.UAdd, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Lt, ast.LtE,
+                     ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+
+    def __init__(self, expressions, use_fat_jets=False):
+        """
+        Args:
+            expressions (list): Cuts to apply, in order (see class description).
+            use_fat_jets (bool): If true, jet variables refer to fat jets.
+        """
+        self.expressions = list(expressions)
+        self.jet_prefix = "Fat" if use_fat_jets else ""
+        self.cuts = [EventSelection.compile(expression) for expression in self.expressions]
+
+        self.names = set()
+        for cut in self.cuts:
+            self.names |= {node.id for node in ast.walk(cut[0]) if isinstance(node, ast.Name)}
+
+    @staticmethod
+    def compile(expression):
+        """
+        Parses expression, checks that it only uses known variables, functions and operators, and returns its
+        syntax tree with the compiled code. Logical operators are replaced with bitwise ones (see LogicalToBitwise).
+        """
+        try:
+            tree = ast.parse(expression, mode="eval")
+        except SyntaxError:
+            print("ERROR -- couldn't parse selection: ", expression)
+            exit()
+
+        known_names = (list(EventSelection.event_variables) + list(EventSelection.jet_variables) +
+                       EventSelection.dijet_variables + ["nJets"] + list(EventSelection.functions))
+
+        for node in ast.walk(tree):
+            if not isinstance(node, EventSelection.allowed_nodes):
+                print("ERROR -- selection ", expression, " contains unsupported syntax: ", type(node).__name__)
+                exit()
+
+            if isinstance(node, ast.Name) and node.id not in known_names:
+                print("ERROR -- unknown variable in selection ", expression, ": ", node.id)
+                print("Available variables and functions: ", known_names)
+                exit()
+
+            # e.g. "Eta[0] < 2.4 & Eta[1] < 2.4" means "Eta[0] < (2.4 & Eta[1]) < 2.4"
+            if isinstance(node, ast.Compare) and any(isinstance(operand, ast.BinOp) and
+                                                     isinstance(operand.op, (ast.BitAnd, ast.BitOr))
+                                                     for operand in [node.left] + node.comparators):
+                print("ERROR -- & and | bind tighter than comparisons, put comparisons in parentheses in selection: ",
+                      expression)
+                exit()
+
+        tree = ast.fix_missing_locations(LogicalToBitwise().visit(tree))
+
+        return tree, compile(tree, expression, "eval")
+
+    def get_required_variables(self):
+        """
+        Returns names of DataProcessor variables needed to evaluate the cuts.
+        """
+        variables = [self.jet_prefix + "Jet_pt"]
+        variables += [value for name, value in EventSelection.event_variables.items() if name in self.names]
+        variables += [self.jet_prefix + "Jet_" + value for name, value in EventSelection.jet_variables.items()
+                      if name in self.names]
+
+        if any(name in self.names for name in EventSelection.dijet_variables):
+            variables += [self.jet_prefix + "Jet_" + field for field in ["pt", "eta", "phi", "mass"]]
+            variables += ["MET_pt", "MET_phi"]
+
+        return list(dict.fromkeys(variables))
+
+    def select(self, data_processor, i_events, report=None):
+        """
+        Returns events of i_events (numpy array of event indices) passing all cuts. Numbers of events passing and
+        failing each cut are added to the cutflow of the report, if it's given.
+        """
+        i_events = np.asarray(i_events, dtype=np.int64)
+        passed = np.ones(len(i_events), dtype=bool)
+
+        # missing jets give nan, which fails any comparison
+        with np.errstate(divide="ignore", invalid="ignore"):
+            namespace = self.get_namespace(data_processor, i_events)
+
+        for expression, (_, code) in zip(self.expressions, self.cuts):
+            try:
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    values = np.asarray(eval(code, {"__builtins__": {}}, namespace))
+            except Exception as error:
+                print("ERROR -- couldn't evaluate selection ", expression, ": ", error)
+                exit()
+
+            if values.dtype != bool or values.shape != passed.shape:
+                print("ERROR -- selection ", expression, " doesn't give a boolean value for each event, but: ",
+                      values.dtype, " array of shape ", values.shape)
+                exit()
+
+            n_before = int(np.sum(passed))
+            passed &= values
+
+            if report is not None:
+                report.add_cut(expression, int(np.sum(passed)), n_before - int(np.sum(passed)))
+
+        return i_events[passed]
+
+    def get_namespace(self, data_processor, i_events):
+        """
+        Returns dict with values of variables used by the cuts for given events.
+        """
+        namespace = dict(EventSelection.functions)
+
+        def get_event_values(variable):
+            values = data_processor.get_values_for_events(variable, i_events)
+
+            if values is None:
+                return np.full(len(i_events), np.nan)
+
+            # in Delphes event features like MET are stored in an array with just one element
+            if data_processor.get_array_n_dimensions(variable) == 2:
+                values = values[:, 0]
+
+            return np.asarray(ak.to_numpy(values), dtype=np.float64)
+
+        def get_jet_values(field):
+            values = data_processor.get_values_for_events(self.jet_prefix + "Jet_" + field, i_events)
+
+            if values is None and field == "mass":
+                values = data_processor.get_values_for_events(self.jet_prefix + "Jet_pt", i_events) * 0
+
+            return JetVariable(values)
+
+        for name, variable in EventSelection.event_variables.items():
+            if name in self.names:
+                namespace[name] = get_event_values(variable)
+
+        for name, field in EventSelection.jet_variables.items():
+            if name in self.names:
+                namespace[name] = get_jet_values(field)
+
+        if "nJets" in self.names:
+            namespace["nJets"] = ak.to_numpy(ak.num(get_jet_values("pt").values, axis=1))
+
+        if any(name in self.names for name in EventSelection.dijet_variables):
+            leading = [Kinematics.get_four_vectors(*[get_jet_values(field)[i_jet]
+                                                     for field in ["pt", "eta", "phi", "mass"]])
+                       for i_jet in range(2)]
+            dijet_vector = [leading[0][i] + leading[1][i] for i in range(4)]
+
+            namespace["Mjj"] = Kinematics.get_mass(*dijet_vector)
+            namespace["MT"] = Kinematics.get_transverse_mass(*dijet_vector, get_event_values("MET_pt"),
+                                                             get_event_values("MET_phi"))
+
+        return namespace
@@ -0,0 +1,263 @@
+import h5py
+import numpy as np
+
+from H5Writer import H5Writer
+from EFPSetCache import EFPSetCache
+from Kinematics import Kinematics
+
+
+class FeatureAugmenter:
+    """
+    Adds features calculated from jet constituents and jet features stored in existing h5 outputs of the converter,
+    so that they don't need to be reprocessed from ROOT files. Events are read in chunks and features of all jets
+    of a chunk are calculated at once:
+    - EFPs of requested degree, stored in 'jet_eflow_variables' (replacing existing ones, if allowed),
+    - jet features from constituents (ptD, axis2), stored in 'jet_augmented_features',
+    - event features from two leading jets (Mjj, MT), stored in 'event_augmented_features' (nan if one of them
+      is not stored, e.g. because it had no constituents).
+
+    Features of the last two groups are labelled with '_augmented' suffix, so that they can be loaded together with
+    the original ones. Note that only constituents stored in the file are used, so results differ from those of
+    the converter if jets had more than max_n_constituents constituents.
+    """
+
+    # features which can be added, with names of the output groups
+    jet_feature_names = ["PTD", "Axis2"]
+    event_feature_names = ["Mjj", "MT"]
+
+    output_names = {
+        "efps": "jet_eflow_variables",
+        "jet": "jet_augmented_features",
+        "event": "event_augmented_features",
+    }
+
+    label_suffix = "_augmented"
+
+    def __init__(self, efp_degree=-1, features=None, chunk_size=10000, efp_n_jobs=1, overwrite=False,
+                 efp_cache_dir=None, verbosity_level=1):
+        """
+        Args:
+            efp_degree (int): Degree of EFPs to calculate (-1 - EFPs are not calculated).
+            features (list): Names of jet and event features to calculate (see jet_feature_names and
+                             event_feature_names).
+            chunk_size (int): Number of events read and processed at once.
+            efp_n_jobs (int): Number of processes used to calculate EFPs (None - all CPUs).
+            overwrite (bool): If true, existing groups with the same names are replaced. Otherwise, it's an error.
+            efp_cache_dir (str): Directory with prepared EFP sets (see EFPSetCache).
+            verbosity_level (int): 0 - no output, 1 - basic output, 2 - detailed output.
+        """
+        self.efp_degree = efp_degree
+        self.features = [] if features is None else list(features)
+        self.chunk_size = chunk_size
+        self.efp_n_jobs = efp_n_jobs
+        self.overwrite = overwrite
+        self.verbosity_level = verbosity_level
+
+        for feature in self.features:
+            if feature not in FeatureAugmenter.jet_feature_names + FeatureAugmenter.event_feature_names:
+                print("ERROR -- unknown feature: ", feature)
+                exit()
+
+        self.jet_features = [name for name in FeatureAugmenter.jet_feature_names if name in self.features]
+        self.event_features = [name for name in FeatureAugmenter.event_feature_names if name in self.features]
+
+        self.efpset = None
+
+        if efp_degree >= 0:
+            self.efpset = EFPSetCache(efp_cache_dir, self.verbosity_level).get(efp_degree)
+
+    def augment(self, input_file_name, output_file_name=None):
+        """
+        Calculates requested features for all events of the input file. If output_file_name is None, new groups are
+        added to the input file. Otherwise, the output file is created with all groups of the input file, which
+        are not replaced, and the new ones.
+        """
+
+        in_place = output_file_name is None
+
+        new_groups = self.get_new_groups()
+
+        with h5py.File(input_file_name, "r") as input_file:
+            layout = FeatureAugmenter.get_layout(input_file["jet_features"]["data"])
+            existing_groups = list(input_file.keys())
+
+        for name in new_groups:
+            if name in existing_groups and not self.overwrite:
+                print("ERROR -- group ", name, " already exists in ", input_file_name, ", use overwrite to replace it")
+                exit()
+
+        writer = H5Writer(input_file_name if in_place else output_file_name, self.verbosity_level,
+                          mode="a" if in_place else "w", **layout)
+        input_file = writer.file if in_place else h5py.File(input_file_name, "r")
+
+        try:
+            for name in existing_groups:
+                if name in new_groups and in_place:
+                    del input_file[name]
+                elif name not in new_groups and not in_place:
+                    input_file.copy(input_file[name], writer.file, name)
+
+            self.add_sections_to_writer(writer, input_file["jet_features"]["data"].shape[1])
+
+            n_events = input_file["event_features"]["data"].shape[0]
+
+            for first in range(0, n_events, self.chunk_size):
+                last = min(first + self.chunk_size, n_events)
+
+                for name, data in self.process_chunk(input_file, first, last).items():
+                    writer.append(name, data)
+
+                if self.verbosity_level > 0:
+                    print("Augmented events: {0} / {1}".format(last, n_events))
+        finally:
+            if not in_place:
+                input_file.close()
+
+            writer.close()
+
+    def get_new_groups(self):
+        """
+        Returns names of groups which will be added to the output.
+        """
+        groups = []
+
+        if self.efpset is not None:
+            groups.append(FeatureAugmenter.output_names["efps"])
+        if len(self.jet_features) > 0:
+            groups.append(FeatureAugmenter.output_names["jet"])
+        if len(self.event_features) > 0:
+            groups.append(FeatureAugmenter.output_names["event"])
+
+        return groups
+
+    @staticmethod
+    def get_layout(dataset):
+        """
+        Returns H5Writer arguments which give new datasets the same type and compression as the given one.
+        """
+        return dict(dtype=dataset.dtype,
+                    compression=dataset.compression,
+                    compression_level=dataset.compression_opts,
+                    shuffle=dataset.shuffle,
+                    chunk_events=int(dataset.attrs["chunk_events"]) if "chunk_events" in dataset.attrs else None)
+
+    def add_sections_to_writer(self, writer, n_jets):
+        """
+        Adds sections for requested features to the h5 writer.
+        """
+        if self.efpset is not None:
+            writer.add_section(FeatureAugmenter.output_names["efps"],
+                               np.string_([str(i) for i in range(self.efpset.count())]), (n_jets, self.efpset.count()))
+            writer.set_attribute("efp_degree", self.efp_degree, section=FeatureAugmenter.output_names["efps"])
+
+        if len(self.jet_features) > 0:
+            writer.add_section(FeatureAugmenter.output_names["jet"],
+                               np.string_([name + FeatureAugmenter.label_suffix for name in self.jet_features]),
+                               (n_jets, len(self.jet_features)))
+
+        if len(self.event_features) > 0:
+            writer.add_section(FeatureAugmenter.output_names["event"],
+                               np.string_([name + FeatureAugmenter.label_suffix for name in self.event_features]),
+                               (len(self.event_features), ))
+
+    def process_chunk(self, input_file, first, last):
+        """
+        Returns dict with arrays of requested features for events in range [first, last), for each output group.
+        """
+        jet_features = FeatureAugmenter.get_columns(input_file["jet_features"], first, last)
+        n_events, n_jets = jet_features["Pt"].shape
+        outputs = {}
+
+        if self.efpset is not None or len(self.jet_features) > 0:
+            constituents, jet_index = FeatureAugmenter.get_flat_constituents(input_file["jet_constituents"],
+                                                                             first, last)
+
+        if self.efpset is not None:
+            outputs[FeatureAugmenter.output_names["efps"]] = self.get_EFPs(constituents, jet_index,
+                                                                           n_events, n_jets)
+
+        if len(self.jet_features) > 0:
+            values = {
+                "PTD": lambda: Kinematics.get_ptD(constituents["PT"], jet_index, n_events * n_jets),
+                "Axis2": lambda: Kinematics.get_axis2(constituents["PT"], constituents["Eta"], constituents["Phi"],
+                                                      jet_features["Eta"].ravel(), jet_features["Phi"].ravel(),
+                                                      jet_index),
+            }
+            outputs[FeatureAugmenter.output_names["jet"]] = np.stack([values[name]().reshape(n_events, n_jets)
+                                                                     for name in self.jet_features], axis=2)
+
+        if len(self.event_features) > 0:
+            event_features = FeatureAugmenter.get_columns(input_file["event_features"], first, last)
+
+            # sum of two leading jets (nan if there is only one)
+            has_jet = jet_features["Pt"][:, :2] != 0
+            dijet_vector = [np.where(np.all(has_jet, axis=1), np.sum(component, axis=1), np.nan) for component in
+                            Kinematics.get_four_vectors(jet_features["Pt"][:, :2], jet_features["Eta"][:, :2],
+                                                        jet_features["Phi"][:, :2], jet_features["M"][:, :2])]
+
+            values = {
+                "Mjj": lambda: Kinematics.get_mass(*dijet_vector),
+                "MT": lambda: Kinematics.get_transverse_mass(*dijet_vector, event_features["MET"],
+                                                             event_features["METPhi"]),
+            }
+            outputs[FeatureAugmenter.output_names["event"]] = np.stack([values[name]() for name
+                                                                       in self.event_features], axis=1)
+
+        return outputs
+
+    def get_EFPs(self, constituents, jet_index, n_events, n_jets):
+        """
+        Calculates EFPs of all jets with constituents at once and returns them as array of shape
+        (n_events, n_jets, n_EFPs), with zeros for jets without constituents.
+        """
+        efps = np.zeros((n_events * n_jets, self.efpset.count()))
+
+        # mass from energy and momentum, since it's not stored
+        momentum = constituents["PT"] * np.cosh(constituents["Eta"])
+        mass = np.sqrt(np.maximum(constituents["Energy"] ** 2 - momentum ** 2, 0))
+        ptyphims = np.stack((constituents["PT"], constituents["Rapidity"], constituents["Phi"], mass), axis=1)
+
+        counts = np.bincount(jet_index, minlength=n_events * n_jets)
+        has_constituents = counts > 0
+
+        if np.any(has_constituents):
+            jets_ptyphims = np.split(ptyphims, np.cumsum(counts)[:-1])
+            efps[has_constituents] = self.efpset.batch_compute([jets_ptyphims[i_jet] for i_jet
+                                                                in np.nonzero(has_constituents)[0]], self.efp_n_jobs)
+
+        return efps.reshape(n_events, n_jets, -1)
+
+    @staticmethod
+    def get_columns(group, first, last):
+        """
+        Returns dict with arrays of each labelled variable of the group for events in range [first, last).
+        """
+        data = group["data"][first:last]
+        labels = [label.decode() for label in group["labels"][()]]
+
+        return {label: data[..., i_label] for i_label, label in enumerate(labels)}
+
+    @staticmethod
+    def get_flat_constituents(group, first, last):
+        """
+        Returns dict with flat arrays of constituent variables (ordered by event, jet and constituent) for events in
+        range [first, last), and index of the jet of each constituent (counting jets of all events in the range).
+        Both padded and ragged constituents are supported.
+        """
+        labels = [label.decode() for label in group["labels"][()]]
+
+        if "offsets" in group:
+            offsets = group["offsets"][first:last]
+            counts = group["counts"][first:last]
+
+            first_row = int(offsets[counts > 0].min()) if np.any(counts > 0) else 0
+            data = group["data"][first_row:first_row + int(counts.sum())]
+            jet_index = np.repeat(np.arange(counts.size), counts.ravel())
+        else:
+            padded = group["data"][first:last]
+            is_filled = np.any(padded != 0, axis=3)
+            data = padded[is_filled]
+            i_events, i_jets, _ = np.nonzero(is_filled)
+            jet_index = i_events * padded.shape[1] + i_jets
+
+        return {label: data[:, i_label] for i_label, label in enumerate(labels)}, jet_index
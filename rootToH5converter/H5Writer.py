@@ -0,0 +1,225 @@
+import os
+import h5py
+import numpy as np
+
+
+class H5Writer:
+    """
+    Writes output sections (groups with 'data' and 'labels' datasets) to h5 file. Data can be appended in chunks of
+    events to resizable datasets, so that the whole output never needs to be kept in memory.
+    
+    Datasets are chunked in blocks of events and, for per-jet sections, separately for each jet, so that a range of
+    events and jets can be read without decompressing the other ones. Chunk layout is stored in 'chunk_events' and
+    'chunk_jets' attributes of each dataset.
+    
+    Sections can contain additional datasets next to 'data' (e.g. offsets and counts of ragged jet constituents).
+    Datasets with 'offsets_of' attribute contain row indices of the named dataset and are shifted accordingly when
+    files are appended.
+    """
+    
+    # target size of a single chunk, used if number of events per chunk is not specified
+    chunk_size_bytes = 256 * 1024
+
+    def __init__(self, output_file_name, verbosity_level=1, dtype=None, compression=None, compression_level=None,
+                 shuffle=False, chunk_events=None, mode="w"):
+        """
+        Creates output h5 file, making sure that the output directory exists and that the file name ends with h5.
+        
+        Args:
+            dtype: Type of stored data (e.g. np.float32). If None, type given for each section is used.
+            compression (str): Compression filter: None, "lzf" or "gzip".
+            compression_level (int): Level of gzip compression (0-9).
+            shuffle (bool): If true, byte-shuffle filter is applied before compression.
+            chunk_events (int): Number of events per chunk. If None, it's chosen to give chunks of about 256 kB.
+            mode (str): "w" to create new file, "a" to add sections to an existing one.
+        """
+        self.verbosity_level = verbosity_level
+        self.output_file_name = H5Writer.prepare_output_path(output_file_name)
+        
+        self.dtype = dtype
+        self.compression = compression
+        self.compression_level = compression_level if compression == "gzip" else None
+        self.shuffle = shuffle
+        self.chunk_events = chunk_events
+
+        if self.verbosity_level > 0:
+            print("\n\n=======================================================")
+            print("Saving h5 data to file: ", self.output_file_name)
+
+        self.file = h5py.File(self.output_file_name, mode)
+        self.datasets = {}
+
+    @staticmethod
+    def prepare_output_path(output_file_name):
+        """
+        Creates output directory if needed and returns file name with h5 extension.
+        """
+        path_directory = os.path.dirname(output_file_name)
+
+        if not os.path.exists(path_directory) and path_directory is not None and path_directory != '':
+            os.makedirs(path_directory)
+
+        if not output_file_name.endswith(".h5"):
+            output_file_name += ".h5"
+
+        return output_file_name
+
+    def get_chunk_shape(self, row_shape, dtype):
+        """
+        Returns chunk shape for rows (events) of given shape. Rows of more than one dimension are assumed to start
+        with the jet index and are chunked separately for each jet.
+        """
+        chunk_row_shape = (1,) + row_shape[1:] if len(row_shape) > 1 else row_shape
+        chunk_events = self.chunk_events
+        
+        if chunk_events is None:
+            row_size = np.dtype(dtype).itemsize * max(int(np.prod(chunk_row_shape)), 1)
+            chunk_events = max(1, H5Writer.chunk_size_bytes // row_size)
+        
+        return (chunk_events,) + chunk_row_shape
+
+    def add_section(self, name, labels, row_shape, dtype=np.float64):
+        """
+        Adds group with given name and labels, with an empty, resizable data set for rows of given shape. The dtype
+        of the layout only replaces floating point types.
+        """
+        section = self.file.create_group(name)
+        section.create_dataset('labels', data=labels)
+        
+        if self.dtype is not None and np.issubdtype(dtype, np.floating):
+            dtype = self.dtype
+        
+        self.datasets[name] = {}
+        self.add_dataset(name, 'data', row_shape, dtype)
+
+    def add_dataset(self, name, dataset_name, row_shape, dtype, offsets_of=None):
+        """
+        Adds empty, resizable data set for rows of given shape to the section with given name. If offsets_of is
+        specified, the data set contains row indices of that data set.
+        """
+        row_shape = tuple(row_shape)
+        chunks = self.get_chunk_shape(row_shape, dtype)
+        
+        dataset = self.file[name].create_dataset(dataset_name, shape=(0,) + row_shape, dtype=dtype,
+                                                 maxshape=(None,) + row_shape, chunks=chunks,
+                                                 compression=self.compression,
+                                                 compression_opts=self.compression_level, shuffle=self.shuffle)
+        dataset.attrs['chunk_events'] = chunks[0]
+        dataset.attrs['chunk_jets'] = chunks[1] if len(row_shape) > 1 else 0
+        
+        if offsets_of is not None:
+            dataset.attrs['offsets_of'] = offsets_of
+        
+        self.datasets[name][dataset_name] = dataset
+
+    def get_n_rows(self, name, dataset_name='data'):
+        """
+        Returns number of rows already written to given data set.
+        """
+        return self.datasets[name][dataset_name].shape[0]
+
+    def append(self, name, data, dataset_name='data'):
+        """
+        Appends rows to the data set of given section.
+        """
+        if len(data) == 0:
+            return
+
+        dataset = self.datasets[name][dataset_name]
+        n_rows = dataset.shape[0]
+        dataset.resize(n_rows + len(data), axis=0)
+        dataset[n_rows:] = data
+
+    def add_sections_from_file(self, input_file_name):
+        """
+        Adds sections with the same names, labels, data sets and attributes as in existing h5 file (e.g. one of
+        the shards).
+        """
+        with h5py.File(input_file_name, "r") as input_file:
+            for name in input_file.keys():
+                data = input_file[name]['data']
+                self.add_section(name, input_file[name]['labels'][()], data.shape[1:], data.dtype)
+                
+                for attribute, value in input_file[name].attrs.items():
+                    self.file[name].attrs[attribute] = value
+                
+                for dataset_name, dataset in input_file[name].items():
+                    if dataset_name in ['labels', 'data']:
+                        continue
+                    self.add_dataset(name, dataset_name, dataset.shape[1:], dataset.dtype,
+                                     dataset.attrs.get('offsets_of'))
+
+    def append_file(self, input_file_name, chunk_size=10000):
+        """
+        Appends data of all sections from existing h5 file, copying chunk_size rows at a time. Offsets are shifted
+        by the number of rows written before.
+        """
+        self.append_files([input_file_name], chunk_size)
+
+    def append_files(self, input_file_names, chunk_size=10000):
+        """
+        Appends data of all sections from existing h5 files, in the order of files. Rows are copied in blocks of
+        chunk_size rows regardless of file boundaries, so that the output doesn't depend on how the data was split
+        into files. Offsets are shifted by the number of rows written before.
+        """
+        input_files = [h5py.File(input_file_name, "r") for input_file_name in input_file_names]
+        
+        try:
+            for name, datasets in self.datasets.items():
+                n_rows = {dataset_name: self.get_n_rows(name, dataset_name) for dataset_name in datasets.keys()}
+                
+                for dataset_name, dataset in datasets.items():
+                    offsets_of = dataset.attrs.get('offsets_of')
+                    shift = 0 if offsets_of is None else n_rows[offsets_of]
+                    blocks = []
+                    
+                    for input_file in input_files:
+                        data = input_file[name][dataset_name]
+                        
+                        for i_first in range(0, data.shape[0], chunk_size):
+                            blocks.append(data[i_first:i_first + chunk_size] + shift)
+                            blocks = self.append_full_blocks(name, dataset_name, blocks, chunk_size)
+                        
+                        if offsets_of is not None:
+                            shift += input_file[name][offsets_of].shape[0]
+                    
+                    if len(blocks) > 0:
+                        self.append(name, np.concatenate(blocks), dataset_name)
+        finally:
+            for input_file in input_files:
+                input_file.close()
+
+    def append_full_blocks(self, name, dataset_name, blocks, chunk_size):
+        """
+        Appends as many full blocks of chunk_size rows as possible from the list of arrays and returns the remaining
+        rows (as a list of arrays).
+        """
+        n_rows = sum(len(block) for block in blocks)
+        
+        if n_rows < chunk_size:
+            return blocks
+        
+        rows = np.concatenate(blocks)
+        n_full = (n_rows // chunk_size) * chunk_size
+        
+        for i_first in range(0, n_full, chunk_size):
+            self.append(name, rows[i_first:i_first + chunk_size], dataset_name)
+        
+        return [rows[n_full:]] if n_full < n_rows else []
+
+    def set_attribute(self, name, value, section=None):
+        """
+        Sets attribute of the output file or of the given section.
+        """
+        target = self.file if section is None else self.file[section]
+        target.attrs[name] = value
+
+    def close(self):
+        """
+        Closes the output file.
+        """
+        self.file.close()
+
+        if self.verbosity_level > 0:
+            print("Successfully saved!")
+            print("=======================================================\n\n")
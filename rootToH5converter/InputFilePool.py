@@ -0,0 +1,188 @@
+import os
+import json
+import uproot
+from collections import OrderedDict
+
+from DataProcessor import InputTypes
+
+
+class InputFilePool:
+    """
+    Opens input ROOT files lazily, when their trees are needed, and keeps at most max_open_files of them open
+    (the least recently used one is closed when another file has to be opened), so that long input lists don't
+    exhaust file descriptors and memory.
+
+    Name of the tree, input type and number of entries of each file are found once and can be stored in a json
+    manifest, keyed on the path, size and modification time of the file. Files described in the manifest are not
+    opened at all until their events are converted.
+    """
+
+    # increase when format of the manifest changes, to invalidate old ones
+    version = 1
+
+    def __init__(self, max_open_files=64, manifest_path=None, verbosity_level=1):
+        """
+        Args:
+            max_open_files (int): Maximum number of files kept open at the same time.
+            manifest_path (str): Path of the json manifest with trees of input files (created if needed). If None,
+                                 trees are only remembered for the lifetime of the pool.
+            verbosity_level (int): 0 - no output, 1 - basic output, 2 - detailed output.
+        """
+        self.max_open_files = max(1, max_open_files)
+        self.manifest_path = manifest_path
+        self.verbosity_level = verbosity_level
+
+        self.open_files = OrderedDict()
+        self.manifest = {"version": InputFilePool.version, "files": {}}
+        self.manifest_changed = False
+
+        if manifest_path is not None and os.path.exists(manifest_path):
+            with open(manifest_path, "r") as manifest_file:
+                manifest = json.load(manifest_file)
+
+            if manifest.get("version") == InputFilePool.version:
+                self.manifest = manifest
+
+    def get_file(self, path):
+        """
+        Returns open file with given path, opening it (and closing the least recently used one) if needed.
+        """
+        if path in self.open_files:
+            self.open_files.move_to_end(path)
+            return self.open_files[path]
+
+        while len(self.open_files) >= self.max_open_files:
+            _, least_recently_used = self.open_files.popitem(last=False)
+            least_recently_used.close()
+
+        self.open_files[path] = uproot.open(path)
+
+        return self.open_files[path]
+
+    def get_tree(self, path):
+        """
+        Returns tree of the file with given path, or None if the file doesn't contain a known tree.
+        """
+        tree_name = self.get_tree_info(path)["tree"]
+
+        return None if tree_name is None else self.get_file(path)[tree_name]
+
+    def get_tree_info(self, path):
+        """
+        Returns dict with name of the tree, input type (name of InputTypes member) and number of entries of the file
+        with given path, from the manifest if the file didn't change, opening the file otherwise.
+        """
+        identity = InputFilePool.get_file_identity(path)
+        key = path if identity is None else os.path.abspath(path)
+        info = self.manifest["files"].get(key)
+
+        if info is not None and identity is not None and info["identity"] == identity:
+            return info
+
+        tree_name, input_type = InputFilePool.find_tree(self.get_file(path), self.verbosity_level)
+
+        info = {
+            "identity": identity,
+            "tree": tree_name,
+            "input_type": None if input_type is None else input_type.name,
+            "n_entries": 0 if tree_name is None else self.get_file(path)[tree_name].num_entries,
+        }
+
+        self.manifest["files"][key] = info
+        self.manifest_changed = True
+
+        return info
+
+    def get_input_type(self, path):
+        """
+        Returns input type of the file with given path (None if it doesn't contain a known tree).
+        """
+        input_type = self.get_tree_info(path)["input_type"]
+
+        return None if input_type is None else InputTypes[input_type]
+
+    def get_n_entries(self, path):
+        """
+        Returns number of entries of the tree in the file with given path.
+        """
+        return self.get_tree_info(path)["n_entries"]
+
+    @staticmethod
+    def get_file_identity(path):
+        """
+        Returns size and modification time of a local file, or None if they are not available (e.g. remote file),
+        in which case the file is not described by the manifest.
+        """
+        if not os.path.exists(path):
+            return None
+
+        stat = os.stat(path)
+
+        return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+    @staticmethod
+    def find_tree(file, verbosity_level=1):
+        """
+        Finds tree in the ROOT file and recognizes its type. Returns (tree name, input type) or (None, None) if no
+        known tree was found.
+        """
+        tree_name, input_type = None, None
+
+        for key in file.keys():
+            if key.startswith("Delphes"):
+                tree_name = "Delphes"
+                input_type = InputTypes.Delphes
+                if verbosity_level > 0:
+                    print("Adding Delphes tree")
+            elif key.startswith("Events"):
+                tree_name = key
+                branches = file[key].keys()
+
+                if "JetPFCandsAK4_jetIdx" in branches or "JetPFCandsAK8_jetIdx" in branches:
+                    input_type = InputTypes.PFnanoAOD106X
+                elif "FatJetPFCands_jetIdx" in branches:
+                    input_type = InputTypes.PFnanoAOD102X
+                elif "double_hltScoutingPFPacker_pfMetPhi_HLT2018." in branches:
+                    input_type = InputTypes.scoutingAtHlt
+                    if verbosity_level > 0:
+                        print("Adding scoutingAtHlt tree: ", key)
+                else:
+                    input_type = InputTypes.nanoAOD
+
+                if verbosity_level > 0:
+                    print("Adding nanoAOD tree: ", key)
+            else:
+                if verbosity_level > 0:
+                    print("Unknown tree type: ", key, ". Skipping...")
+
+        return tree_name, input_type
+
+    def save_manifest(self):
+        """
+        Writes the manifest if trees of new or changed files were found. The previous manifest is replaced only
+        when the new one is complete.
+        """
+        if self.manifest_path is None or not self.manifest_changed:
+            return
+
+        manifest_directory = os.path.dirname(self.manifest_path)
+
+        if manifest_directory != "":
+            os.makedirs(manifest_directory, exist_ok=True)
+
+        temporary_path = "{0}.{1}.tmp".format(self.manifest_path, os.getpid())
+
+        with open(temporary_path, "w") as manifest_file:
+            json.dump(self.manifest, manifest_file, indent=4)
+
+        os.replace(temporary_path, self.manifest_path)
+        self.manifest_changed = False
+
+    def close(self):
+        """
+        Closes all open files.
+        """
+        for file in self.open_files.values():
+            file.close()
+
+        self.open_files.clear()
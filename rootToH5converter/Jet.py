@@ -1,7 +1,8 @@
-import ROOT
 import numpy as np
 import energyflow as ef
 
+from Kinematics import Kinematics
+
 
 class Jet:
     
@@ -30,7 +31,8 @@ class Jet:
             self.neutralHadronEnergyFraction = self.n_neutral / n_total if n_total > 0 else -1
         # else there will be nans in the h5
     
-        self.constituents = []
+        # one row per constituent: pt, eta, phi, mass
+        self.constituents = np.zeros((0, 4))
         
     def print(self):
         """
@@ -40,11 +42,9 @@ class Jet:
         
     def get_four_vector(self):
         """
-        Returns ROOT TLorentzVector of the jet.
+        Returns four-vector (E, px, py, pz) of the jet.
         """
-        vector = ROOT.TLorentzVector()
-        vector.SetPtEtaPhiM (self.pt, self.eta, self.phi, self.mass)
-        return vector
+        return np.array(Kinematics.get_four_vectors(self.pt, self.eta, self.phi, self.mass))
 
     @staticmethod
     def get_feature_names():
@@ -63,9 +63,9 @@ class Jet:
             'Energy',
         ]
 
-    def get_features(self):
+    def get_features(self, substructure=True):
         """
-        Returns jet features.
+        Returns jet features. If substructure is not set, ptD and axis2 are not calculated and set to zero.
         """
         return [
             self.eta,
@@ -73,10 +73,10 @@ class Jet:
             self.pt,
             self.mass,
             self.chargedHadronEnergyFraction,
-            self.get_ptD(),
-            self.get_axis2(),
+            self.get_ptD() if substructure else 0,
+            self.get_axis2() if substructure else 0,
             self.flavor,
-            self.get_four_vector().E(),
+            self.get_four_vector()[0],
         ]
 
     @staticmethod
@@ -99,99 +99,42 @@ class Jet:
         """
         Calculates and returns the ptD variable based on the jet constutuents.
         """
-
-        sum_weight = 0
-        sum_pt = 0
-        
-        for i, c in enumerate(self.constituents):
-            sum_weight += c.Pt() ** 2
-            sum_pt += c.Pt()
-            
-        ptD = np.sqrt(sum_weight) / sum_pt if sum_weight > 0 else 0
-
-        return ptD
+        pt = self.constituents[:, 0]
+        return Kinematics.get_ptD(pt, np.zeros(len(pt), dtype=int), 1)[0]
 
     def get_axis2(self):
         """
         Calculates and returns the axis2 variable based on the jet constituents.
         """
-    
-        sum_weight = 0
-        sum_deta = 0
-        sum_dphi = 0
-        sum_deta2 = 0
-        sum_detadphi = 0
-        sum_dphi2 = 0
-    
-        for i, c in enumerate(self.constituents):
-            deta = c.Eta() - self.eta
-            dphi = c.DeltaPhi(self.get_four_vector())
-            weight = c.Pt() ** 2
-        
-            sum_weight += weight
-            sum_deta += deta * weight
-            sum_dphi += dphi * weight
-            sum_deta2 += deta * deta * weight
-            sum_detadphi += deta * dphi * weight
-            sum_dphi2 += dphi * dphi * weight
-    
-        a, b, c, ave_deta, ave_dphi, ave_deta2, ave_dphi2 = 0, 0, 0, 0, 0, 0, 0
-    
-        if sum_weight > 0.:
-            ave_deta = sum_deta / sum_weight
-            ave_dphi = sum_dphi / sum_weight
-            ave_deta2 = sum_deta2 / sum_weight
-            ave_dphi2 = sum_dphi2 / sum_weight
-            a = ave_deta2 - ave_deta * ave_deta
-            b = ave_dphi2 - ave_dphi * ave_dphi
-            c = -(sum_detadphi / sum_weight - ave_deta * ave_dphi)
-    
-        delta = np.sqrt(np.abs((a - b) * (a - b) + 4 * c * c))
-        axis2 = np.sqrt(0.5 * (a + b - delta)) if a + b - delta > 0 else 0
-    
-        return axis2
+        pt, eta, phi = self.constituents[:, 0], self.constituents[:, 1], self.constituents[:, 2]
+        return Kinematics.get_axis2(pt, eta, phi, np.array([self.eta]), np.array([self.phi]),
+                                    np.zeros(len(pt), dtype=int))[0]
 
-    def add_constituents(self, physObjects, pt_cut, delta_r, iJet=-1, track_jet_index=None, track_cand_index=None):
+    def add_constituents(self, objects, indices):
+        """
+        Adds constituents with given indices from array of (pt, eta, phi, mass) of a collection of objects.
         """
-        Adds constituents from physObjects collection, which pass the pt cut. If iJet and track_jet_index
-        are not specified, it will add constituents within delta_r. Otherwise, it will check jet index for each
-        constituent and add it only if it's the same as provided jet index iJet.
+        self.constituents = np.concatenate((self.constituents, objects[indices]))
+
+    def fill_constituents(self, tracks, neutral_hadrons, photons, track_indices, neutral_hadron_indices,
+                          photon_indices):
+        """
+        Fills collection of jet constituents with tracks, neutral hadrons and photons (arrays of pt, eta, phi, mass)
+        with given indices. Indices are found for all jets of the event at once, see Event.fill_jets.
         """
         
-        constituents = []
-
-        if iJet < 0:
-            for i, object in enumerate(physObjects):
-                if object.pt > pt_cut:
-                    vec = object.get_four_vector()
-                    
-                    delta_eta = object.eta - self.eta
-                    delta_phi = self.get_four_vector().DeltaPhi(vec)
-                    if delta_eta ** 2. + delta_phi ** 2. < delta_r ** 2.:
-                        constituents.append(vec)
-        else:
-            if track_cand_index is None:
-                for i, track in enumerate(physObjects):
-                    jet_index = track_jet_index[i]
-                    if jet_index == iJet:
-                        constituents.append(track.get_four_vector())
-            else:
-                cand_indices_for_jet = (track_jet_index == iJet)
-                cand_indices = track_cand_index[cand_indices_for_jet]
-                constituents = [track.get_four_vector() for itrack, track in enumerate(physObjects) if itrack in cand_indices]
-
-        self.constituents.extend(constituents)
-
-    def fill_constituents(self, tracks, neutral_hadrons, photons, delta_r, iJet, track_jet_index, track_cand_index):
-        """
-        Fills collection of jet constituents with tracks, neutral hadrons and photons. If iJet and track_jet_index
-        are not specified, it will add constituents within delta_r. Otherwise, it will check jet index for each
-        constituent and add it only if it's the same as provided jet index iJet.
+        self.add_constituents(tracks, track_indices)
+        self.add_constituents(neutral_hadrons, neutral_hadron_indices)
+        self.add_constituents(photons, photon_indices)
+
+    def get_EFP_inputs(self):
         """
+        Returns jet constituents in (pt, y, phi, m) coordinates, as expected by the EFP set.
+        """
+        
+        pt, eta, phi, mass = self.constituents.T
         
-        self.add_constituents(tracks, 0.1, delta_r, iJet, track_jet_index, track_cand_index)
-        self.add_constituents(neutral_hadrons, 0.5, delta_r)
-        self.add_constituents(photons, 0.2, delta_r)
+        return ef.utils.ptyphims_from_p4s(np.stack(Kinematics.get_four_vectors(pt, eta, phi, mass), axis=1))
 
     def get_EFPs(self, EFP_set):
         """
@@ -201,26 +144,22 @@ class Jet:
         if len(self.constituents) == 0:
             return
         
-        return EFP_set.compute(
-            ef.utils.ptyphims_from_p4s(
-                [(c.E(), c.Px(), c.Py(), c.Pz()) for c in self.constituents]
-            )
-        )
+        return EFP_set.compute(self.get_EFP_inputs())
 
     def get_constituents(self, max):
         """
-        Returns np array with all jet constituents, up to specified maximum. If there are less constituents than
-        specified max, remaining entries will be padded with zeros.
+        Returns np array with all jet constituents, up to specified maximum, ordered by decreasing pt. If there are
+        less constituents than specified max, remaining entries will be padded with zeros.
         """
     
-        constituents = -np.ones((len(self.constituents), len(Jet.get_constituent_feature_names())))
-        for i, c in enumerate(self.constituents):
-            delta_eta = c.Eta() - self.eta
-            delta_phi = self.get_four_vector().DeltaPhi(c)
-
-            constituents[i, :] = [c.Eta(), c.Phi(), c.Pt(), c.Rapidity(), c.E(), delta_eta, delta_phi]
+        pt, eta, phi, mass = self.constituents[Kinematics.get_leading_indices(self.constituents[:, 0], max)].T
+        energy, px, py, pz = Kinematics.get_four_vectors(pt, eta, phi, mass)
+        
+        delta_eta = eta - self.eta
+        delta_phi = Kinematics.get_delta_phi(self.phi, phi)
 
-        constituents = constituents[np.argsort(constituents[:, 2]), :][::-1][:max, :]
+        constituents = np.stack((eta, phi, pt, Kinematics.get_rapidity(energy, pz), energy, delta_eta, delta_phi),
+                                axis=1)
         constituents = np.pad(constituents, ((0, max - constituents.shape[0]), (0, 0)), 'constant')
     
         return constituents
@@ -0,0 +1,126 @@
+import numpy as np
+
+
+class Kinematics:
+    """
+    NumPy replacement for the TLorentzVector operations used by the converter. All methods work on scalars as well
+    as on arrays, so that whole collections of jets or constituents can be processed at once.
+    """
+
+    @staticmethod
+    def get_four_vectors(pt, eta, phi, mass):
+        """
+        Returns (E, px, py, pz) for given pt, eta, phi and mass, following TLorentzVector.SetPtEtaPhiM. Inputs are
+        converted to double precision (branches are often stored as float32), like in TLorentzVector.
+        """
+        pt, eta, phi, mass = [np.asarray(value, dtype=np.float64) for value in (pt, eta, phi, mass)]
+        pt = np.abs(pt)
+        px = pt * np.cos(phi)
+        py = pt * np.sin(phi)
+        pz = pt * np.sinh(eta)
+        p2 = px * px + py * py + pz * pz
+        energy = np.where(mass >= 0, np.sqrt(p2 + mass * mass), np.sqrt(np.maximum(p2 - mass * mass, 0)))
+
+        return energy, px, py, pz
+
+    @staticmethod
+    def get_pt(px, py):
+        """
+        Returns transverse momentum for given px and py.
+        """
+        return np.sqrt(px * px + py * py)
+
+    @staticmethod
+    def get_rapidity(energy, pz):
+        """
+        Returns rapidity for given energy and pz.
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return 0.5 * np.log((energy + pz) / (energy - pz))
+
+    @staticmethod
+    def get_mass(energy, px, py, pz):
+        """
+        Returns invariant mass of given four-vectors, negative for space-like vectors like in TLorentzVector.M().
+        """
+        m2 = energy * energy - px * px - py * py - pz * pz
+        return np.where(m2 < 0, -np.sqrt(np.abs(m2)), np.sqrt(np.abs(m2)))
+
+    @staticmethod
+    def get_delta_phi(phi_1, phi_2):
+        """
+        Returns phi_1 - phi_2 wrapped to [-pi, pi), like in TLorentzVector.DeltaPhi().
+        """
+        return (phi_1 - phi_2 + np.pi) % (2 * np.pi) - np.pi
+
+    @staticmethod
+    def get_transverse_mass(energy, px, py, pz, met_pt, met_phi):
+        """
+        Returns transverse mass of the system with given four-vector (e.g. sum of two leading jets) and MET.
+        """
+        met_pt, met_phi = np.asarray(met_pt, dtype=np.float64), np.asarray(met_phi, dtype=np.float64)
+        met_px = met_pt * np.cos(met_phi)
+        met_py = met_pt * np.sin(met_phi)
+
+        Mjj = Kinematics.get_mass(energy, px, py, pz)
+        Mjj2 = Mjj * Mjj
+        ptjj2 = px * px + py * py
+        ptMet = px * met_px + py * met_py
+
+        return np.sqrt(Mjj2 + 2. * (np.sqrt(Mjj2 + ptjj2) * met_pt - ptMet))
+
+    @staticmethod
+    def get_ptD(pt, jet_index, n_jets):
+        """
+        Returns ptD of n_jets jets, given pt of their constituents and index of the jet of each constituent.
+        """
+        sum_weight = np.bincount(jet_index, pt ** 2, minlength=n_jets)
+        sum_pt = np.bincount(jet_index, pt, minlength=n_jets)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(sum_weight > 0, np.sqrt(sum_weight) / sum_pt, 0)
+
+    @staticmethod
+    def get_axis2(pt, eta, phi, jet_eta, jet_phi, jet_index):
+        """
+        Returns axis2 of jets with given eta and phi, given pt, eta and phi of their constituents and index of the
+        jet of each constituent.
+        """
+        n_jets = len(jet_eta)
+        delta_eta = eta - jet_eta[jet_index]
+        delta_phi = Kinematics.get_delta_phi(phi, jet_phi[jet_index])
+        weight = pt ** 2
+
+        def weighted_average(values):
+            return np.bincount(jet_index, values * weight, minlength=n_jets) / sum_weight
+
+        sum_weight = np.bincount(jet_index, weight, minlength=n_jets)
+        has_weight = sum_weight > 0
+        sum_weight = np.where(has_weight, sum_weight, 1)
+
+        ave_deta = weighted_average(delta_eta)
+        ave_dphi = weighted_average(delta_phi)
+        ave_deta2 = weighted_average(delta_eta * delta_eta)
+        ave_dphi2 = weighted_average(delta_phi * delta_phi)
+
+        a = np.where(has_weight, ave_deta2 - ave_deta * ave_deta, 0)
+        b = np.where(has_weight, ave_dphi2 - ave_dphi * ave_dphi, 0)
+        c = np.where(has_weight, -(weighted_average(delta_eta * delta_phi) - ave_deta * ave_dphi), 0)
+
+        delta = np.sqrt(np.abs((a - b) * (a - b) + 4 * c * c))
+
+        with np.errstate(invalid="ignore"):
+            return np.where(a + b - delta > 0, np.sqrt(0.5 * (a + b - delta)), 0)
+
+    @staticmethod
+    def get_leading_indices(pt, n):
+        """
+        Returns indices of up to n entries with the highest pt, ordered by decreasing pt. Uses partial sort, so only
+        the selected entries get fully sorted.
+        """
+        if len(pt) > n:
+            indices = np.argpartition(-pt, n - 1)[:n]
+        else:
+            indices = np.arange(len(pt))
+
+        return indices[np.argsort(-pt[indices], kind="stable")]
@@ -0,0 +1,98 @@
+from Converter import Converter
+from ChunkReader import ChunkReader
+from DataProcessor import DataProcessor
+from InputFilePool import InputFilePool
+
+
+class MultiConverter:
+    """
+    Produces outputs of a few converter configurations (e.g. AK4 and AK8 jets, different numbers of constituents
+    or EFP degrees) in a single pass over the input trees. Each chunk of entries is read once, with branches needed
+    by any of the configurations, and converted by a Converter of each configuration, which only sees branches it
+    would read on its own (see DataProcessor.get_view), so that its output is the same as in a separate run.
+    Input files, selections and chunking are also shared. Cache and journal of the converters are not used.
+    """
+
+    def __init__(self, input_path, configurations, selections=None, chunk_size=10000, max_open_files=64,
+                 tree_manifest_path=None, verbosity_level=1, **common_args):
+        """
+        Args:
+            input_path (str): Path to text file with ROOT files' paths and selected events (see Converter).
+            configurations (list): Dicts with Converter arguments of each configuration (e.g. use_fat_jets,
+                                   max_n_constituents or efp_degree). Missing arguments are taken from common_args.
+            selections (dict): Selected events for each ROOT file path, used instead of input_path if given.
+            chunk_size (int): Number of tree entries read at once.
+            max_open_files (int): Maximum number of input files open at the same time (see InputFilePool).
+            tree_manifest_path (str): Path of the json manifest with trees of input files (see InputFilePool).
+            verbosity_level (int): 0 - no output, 1 - basic output, 2 - detailed output.
+            common_args: Converter arguments common to all configurations.
+        """
+        self.verbosity_level = verbosity_level
+        self.converters = []
+        self.file_pool = InputFilePool(max_open_files, tree_manifest_path, verbosity_level)
+
+        for configuration in configurations:
+            converter_args = dict(common_args)
+            converter_args.update(configuration)
+            converter_args.update(selections=selections, chunk_size=chunk_size, verbosity_level=verbosity_level,
+                                  cache_dir=None, journal_chunks=0, file_pool=self.file_pool)
+
+            self.converters.append(Converter(input_path=input_path, **converter_args))
+
+    def convert(self, output_file_names=None):
+        """
+        Reads all selected events once and converts them with each configuration. If output_file_names (one for
+        each configuration) are given, chunks are appended to the output files right away, otherwise they are
+        stored in output arrays of the converters (see save()).
+        """
+        if output_file_names is None:
+            output_file_names = [None] * len(self.converters)
+
+        for converter, output_file_name in zip(self.converters, output_file_names):
+            converter.prepare_outputs(output_file_name)
+
+        reference = self.converters[0]
+
+        for file_name, input_type in reference.input_types.items():
+            if self.verbosity_level > 0:
+                print("\n\n=======================================================")
+                print("Loading events from file: ", file_name)
+                print("Input type was recognised to be: ", input_type)
+
+            variables = [converter.get_required_variables(input_type, converter.columnar)
+                         for converter in self.converters]
+
+            data_processor = DataProcessor(self.file_pool.get_tree(file_name), input_type, preload=False,
+                                           variables=set().union(*variables),
+                                           decompression_executor=reference.decompression_executor,
+                                           interpretation_executor=reference.interpretation_executor)
+
+            if self.verbosity_level > 1:
+                print("Branches to be read: ", list(data_processor.branch_names.values()))
+
+            chunks = reference.get_chunks(file_name, data_processor.get_entry_offsets())
+
+            # the same read is used by all configurations, so it's added to each of their reports
+            reader = ChunkReader(data_processor, chunks, reference.prefetch,
+                                 reports=[converter.report for converter in self.converters])
+
+            for entry_start, entry_stop, i_events in reader:
+                for converter, converter_variables in zip(self.converters, variables):
+                    converter.convert_chunk(file_name, input_type, data_processor.get_view(converter_variables),
+                                            i_events)
+
+                reference.report.print_progress(reference.n_events - 1)
+
+            if self.verbosity_level > 0:
+                for converter in self.converters:
+                    print("Total jets without constituents: ", converter.n_jets_without_constituents)
+
+        for converter in self.converters:
+            converter.finish_outputs()
+
+    def save(self, output_file_names, output_format="h5"):
+        """
+        Saves outputs of each configuration, stored in output arrays, to the corresponding output file.
+        """
+        for converter, output_file_name in zip(self.converters, output_file_names):
+            converter.save(output_file_name, output_format)
@@ -0,0 +1,31 @@
+import numpy as np
+
+
+class PFCandidateClassifier:
+    """
+    Splits PF candidates into charged candidates (tracks), photons and neutral hadrons based on their PDG IDs.
+    Works on arrays of PDG IDs, so that candidates of a whole event or chunk of events are classified at once.
+    """
+
+    photon_ids = [22]
+    neutral_hadron_ids = [111, 130, 310]
+    charged_ids = [211, 11, 13]
+
+    # IDs which appear in PF candidates, but are neither of the above (kept as tracks without a warning)
+    weird_ids = [1, 2]
+
+    @staticmethod
+    def classify(pid):
+        """
+        Returns masks of photons, neutral hadrons and candidates with unrecognized PDG ID, for given PDG IDs.
+        Candidates which are not photons nor neutral hadrons (including unrecognized ones) stay tracks.
+        """
+        pid = np.asarray(pid)
+        abs_pid = np.abs(pid)
+
+        is_photon = np.isin(pid, PFCandidateClassifier.photon_ids)
+        is_neutral_hadron = np.isin(pid, PFCandidateClassifier.neutral_hadron_ids)
+        is_unrecognized = ~(is_photon | is_neutral_hadron |
+                            np.isin(abs_pid, PFCandidateClassifier.charged_ids + PFCandidateClassifier.weird_ids))
+
+        return is_photon, is_neutral_hadron, is_unrecognized
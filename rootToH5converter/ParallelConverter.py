@@ -0,0 +1,205 @@
+import os
+import json
+import numpy as np
+from multiprocessing import Pool
+
+from Converter import Converter
+from H5Writer import H5Writer
+from InputFilePool import InputFilePool
+from ConversionReport import ConversionReport
+
+
+def convert_shard(shard):
+    """
+    Converts one shard (dict with selected events for each ROOT file path) to its own h5 file. Defined at the module
+    level, so that it can be sent to worker processes. Returns output file name and number of stored events.
+    """
+    selections, output_file_name, converter_args = shard
+
+    converter = Converter(input_path=None, selections=selections, **converter_args)
+    converter.convert(output_file_name=output_file_name)
+
+    return output_file_name, converter.total_count
+
+
+class ParallelConverter:
+    """
+    Converts one or more input lists with a pool of worker processes. Selected events of each input list are split
+    into contiguous shards, each converted to its own h5 file. Shards are then merged into the final output file
+    (or listed in a json manifest), keeping the same order of events as a single-process conversion.
+    """
+
+    def __init__(self, n_workers, converter_args, merge=True, verbosity_level=1):
+        """
+        Args:
+            n_workers (int): Number of worker processes (and maximum number of shards per input list).
+            converter_args (dict): Arguments passed to the Converter of each shard (except input/selections).
+            merge (bool): If true, shards are merged into output file and removed. Otherwise, manifest is written.
+            verbosity_level (int): 0 - no output, 1 - basic output, 2 - detailed output.
+        """
+        self.n_workers = max(1, n_workers)
+        self.converter_args = dict(converter_args)
+        self.merge = merge
+        self.verbosity_level = verbosity_level
+        
+        # worker processes cannot start their own pools for the EFP calculation
+        if self.n_workers > 1 and self.converter_args.get("efp_n_jobs", 1) != 1:
+            if self.verbosity_level > 0:
+                print("WARNING -- EFPs will be calculated with a single process in each worker")
+            self.converter_args["efp_n_jobs"] = 1
+
+    @staticmethod
+    def get_output_paths(input_paths, output_path):
+        """
+        Returns output file name for each input list. For a single input list, it's just the output path. For many,
+        output path is a directory and files are named after input lists (without '.txt' and '_selection').
+        """
+        if len(input_paths) == 1:
+            return [output_path]
+
+        output_paths = []
+
+        for input_path in input_paths:
+            name = os.path.basename(input_path)
+            name = name[:-len(".txt")] if name.endswith(".txt") else name
+            name = name[:-len("_selection")] if name.endswith("_selection") else name
+            output_paths.append(os.path.join(output_path, name + ".h5"))
+
+        return output_paths
+
+    def get_selections(self, input_path):
+        """
+        Reads input list and replaces -1 (all events) with indices of all entries in the tree.
+        """
+        selections = Converter.read_input_list(input_path)
+
+        manifest_path = self.converter_args.get("tree_manifest_path")
+        if manifest_path is None and self.converter_args.get("cache_dir") is not None:
+            manifest_path = os.path.join(self.converter_args["cache_dir"], "trees.json")
+
+        # numbers of entries are taken from the manifest, which is then shared by the workers
+        file_pool = InputFilePool(self.converter_args.get("max_open_files", 64), manifest_path, verbosity_level=0)
+
+        for path, selection in selections.items():
+            if len(selection) == 1 and selection[0] == -1:
+                selections[path] = np.arange(file_pool.get_n_entries(path))
+
+        file_pool.save_manifest()
+        file_pool.close()
+
+        return selections
+
+    def split_into_shards(self, selections):
+        """
+        Splits selected events of all files into at most n_workers contiguous shards with similar numbers of events.
+        Returns list of dicts with selected events for each ROOT file path.
+        """
+        n_all_events = sum(map(len, selections.values()))
+        n_shards = max(1, min(self.n_workers, n_all_events))
+        bounds = [int(round(n_all_events * i_shard / n_shards)) for i_shard in range(n_shards + 1)]
+
+        shards = [{} for _ in range(n_shards)]
+        first_event = 0
+
+        for path, selection in selections.items():
+            for i_shard in range(n_shards):
+                first = max(bounds[i_shard], first_event) - first_event
+                last = min(bounds[i_shard + 1], first_event + len(selection)) - first_event
+
+                if last > first:
+                    shards[i_shard][path] = selection[first:last]
+
+            first_event += len(selection)
+
+        return shards
+
+    def convert(self, input_paths, output_paths):
+        """
+        Converts all input lists to corresponding output files, processing shards of all of them in parallel.
+        Reports of all shards of each output are combined into a single report saved next to it.
+        """
+        shards = []
+        outputs = []
+        reports = {}
+
+        for input_path, output_path in zip(input_paths, output_paths):
+            output_path = H5Writer.prepare_output_path(output_path)
+            shard_paths = []
+
+            all_selections = self.get_selections(input_path)
+            
+            # file ids in the event index of all shards refer to the whole input list
+            shard_args = dict(self.converter_args, file_table=list(all_selections.keys()))
+
+            for i_shard, selections in enumerate(self.split_into_shards(all_selections)):
+                shard_path = "{0}_shard{1}.h5".format(output_path[:-len(".h5")], i_shard)
+                shards.append((selections, shard_path, shard_args))
+                shard_paths.append(shard_path)
+
+            outputs.append((output_path, shard_paths))
+            reports[output_path] = ConversionReport(self.verbosity_level)
+
+        if self.verbosity_level > 0:
+            print("Converting {0} shard(s) with {1} worker(s)".format(len(shards), self.n_workers))
+
+        if self.n_workers == 1:
+            n_events = dict(map(convert_shard, shards))
+        else:
+            with Pool(self.n_workers) as pool:
+                n_events = dict(pool.imap(convert_shard, shards, chunksize=1))
+
+        for output_path, shard_paths in outputs:
+            report = reports[output_path]
+            
+            with report.measure("merge", count=sum(n_events[shard_path] for shard_path in shard_paths)):
+                if self.merge:
+                    self.merge_shards(shard_paths, output_path)
+                else:
+                    self.write_manifest(shard_paths, n_events, output_path)
+            
+            self.merge_reports(shard_paths, report)
+            report.save(output_path)
+
+    def merge_shards(self, shard_paths, output_path):
+        """
+        Merges shards into the output file, in the order of shards, and removes them.
+        """
+        writer = H5Writer(output_path, self.verbosity_level, **(self.converter_args.get("h5_layout") or {}))
+        writer.add_sections_from_file(shard_paths[0])
+        writer.append_files(shard_paths)
+
+        writer.close()
+
+        for shard_path in shard_paths:
+            os.remove(shard_path)
+
+    def merge_reports(self, shard_paths, report):
+        """
+        Adds reports of given shards to the report of the output. Reports of merged shards are removed.
+        """
+        for shard_path in shard_paths:
+            shard_report_path = ConversionReport.get_path(shard_path)
+            
+            with open(shard_report_path, "r") as shard_report_file:
+                report.add_report(json.load(shard_report_file))
+            
+            if self.merge:
+                os.remove(shard_report_path)
+
+    def write_manifest(self, shard_paths, n_events, output_path):
+        """
+        Writes json manifest listing shards (relative to the manifest location) in the order of events.
+        """
+        manifest_path = output_path[:-len(".h5")] + "_manifest.json"
+
+        manifest = {
+            "n_events": sum(n_events[shard_path] for shard_path in shard_paths),
+            "shards": [{"path": os.path.basename(shard_path), "n_events": n_events[shard_path]}
+                       for shard_path in shard_paths],
+        }
+
+        with open(manifest_path, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=4)
+
+        if self.verbosity_level > 0:
+            print("Shards manifest saved to: ", manifest_path)
@@ -0,0 +1,210 @@
+import os
+import json
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class ParquetWriter:
+    """
+    Writes converted events as a columnar Parquet dataset: a directory with 'events.parquet' (one row per event) and
+    'jets.parquet' (one row per stored jet). Both tables have 'event_id' column (index of the event in the output),
+    so that jets can be matched with their events, and jets also have 'jet_index' (position of the jet in the event).
+    Each feature is a separate column (named after its label, EFPs as 'EFP_<i>' and constituent features as
+    'constituent_<label>' lists), so that readers can load only the columns they need.
+
+    Rows are written in row groups of row_group_events events, so that row groups can be skipped by readers based on
+    their statistics (e.g. range of event ids or jet pt). If the event index is given, events also have 'file_id'
+    and 'entry' columns with the source of each event, and paths of input files (in order of their ids) are stored
+    as json in 'files' metadata of the events table. Empty jets (with all features equal to zero, as used for
+    padding in h5 outputs) are not stored.
+    """
+
+    # number of events per row group, used if not specified
+    default_row_group_events = 10000
+
+    def __init__(self, output_path, event_labels, jet_labels, efp_labels=None, constituent_labels=None,
+                 verbosity_level=1, dtype=None, compression="snappy", compression_level=None, row_group_events=None,
+                 files=None):
+        """
+        Creates output directory, named like the output path with parquet extension.
+
+        Args:
+            event_labels, jet_labels, efp_labels, constituent_labels (list): Names of event features, jet features,
+                EFPs and constituent features. EFPs and constituents are not stored if their labels are None.
+            dtype: Type of stored features (e.g. np.float32). If None, float64 is used.
+            compression (str): Parquet compression codec (e.g. "snappy", "gzip", "zstd") or None.
+            compression_level (int): Level of compression, for codecs which support it.
+            row_group_events (int): Number of events per row group of both tables.
+            files (list): Paths of input files, in order of their ids in the event index.
+        """
+        self.verbosity_level = verbosity_level
+        self.output_path = ParquetWriter.prepare_output_path(output_path)
+
+        self.labels = {
+            "events": ParquetWriter.decode_labels(event_labels),
+            "jets": ParquetWriter.decode_labels(jet_labels),
+            "efps": None if efp_labels is None else ["EFP_" + label for label in
+                                                     ParquetWriter.decode_labels(efp_labels)],
+            "constituents": None if constituent_labels is None else
+            ["constituent_" + label for label in ParquetWriter.decode_labels(constituent_labels)],
+        }
+
+        self.dtype = np.dtype(np.float64 if dtype is None else dtype)
+        self.compression = "none" if compression is None else compression
+        self.compression_level = compression_level
+        self.row_group_events = ParquetWriter.default_row_group_events if row_group_events is None else row_group_events
+        self.files = None if files is None else [str(path) for path in files]
+
+        self.n_events = 0
+        self.writers = {}
+
+        if self.verbosity_level > 0:
+            print("\n\n=======================================================")
+            print("Saving parquet data to directory: ", self.output_path)
+
+    @staticmethod
+    def prepare_output_path(output_path):
+        """
+        Creates output directory and returns its path, with parquet extension instead of h5.
+        """
+        if output_path.endswith(".h5"):
+            output_path = output_path[:-len(".h5")]
+
+        if not output_path.endswith(".parquet"):
+            output_path += ".parquet"
+
+        os.makedirs(output_path, exist_ok=True)
+
+        return output_path
+
+    @staticmethod
+    def decode_labels(labels):
+        """
+        Returns labels as str (the converter stores them as bytes for h5).
+        """
+        return [label.decode() if isinstance(label, bytes) else str(label) for label in labels]
+
+    def append(self, event_features, jet_features, efps=None, constituents=None, constituent_counts=None,
+               event_index=None):
+        """
+        Appends events to both tables.
+
+        Args:
+            event_features (np.ndarray): Array of shape (n_events, n_event_features).
+            jet_features (np.ndarray): Array of shape (n_events, n_jets, n_jet_features).
+            efps (np.ndarray): Array of shape (n_events, n_jets, n_efps).
+            constituents (np.ndarray): Flat table of constituents of all jets, ordered by event and jet
+                                       (see Converter.to_ragged).
+            constituent_counts (np.ndarray): Number of constituents of each jet, of shape (n_events, n_jets).
+            event_index (np.ndarray): File id and entry number of each event, of shape (n_events, 2).
+        """
+        n_events = len(event_features)
+
+        if constituents is not None:
+            # first row of the flat table of constituents for each event
+            event_offsets = np.concatenate([[0], np.cumsum(constituent_counts.sum(axis=1))])
+
+        for first in range(0, n_events, self.row_group_events):
+            last = min(first + self.row_group_events, n_events)
+            block = slice(first, last)
+
+            if constituents is None:
+                block_constituents, block_counts = None, None
+            else:
+                block_constituents = constituents[event_offsets[first]:event_offsets[last]]
+                block_counts = constituent_counts[block]
+
+            self.write_table("events", self.get_events_table(event_features[block], jet_features[block],
+                                                             None if event_index is None else event_index[block]))
+            self.write_table("jets", self.get_jets_table(jet_features[block],
+                                                         None if efps is None else efps[block],
+                                                         block_constituents, block_counts))
+            self.n_events += last - first
+
+    def get_events_table(self, event_features, jet_features, event_index=None):
+        """
+        Returns table of events, with event id, source of the event (if event index is given), features and number
+        of stored jets.
+        """
+        columns = {"event_id": pa.array(self.n_events + np.arange(len(event_features), dtype=np.int64))}
+
+        if event_index is not None:
+            columns["file_id"] = pa.array(event_index[:, 0].astype(np.int32))
+            columns["entry"] = pa.array(event_index[:, 1].astype(np.int64))
+
+        for i_feature, label in enumerate(self.labels["events"]):
+            columns[label] = pa.array(event_features[:, i_feature].astype(self.dtype))
+
+        columns["n_jets"] = pa.array(np.any(jet_features != 0, axis=2).sum(axis=1).astype(np.int32))
+
+        metadata = None if self.files is None else {"files": json.dumps(self.files)}
+
+        return pa.table(columns, metadata=metadata)
+
+    def get_jets_table(self, jet_features, efps=None, constituents=None, constituent_counts=None):
+        """
+        Returns table of non-empty jets, with event id, jet index, features, EFPs and lists of constituent features.
+        """
+        is_filled = np.any(jet_features != 0, axis=2)
+        i_events, i_jets = np.nonzero(is_filled)
+
+        columns = {
+            "event_id": pa.array(self.n_events + i_events.astype(np.int64)),
+            "jet_index": pa.array(i_jets.astype(np.int32)),
+        }
+
+        filled_features = jet_features[is_filled].astype(self.dtype)
+
+        for i_feature, label in enumerate(self.labels["jets"]):
+            columns[label] = pa.array(filled_features[:, i_feature])
+
+        if efps is not None and self.labels["efps"] is not None:
+            filled_efps = efps[is_filled].astype(self.dtype)
+
+            for i_efp, label in enumerate(self.labels["efps"]):
+                columns[label] = pa.array(filled_efps[:, i_efp])
+
+        if constituents is not None and self.labels["constituents"] is not None:
+            counts = constituent_counts[is_filled]
+            kept = np.repeat(is_filled.ravel(), constituent_counts.ravel())
+            offsets = pa.array(np.concatenate([[0], np.cumsum(counts)]).astype(np.int32))
+            filled_constituents = constituents[kept].astype(self.dtype)
+
+            for i_feature, label in enumerate(self.labels["constituents"]):
+                columns[label] = pa.ListArray.from_arrays(offsets, pa.array(filled_constituents[:, i_feature]))
+
+        return pa.table(columns)
+
+    def write_table(self, name, table):
+        """
+        Writes table as a single row group of the given output table, opening the file if needed.
+        """
+        if name not in self.writers:
+            self.writers[name] = pq.ParquetWriter(os.path.join(self.output_path, name + ".parquet"), table.schema,
+                                                  compression=self.compression,
+                                                  compression_level=self.compression_level)
+
+        self.writers[name].write_table(table, row_group_size=max(table.num_rows, 1))
+
+    def close(self):
+        """
+        Closes output files. Empty tables are written if nothing was appended.
+        """
+        if len(self.writers) == 0:
+            n_features = {name: 0 if labels is None else len(labels) for name, labels in self.labels.items()}
+            jet_features = np.empty((0, 0, n_features["jets"]))
+
+            event_index = None if self.files is None else np.empty((0, 2), dtype=np.int64)
+
+            self.write_table("events", self.get_events_table(np.empty((0, n_features["events"])), jet_features,
+                                                             event_index))
+            self.write_table("jets", self.get_jets_table(jet_features, np.empty((0, 0, n_features["efps"])),
+                                                         np.empty((0, n_features["constituents"])),
+                                                         np.empty((0, 0), dtype=np.int64)))
+
+        for writer in self.writers.values():
+            writer.close()
+
+        if self.verbosity_level > 0:
+            print("Successfully saved ", self.n_events, " events to: ", self.output_path)
@@ -1,4 +1,6 @@
-import ROOT
+import numpy as np
+
+from Kinematics import Kinematics
 
 
 class PhysObject:
@@ -16,8 +18,6 @@ class PhysObject:
         
     def get_four_vector(self):
         """
-        Returns ROOT TLorentzVector corresponding to this physics object.
+        Returns four-vector (E, px, py, pz) corresponding to this physics object.
         """
-        vector = ROOT.TLorentzVector()
-        vector.SetPtEtaPhiM(self.pt, self.eta, self.phi, self.mass)
-        return vector
+        return np.array(Kinematics.get_four_vectors(self.pt, self.eta, self.phi, self.mass))
@@ -0,0 +1,271 @@
+import numpy as np
+import awkward as ak
+import uproot
+
+from DataProcessor import DataProcessor, InputTypes
+
+
+class SyntheticTreeWriter:
+    """
+    Writes ROOT files with synthetic events, with the branch layout that DataProcessor.variables declares for each
+    input type, so that the converter can be run (e.g. benchmarked) without real samples. Jets have random
+    kinematics and are ordered by pt, candidates (tracks, neutral hadrons and photons) are partly spread around
+    jets, so that they can be matched with delta R, and links between tracks and jets are filled where the input
+    type has them.
+    """
+
+    # PDG IDs of PF candidates, including a few that have to be reclassified or are not recognized
+    pdg_ids = np.array([211, -211, 321, -321, 2212, 11, -11, 13, -13, 22, 130, 2112, 1, 2], dtype=np.int32)
+
+    # counters of collections which are not declared in DataProcessor.variables
+    extra_counters = {
+        "MissingET/MissingET.MET": "MissingET_size",
+        "JetPFCandsAK4_jetIdx": "nJetPFCandsAK4",
+        "JetPFCandsAK8_jetIdx": "nJetPFCandsAK8",
+    }
+
+    # branch needed to recognize the scoutingAtHlt input type
+    scouting_tag = "double_hltScoutingPFPacker_pfMetPhi_HLT2018."
+
+    def __init__(self, n_events, n_jets=4., n_fat_jets=2.5, n_tracks=40., n_neutral_hadrons=10., n_photons=10.,
+                 basket_size=10000, seed=0):
+        """
+        Args:
+            n_events (int): Number of events to write.
+            n_jets, n_fat_jets, n_tracks, n_neutral_hadrons, n_photons (float): Mean numbers of objects per event.
+            basket_size (int): Number of events written at once (and so in each basket of the tree).
+            seed (int): Seed of the random number generator.
+        """
+        self.n_events = n_events
+        self.mean_multiplicities = {
+            "Jet": n_jets,
+            "FatJet": n_fat_jets,
+            "Track": n_tracks,
+            "Neutral": n_neutral_hadrons,
+            "Photon": n_photons,
+        }
+        self.basket_size = basket_size
+        self.seed = seed
+
+    @staticmethod
+    def get_collections(input_type):
+        """
+        Returns dict with variables (dict of variable name to branch name) of each collection written for given
+        input type. Variables which are not stored per object (like MET in nanoAOD) have collection None.
+        """
+        collections = {}
+
+        for variable, branch in DataProcessor.variables[input_type].items():
+            if variable.startswith("N_"):
+                continue
+
+            if variable.startswith("MET_") or variable == "Gen_weight":
+                # Delphes stores MET in an array with a single element
+                collection = "MET" if input_type == InputTypes.Delphes else None
+            elif variable.startswith("Track_jet_index_") or variable.startswith("Track_cand_index_"):
+                # links are a separate collection in 106X, but they're stored with tracks in 102X
+                radius = variable[-len("AK4"):]
+                collection = "Track_" + radius if input_type == InputTypes.PFnanoAOD102X else "Link_" + radius
+            elif variable.startswith("Track_") and input_type == InputTypes.PFnanoAOD102X:
+                collection = "Track_" + variable[-len("AK4"):]
+            else:
+                collection = variable.split("_")[0]
+
+            collections.setdefault(collection, {})[variable] = branch
+
+        return collections
+
+    @staticmethod
+    def get_counter_name(input_type, collection, branches):
+        """
+        Returns name of the branch with number of objects in the collection.
+        """
+        counters = {
+            "Jet": "N_jets",
+            "FatJet": "N_fat_jets",
+            "Track": "N_tracks",
+            "Track_AK4": "N_tracks_AK4",
+            "Track_AK8": "N_tracks_AK8",
+            "Neutral": "N_neutral_hadrons",
+            "Photon": "N_photons",
+        }
+        variables = DataProcessor.variables[input_type]
+
+        if counters.get(collection) in variables:
+            return variables[counters[collection]]
+
+        for branch in branches:
+            if branch in SyntheticTreeWriter.extra_counters:
+                return SyntheticTreeWriter.extra_counters[branch]
+
+        # collections without declared counter (e.g. scouting objects, which are counted from the arrays)
+        return "n" + collection
+
+    def write(self, path, input_type):
+        """
+        Writes file with synthetic events of given input type.
+        """
+        rng = np.random.default_rng(self.seed)
+        collections = SyntheticTreeWriter.get_collections(input_type)
+        tree_name = "Delphes" if input_type == InputTypes.Delphes else "Events"
+
+        with uproot.recreate(path) as file:
+            for first in range(0, self.n_events, self.basket_size):
+                n_events = min(self.basket_size, self.n_events - first)
+                arrays = self.get_arrays(rng, input_type, collections, n_events)
+
+                if first == 0:
+                    branch_names = {variable: branch for variables in collections.values()
+                                    for variable, branch in variables.items()}
+                    counter_names = {collection: SyntheticTreeWriter.get_counter_name(input_type, collection,
+                                                                                      variables.values())
+                                     for collection, variables in collections.items() if collection is not None}
+
+                    file.mktree(tree_name, {name: array.type if isinstance(array, ak.Array) else array.dtype
+                                            for name, array in arrays.items()},
+                                counter_name=lambda collection: counter_names[collection],
+                                field_name=lambda collection, variable: branch_names[variable])
+
+                file[tree_name].extend(arrays)
+
+    def get_arrays(self, rng, input_type, collections, n_events):
+        """
+        Returns dict of arrays to be written for n_events events: jagged records for collections and flat arrays
+        for per-event variables.
+        """
+        multiplicities = {name: rng.poisson(mean, n_events) for name, mean in self.mean_multiplicities.items()}
+        jets = {name: self.get_jets(rng, multiplicities[name]) for name in ["Jet", "FatJet"]}
+        arrays = {}
+
+        for collection, variables in collections.items():
+            if collection is None:
+                for variable, branch in variables.items():
+                    arrays[branch] = self.get_event_values(rng, variable, n_events)
+                continue
+
+            object_type = collection.split("_")[0]
+
+            if object_type == "MET":
+                counts = np.ones(n_events, dtype=np.int64)
+                values = {variable: self.get_event_values(rng, variable, n_events) for variable in variables}
+            elif object_type in jets:
+                counts = multiplicities[object_type]
+                values = {variable: self.get_jet_values(rng, jets[object_type], variable) for variable in variables}
+            else:
+                jet_type = "FatJet" if collection.endswith("AK8") else "Jet"
+                counts = multiplicities["Track" if object_type == "Link" else object_type]
+                values = self.get_candidate_values(rng, variables, counts, jets[jet_type], multiplicities[jet_type])
+
+                if object_type == "Link":
+                    counts, values = self.get_links(values, counts)
+
+            arrays[collection] = ak.zip({variable: ak.unflatten(array, counts) for variable, array in values.items()})
+
+        if input_type == InputTypes.scoutingAtHlt:
+            arrays[SyntheticTreeWriter.scouting_tag] = np.zeros(n_events)
+
+        return arrays
+
+    @staticmethod
+    def get_event_values(rng, variable, n_events):
+        """
+        Returns values of per-event variable (MET or generator weight).
+        """
+        if variable == "MET_pt":
+            return rng.exponential(100., n_events)
+        elif variable == "MET_phi":
+            return rng.uniform(-np.pi, np.pi, n_events)
+        elif variable == "Gen_weight":
+            return rng.normal(1., 0.1, n_events).astype(np.float32)
+
+        return rng.normal(0., 1., n_events).astype(np.float32)
+
+    @staticmethod
+    def get_jets(rng, counts):
+        """
+        Returns dict with flat pt (ordered within each event), eta, phi and mass of jets.
+        """
+        n_jets = counts.sum()
+        event = np.repeat(np.arange(len(counts)), counts)
+        pt = 30. + rng.exponential(150., n_jets)
+        pt = pt[np.lexsort((-pt, event))]
+
+        return {
+            "pt": pt,
+            "eta": rng.uniform(-2.5, 2.5, n_jets),
+            "phi": rng.uniform(-np.pi, np.pi, n_jets),
+            "mass": rng.exponential(20., n_jets),
+        }
+
+    @staticmethod
+    def get_jet_values(rng, jets, variable):
+        """
+        Returns flat values of given jet variable.
+        """
+        name = variable.split("_")[-1]
+        n_jets = len(jets["pt"])
+
+        if name in jets:
+            return jets[name].astype(np.float32)
+        elif name in ["nCharged", "nNeutral"]:
+            return rng.poisson(10., n_jets).astype(np.int32)
+        elif name == "flavor":
+            return rng.choice(np.array([0, 1, 2, 3, 4, 5, 21], dtype=np.int32), n_jets)
+
+        # energy fractions
+        return rng.uniform(0., 1., n_jets).astype(np.float32)
+
+    @staticmethod
+    def get_candidate_values(rng, variables, counts, jets, n_jets):
+        """
+        Returns dict with flat values of given candidate variables. Most candidates are placed close to a random
+        jet of the event, which is stored as the jet index.
+        """
+        n_candidates = counts.sum()
+        event = np.repeat(np.arange(len(counts)), counts)
+        jet_offsets = np.cumsum(n_jets) - n_jets
+
+        has_jets = n_jets[event] > 0
+        in_jet = has_jets & (rng.random(n_candidates) < 0.7)
+        jet_index = np.where(in_jet, (rng.random(n_candidates) * n_jets[event]).astype(np.int64), -1)
+        i_jet = jet_offsets[event] + np.maximum(jet_index, 0)
+
+        eta = rng.uniform(-3., 3., n_candidates)
+        phi = rng.uniform(-np.pi, np.pi, n_candidates)
+
+        if len(jets["pt"]) > 0:
+            eta = np.where(in_jet, jets["eta"][np.minimum(i_jet, len(jets["pt"]) - 1)] +
+                           rng.normal(0., 0.2, n_candidates), eta)
+            phi = np.where(in_jet, jets["phi"][np.minimum(i_jet, len(jets["pt"]) - 1)] +
+                           rng.normal(0., 0.2, n_candidates), phi)
+            phi = (phi + np.pi) % (2 * np.pi) - np.pi
+
+        generated = {
+            "eta": eta.astype(np.float32),
+            "phi": phi.astype(np.float32),
+            "pt": (0.5 + rng.exponential(3., n_candidates)).astype(np.float32),
+            "mass": np.full(n_candidates, 0.14, dtype=np.float32),
+            "pid": rng.choice(SyntheticTreeWriter.pdg_ids, n_candidates),
+            "jet_index": jet_index.astype(np.int32),
+            "cand_index": (np.arange(n_candidates) - np.repeat(np.cumsum(counts) - counts, counts)).astype(np.int32),
+        }
+
+        values = {}
+        for variable in variables:
+            name = variable.split("_", 1)[1]
+            name = name[:-len("_AK4")] if name.endswith("_AK4") or name.endswith("_AK8") else name
+            values[variable] = generated[name]
+
+        return values
+
+    @staticmethod
+    def get_links(values, counts):
+        """
+        Returns counts and values of links between candidates and jets, for candidates placed close to a jet.
+        """
+        jet_index = next(array for variable, array in values.items() if "jet_index" in variable)
+        linked = jet_index >= 0
+        event = np.repeat(np.arange(len(counts)), counts)
+
+        return np.bincount(event[linked], minlength=len(counts)), {variable: array[linked]
+                                                                   for variable, array in values.items()}
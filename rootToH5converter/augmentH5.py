@@ -0,0 +1,55 @@
+from FeatureAugmenter import FeatureAugmenter
+import argparse
+
+parser = argparse.ArgumentParser(description='Add features calculated from stored jet constituents and jet features to h5 outputs of the converter.')
+
+parser.add_argument("-i", "--input", dest="input_paths", default=None, required=True, nargs='+',
+                    help="Paths to h5 files produced by the converter.")
+
+parser.add_argument("-s", "--suffix", dest="suffix", default="_augmented",
+                    help="Suffix added to input file names to get output file names, which contain all groups of the input and the new ones (default: _augmented).")
+
+parser.add_argument("-p", "--in_place", dest="in_place", default=False, action='store_true',
+                    help="Add new groups to the input files instead of creating new files. (default: False).")
+
+parser.add_argument("-e", "--EFP_degree", dest="EFP_degree", type=int, default=-1,
+                    help="Degree of EFPs to be calculated from stored constituents (default: not calculated).")
+
+parser.add_argument("-f", "--features", dest="features", default=[], nargs='+',
+                    choices=FeatureAugmenter.jet_feature_names + FeatureAugmenter.event_feature_names,
+                    help="Jet features (calculated from stored constituents) and event features (calculated from two leading jets) to be added (default: none).")
+
+parser.add_argument("-r", "--overwrite", dest="overwrite", default=False, action='store_true',
+                    help="Replace existing groups with the same names, e.g. EFPs of a different degree. (default: False).")
+
+parser.add_argument("-n", "--chunk_size", dest="chunk_size", type=int, default=10000,
+                    help="Number of events processed at once (default: 10000).")
+
+parser.add_argument("-j", "--efp_jobs", dest="efp_jobs", type=int, default=1,
+                    help="Number of processes used to calculate EFPs, 0 to use all CPUs (default: 1).")
+
+parser.add_argument("-k", "--efp_cache_dir", dest="efp_cache_dir", default=None,
+                    help="Directory in which prepared EFP sets are stored and reused by later runs (default: no cache).")
+
+parser.add_argument("-v", "--verbosity_level", dest="verbosity_level", type=int, default=1,
+                    help="Verbosity level. 0 - no output, 1 - basic output, 2 - detailed output. (default: 1).")
+
+args = parser.parse_args()
+
+
+if __name__ == "__main__":
+    if args.EFP_degree < 0 and len(args.features) == 0:
+        print("ERROR -- nothing to calculate, specify EFP degree and/or features")
+        exit()
+
+    augmenter = FeatureAugmenter(efp_degree=args.EFP_degree,
+                                 features=args.features,
+                                 chunk_size=args.chunk_size,
+                                 efp_n_jobs=args.efp_jobs if args.efp_jobs > 0 else None,
+                                 overwrite=args.overwrite,
+                                 efp_cache_dir=args.efp_cache_dir,
+                                 verbosity_level=args.verbosity_level)
+
+    for input_path in args.input_paths:
+        output_path = None if args.in_place else input_path[:-len(".h5")] + args.suffix + ".h5"
+        augmenter.augment(input_path, output_path)
@@ -1,13 +1,17 @@
 from Converter import Converter
+from MultiConverter import MultiConverter
+from ParallelConverter import ParallelConverter
 import argparse
+import json
+import numpy as np
 
 parser = argparse.ArgumentParser(description='Process some integers.')
 
-parser.add_argument("-i", "--input", dest="input_path", default=None, required=True,
-                    help="path to text file with ROOT files' paths and selected events")
+parser.add_argument("-i", "--input", dest="input_paths", default=None, required=True, nargs='+',
+                    help="path to text file with ROOT files' paths and selected events (can be a few of them, e.g. for a grid of signals). Events can be given as indices, inclusive ranges (first-last) or npy files with sorted indices or boolean masks.")
 
 parser.add_argument("-o", "--output", dest="output_path", default="output.h5",
-                    help="output file name (default: output.h5)")
+                    help="output file name (default: output.h5). If a few inputs are given, output directory for files named after input lists.")
 
 parser.add_argument("-c", "--max_constituents", dest="max_constituents", type=int, default=-1,
                     help="Maximum number of constituents per jet to be stored (default: not stored).")
@@ -30,30 +34,174 @@ parser.add_argument("-v", "--verbosity_level", dest="verbosity_level", type=int,
 parser.add_argument("-d", "--force_delta_r_usage", dest="force_delta_r_usage", default=False, action='store_true',
                     help="Force using delta R for constituents, even if true links are available, like for PFnanoAOD. (default: False).")
 
+parser.add_argument("-b", "--columnar", dest="columnar", default=False, action='store_true',
+                    help="Process events in chunks with the columnar engine instead of one Event object at a time. (default: False).")
+
+parser.add_argument("-n", "--chunk_size", dest="chunk_size", type=int, default=10000,
+                    help="Number of tree entries read (and processed by the columnar engine) at once (default: 10000).")
+
+parser.add_argument("-s", "--streaming", dest="streaming", default=False, action='store_true',
+                    help="Append each processed chunk to the output file right away instead of keeping all events in memory. (default: False).")
+
+parser.add_argument("-w", "--workers", dest="workers", type=int, default=1,
+                    help="Number of worker processes. If larger than 1, selected events are split into shards converted in parallel and merged afterwards (default: 1).")
+
+parser.add_argument("-m", "--manifest", dest="manifest", default=False, action='store_true',
+                    help="Write json manifest listing converted shards instead of merging them into one output file. (default: False).")
+
+parser.add_argument("-p", "--efp_jobs", dest="efp_jobs", type=int, default=1,
+                    help="Number of processes used to calculate EFPs of each chunk, 0 to use all CPUs. Ignored when running with more than one worker (default: 1).")
+
+parser.add_argument("-k", "--cache_dir", dest="cache_dir", default=None,
+                    help="Directory for cached conversions of single input files, reused if files, selections and options didn't change (default: no cache).")
+
+parser.add_argument("-g", "--cache_size", dest="cache_size", type=float, default=10.,
+                    help="Maximum size of the cache in GB. Least recently used conversions are removed above it (default: 10).")
+
+parser.add_argument("-u", "--cache_checksums", dest="cache_checksums", default=False, action='store_true',
+                    help="Identify cached input files by checksum of their content instead of path, size and modification time. (default: False).")
+
+parser.add_argument("-t", "--float32", dest="float32", default=False, action='store_true',
+                    help="Store data as float32 instead of float64. (default: False).")
+
+parser.add_argument("-z", "--compression", dest="compression", default=None, choices=["lzf", "gzip"],
+                    help="Compression filter for output datasets (default: no compression).")
+
+parser.add_argument("-l", "--compression_level", dest="compression_level", type=int, default=4,
+                    help="Level of gzip compression, 0-9 (default: 4).")
+
+parser.add_argument("-x", "--chunk_events", dest="chunk_events", type=int, default=None,
+                    help="Number of events per chunk of output datasets (default: chunks of about 256 kB).")
+
+parser.add_argument("-y", "--ragged_constituents", dest="ragged_constituents", default=False, action='store_true',
+                    help="Store jet constituents as a flat table with per-jet offsets and counts instead of a padded array. (default: False).")
+
+parser.add_argument("-a", "--journal_chunks", dest="journal_chunks", type=int, default=0,
+                    help="Commit converted chunks to the output every this many chunks and record progress in a journal next to it, so that the conversion can be resumed. Implies streaming, single process only (default: 0, no journal; 10 if only --resume is given).")
+
+parser.add_argument("-q", "--resume", dest="resume", default=False, action='store_true',
+                    help="Resume journaled conversion from the last committed chunk (requires the same inputs and options). (default: False).")
+
+parser.add_argument("-O", "--output_format", dest="output_format", default="h5", choices=["h5", "parquet"],
+                    help="Format of the output: h5 file or directory with Parquet tables of events and jets (one row per jet). Parquet is only written by a single process, without streaming or journal (default: h5).")
+
+parser.add_argument("-C", "--configurations", dest="configurations", default=None,
+                    help="Json file with a list of output configurations, e.g. [{\"output\": \"ak4.h5\"}, {\"output\": \"ak8.h5\", \"use_fat_jets\": true, \"max_n_constituents\": 50}]. Each contains output path and Converter arguments different from the command line options. All outputs are produced in a single pass over the input trees. Single input and process only, without journal or cache (default: none).")
+
+parser.add_argument("-F", "--max_open_files", dest="max_open_files", type=int, default=64,
+                    help="Maximum number of input files open at the same time. Files are opened when their events are converted (default: 64).")
+
+parser.add_argument("-M", "--tree_manifest", dest="tree_manifest", default=None,
+                    help="Json file in which trees, input types and numbers of entries of input files are stored, so that unchanged files are not opened to find them in the next run (default: trees.json in the cache directory, if given).")
+
+parser.add_argument("-T", "--decompression_threads", dest="decompression_threads", type=int, default=0,
+                    help="Number of threads decompressing baskets of input branches (default: 0, in the reading thread).")
+
+parser.add_argument("-I", "--interpretation_threads", dest="interpretation_threads", type=int, default=0,
+                    help="Number of threads interpreting decompressed baskets as arrays (default: 0, in the reading thread).")
+
+parser.add_argument("-P", "--prefetch", dest="prefetch", default=False, action='store_true',
+                    help="Read the next chunk of entries in the background while the current one is converted. Overlap of reading with conversion is stored in the report. (default: False).")
+
+parser.add_argument("-E", "--efp_cache_dir", dest="efp_cache_dir", default=None,
+                    help="Directory in which prepared EFP sets are stored and reused by later runs, so that graphs are not enumerated again (default: efpsets in the cache directory, if given).")
+
+parser.add_argument("-S", "--selection", dest="selection", default=None, nargs='+',
+                    help="Cuts applied to events before they're converted, e.g. \"Pt[1] > 200\" \"(abs(Eta[0]) < 2.4) & (abs(Eta[1]) < 2.4)\" \"abs(Eta[0] - Eta[1]) < 1.5\" \"MET / MT > 0.15\". Comparisons combined with & or | need parentheses (and/or/not can be used too). Variables: MET, METPhi, genWeight, Mjj, MT, nJets and jet Pt, Eta, Phi, M indexed by position of the jet. Cutflow is stored in the report (default: no cuts).")
+
+parser.add_argument("-N", "--no_substructure", dest="no_substructure", default=False, action='store_true',
+                    help="Don't calculate ptD and axis2 jet features (stored as zeros). Without EFPs and constituents, jet constituents are then not read at all (default: False).")
+
 args = parser.parse_args()
 
 
 print("\n\n=======================================================")
 print("Running ROOT to h5 converter with the following options: ")
-print("input: ", args.input_path)
+print("input: ", args.input_paths)
 print("output: ", args.output_path)
 print("max constituents: ", args.max_constituents)
 print("EFP basis degree: ", args.EFP_degree)
 print("=======================================================\n\n")
 
 
-
-converter = Converter(input_path = args.input_path,
-                      store_n_jets= args.store_n_jets,
-                      jet_delta_r = args.delta_r,
+converter_args = dict(store_n_jets=args.store_n_jets,
+                      jet_delta_r=args.delta_r,
                       efp_degree=args.EFP_degree,
                       max_n_constituents=args.max_constituents,
                       use_fat_jets=args.use_fat_jets,
                       verbosity_level=args.verbosity_level,
-                      force_delta_r_usage=args.force_delta_r_usage
+                      force_delta_r_usage=args.force_delta_r_usage,
+                      columnar=args.columnar,
+                      chunk_size=args.chunk_size,
+                      efp_n_jobs=args.efp_jobs if args.efp_jobs > 0 else None,
+                      cache_dir=args.cache_dir,
+                      cache_size_gb=args.cache_size,
+                      cache_checksums=args.cache_checksums,
+                      h5_layout=dict(dtype=np.float32 if args.float32 else None,
+                                     compression=args.compression,
+                                     compression_level=args.compression_level,
+                                     shuffle=args.compression is not None,
+                                     chunk_events=args.chunk_events),
+                      ragged_constituents=args.ragged_constituents,
+                      max_open_files=args.max_open_files,
+                      tree_manifest_path=args.tree_manifest,
+                      decompression_threads=args.decompression_threads,
+                      interpretation_threads=args.interpretation_threads,
+                      prefetch=args.prefetch,
+                      efp_cache_dir=args.efp_cache_dir,
+                      selection=args.selection,
+                      substructure=not args.no_substructure
                       )
 
-converter.convert()
-converter.save(args.output_path)
-
-
+if __name__ == "__main__":
+    if args.output_format == "parquet" and (len(args.input_paths) > 1 or args.workers > 1 or args.manifest or
+                                            args.streaming or args.journal_chunks > 0 or args.resume):
+        print("ERROR -- parquet output can only be written by a single process, without streaming or journal")
+        exit()
+    
+    if (args.journal_chunks > 0 or args.resume) and (len(args.input_paths) > 1 or args.workers > 1 or args.manifest):
+        print("ERROR -- journaled conversion (--journal_chunks or --resume) can only be done from a single input in a single process")
+        exit()
+    
+    if args.configurations is not None:
+        if len(args.input_paths) > 1 or args.workers > 1 or args.manifest or args.journal_chunks > 0 or args.resume or \
+                args.cache_dir is not None:
+            print("ERROR -- multiple configurations can only be converted from a single input in a single process, without journal or cache")
+            exit()
+        
+        with open(args.configurations, "r") as configurations_file:
+            configurations = json.load(configurations_file)
+        
+        output_paths = [configuration.pop("output") for configuration in configurations]
+        common_args = {key: value for key, value in converter_args.items() if key not in ["chunk_size", "verbosity_level"]}
+        
+        multi_converter = MultiConverter(input_path=args.input_paths[0],
+                                         configurations=configurations,
+                                         chunk_size=args.chunk_size,
+                                         verbosity_level=args.verbosity_level,
+                                         **common_args)
+        
+        if args.streaming:
+            multi_converter.convert(output_paths)
+        else:
+            multi_converter.convert()
+            multi_converter.save(output_paths, args.output_format)
+    elif len(args.input_paths) == 1 and args.workers <= 1 and not args.manifest:
+        journal_chunks = args.journal_chunks if args.journal_chunks > 0 or not args.resume else 10
+        converter = Converter(input_path=args.input_paths[0], journal_chunks=journal_chunks, **converter_args)
+
+        if journal_chunks > 0:
+            converter.convert(output_file_name=args.output_path, resume=args.resume)
+        elif args.streaming:
+            converter.convert(output_file_name=args.output_path)
+        else:
+            converter.convert()
+            converter.save(args.output_path, args.output_format)
+    else:
+        parallel_converter = ParallelConverter(n_workers=args.workers,
+                                               converter_args=converter_args,
+                                               merge=not args.manifest,
+                                               verbosity_level=args.verbosity_level)
+
+        parallel_converter.convert(input_paths=args.input_paths,
+                                   output_paths=ParallelConverter.get_output_paths(args.input_paths, args.output_path))
@@ -0,0 +1,72 @@
+from Benchmark import Benchmark
+from DataProcessor import InputTypes
+from SyntheticTreeWriter import SyntheticTreeWriter
+import argparse
+import json
+
+parser = argparse.ArgumentParser(description='Benchmark the ROOT to h5 converter on synthetic inputs.')
+
+parser.add_argument("-n", "--n_events", dest="n_events", type=int, default=5000,
+                    help="Number of synthetic events of each input type (default: 5000).")
+
+parser.add_argument("-t", "--input_types", dest="input_types", default=[input_type.name for input_type in InputTypes],
+                    nargs='+', choices=[input_type.name for input_type in InputTypes],
+                    help="Input types to benchmark (default: all).")
+
+parser.add_argument("-s", "--option_sets", dest="option_sets", default=list(Benchmark.default_option_sets.keys()),
+                    nargs='+', choices=list(Benchmark.default_option_sets.keys()),
+                    help="Converter configurations to benchmark (default: all).")
+
+parser.add_argument("-j", "--jets", dest="jets", type=float, default=4.,
+                    help="Mean number of jets per event (default: 4).")
+
+parser.add_argument("-f", "--fat_jets", dest="fat_jets", type=float, default=2.5,
+                    help="Mean number of fat jets per event (default: 2.5).")
+
+parser.add_argument("-c", "--candidates", dest="candidates", type=float, default=40.,
+                    help="Mean number of tracks per event. Numbers of neutral hadrons and photons are a quarter of it (default: 40).")
+
+parser.add_argument("-d", "--work_dir", dest="work_dir", default="benchmark",
+                    help="Directory for synthetic inputs and outputs (default: benchmark).")
+
+parser.add_argument("-o", "--output", dest="output_path", default="benchmark.json",
+                    help="Output json file with results (default: benchmark.json).")
+
+parser.add_argument("-b", "--baseline", dest="baseline_path", default=None,
+                    help="Json file with results of a previous run. Configurations slower than it by more than the tolerance are reported and the script exits with an error (default: none).")
+
+parser.add_argument("-r", "--tolerance", dest="tolerance", type=float, default=0.2,
+                    help="Allowed relative drop of events/s with respect to the baseline (default: 0.2).")
+
+parser.add_argument("-v", "--verbosity_level", dest="verbosity_level", type=int, default=1,
+                    help="Verbosity level. 0 - no output, 1 - results, 2 - also output of the converter. (default: 1).")
+
+args = parser.parse_args()
+
+
+if __name__ == "__main__":
+    tree_writer = SyntheticTreeWriter(args.n_events, n_jets=args.jets, n_fat_jets=args.fat_jets,
+                                      n_tracks=args.candidates, n_neutral_hadrons=args.candidates / 4.,
+                                      n_photons=args.candidates / 4.)
+
+    benchmark = Benchmark(args.work_dir, tree_writer,
+                          option_sets={name: Benchmark.default_option_sets[name] for name in args.option_sets},
+                          verbosity_level=args.verbosity_level)
+
+    results = benchmark.run([InputTypes[name] for name in args.input_types])
+    Benchmark.save(results, args.output_path)
+
+    print("Benchmark results saved to: ", args.output_path)
+
+    if args.baseline_path is not None:
+        with open(args.baseline_path, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+
+        regressions = Benchmark.find_regressions(results, baseline, args.tolerance)
+
+        for input_type, name, rate, baseline_rate in regressions:
+            print("REGRESSION -- {0} {1}: {2:.1f} events/s, baseline: {3:.1f} events/s".format(input_type, name,
+                                                                                              rate, baseline_rate))
+
+        if len(regressions) > 0:
+            exit(1)
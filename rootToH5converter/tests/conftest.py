@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+# modules of the converter are imported flat, like in rootToH5.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from DataProcessor import InputTypes
+from SyntheticTreeWriter import SyntheticTreeWriter
+
+
+@pytest.fixture
+def synthetic_input(tmp_path):
+    """
+    Returns function writing a synthetic ROOT file of given input type and an input list selecting all its events,
+    which returns path of the input list.
+    """
+    def write(input_type=InputTypes.nanoAOD, n_events=200, name="input", seed=0):
+        root_path = str(tmp_path / (name + ".root"))
+        list_path = str(tmp_path / (name + ".txt"))
+
+        SyntheticTreeWriter(n_events, basket_size=max(n_events // 4, 1), seed=seed).write(root_path, input_type)
+
+        with open(list_path, "w") as list_file:
+            list_file.write("{0}: -1\n".format(root_path))
+
+        return list_path
+
+    return write
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from ConversionCache import ConversionCache
+
+
+def write_fragment(path, age):
+    with open(path, "w") as fragment:
+        fragment.write("fragment")
+
+    modification_time = time.time() - age
+    os.utime(path, (modification_time, modification_time))
+
+
+@pytest.mark.skipif(os.name == "nt", reason="writing processes can't be checked on Windows")
+def test_stale_fragments_are_removed(tmp_path):
+    finished_process = subprocess.Popen([sys.executable, "-c", "pass"])
+    finished_process.wait()
+
+    crashed = tmp_path / "crashed.{0}.tmp.h5".format(finished_process.pid)
+    recent = tmp_path / "recent.{0}.tmp.h5".format(finished_process.pid)
+    running = tmp_path / "running.{0}.tmp.h5".format(os.getpid())
+    cached = tmp_path / "cached.h5"
+
+    write_fragment(crashed, 2 * ConversionCache.stale_time)
+    write_fragment(recent, 0)
+    write_fragment(running, 2 * ConversionCache.stale_time)
+    write_fragment(cached, 2 * ConversionCache.stale_time)
+
+    ConversionCache(str(tmp_path), verbosity_level=0)
+
+    assert not crashed.exists()
+    assert recent.exists()
+    assert running.exists()
+    assert cached.exists()
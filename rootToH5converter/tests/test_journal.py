@@ -0,0 +1,65 @@
+import json
+
+import h5py
+import numpy as np
+import pytest
+
+from Converter import Converter
+from ConversionReport import ConversionReport
+
+
+class Interrupted(Exception):
+    pass
+
+
+def run(input_path, output_path, crash_after=None, resume=False):
+    """
+    Runs journaled conversion, interrupted before storing chunk number crash_after + 1 if it's given.
+    """
+    converter = Converter(input_path, store_n_jets=2, jet_delta_r=0.8, max_n_constituents=-1, efp_degree=-1,
+                          verbosity_level=0, chunk_size=20, journal_chunks=2, selection=["Pt[1] > 60"])
+
+    if crash_after is not None:
+        store_outputs = converter.store_outputs
+        n_stored = []
+
+        def store_outputs_and_crash(outputs):
+            if len(n_stored) == crash_after:
+                raise Interrupted()
+            n_stored.append(len(outputs))
+            store_outputs(outputs)
+
+        converter.store_outputs = store_outputs_and_crash
+
+    try:
+        converter.convert(output_file_name=output_path, resume=resume)
+    except Interrupted:
+        converter.writer.file.close()
+
+
+def test_resumed_conversion_reports_whole_conversion(synthetic_input, tmp_path):
+    input_path = synthetic_input(n_events=300)
+    reference_path, resumed_path = str(tmp_path / "reference.h5"), str(tmp_path / "resumed.h5")
+
+    run(input_path, reference_path)
+    run(input_path, resumed_path, crash_after=5)
+    run(input_path, resumed_path, crash_after=9, resume=True)
+    run(input_path, resumed_path, resume=True)
+
+    with h5py.File(reference_path, "r") as reference, h5py.File(resumed_path, "r") as resumed:
+        for name in reference:
+            np.testing.assert_array_equal(reference[name]["data"][:], resumed[name]["data"][:])
+
+    with open(ConversionReport.get_path(reference_path)) as reference_file:
+        reference = json.load(reference_file)
+    with open(ConversionReport.get_path(resumed_path)) as resumed_file:
+        resumed = json.load(resumed_file)
+
+    assert reference["n_processed_events"] == 300
+    for key in ["n_processed_events", "n_stored_events", "skipped_events", "cutflow", "unrecognized_pids",
+                "n_jets_without_constituents"]:
+        assert resumed[key] == reference[key], key
+
+    # wall time includes the interrupted runs, so stages don't take more than all of it
+    assert sum(stage["time"] for stage in resumed["stages"].values()) <= resumed["wall_time"]
+    assert resumed["events_per_second"] == pytest.approx(resumed["n_processed_events"] / resumed["wall_time"])
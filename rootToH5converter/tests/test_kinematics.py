@@ -0,0 +1,29 @@
+import numpy as np
+
+from Converter import Converter, OutputTypes
+from Kinematics import Kinematics
+
+
+def test_four_vectors_use_double_precision():
+    values = [np.float32(value) for value in (153.7, 1.3, -2.1, 17.9)]
+    energy, px, py, pz = Kinematics.get_four_vectors(*values)
+    expected = Kinematics.get_four_vectors(*[float(value) for value in values])
+
+    assert np.asarray(energy).dtype == np.float64
+    np.testing.assert_array_equal([energy, px, py, pz], expected)
+
+
+def test_object_path_matches_columnar_path(synthetic_input):
+    input_path = synthetic_input(n_events=300)
+    outputs = {}
+
+    for columnar in [False, True]:
+        converter = Converter(input_path, store_n_jets=2, jet_delta_r=0.8, max_n_constituents=-1, efp_degree=-1,
+                              verbosity_level=0, columnar=columnar, chunk_size=70)
+        converter.convert()
+        outputs[columnar] = {output_type: converter.output_arrays[output_type][:converter.total_count]
+                             for output_type in [OutputTypes.EventFeatures, OutputTypes.JetFeatures]}
+
+    for output_type, values in outputs[False].items():
+        assert len(values) > 0
+        np.testing.assert_allclose(values, outputs[True][output_type], rtol=1e-12, atol=1e-12)
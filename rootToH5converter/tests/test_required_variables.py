@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from Converter import Converter, OutputTypes
+from DataProcessor import InputTypes
+from Jet import Jet
+
+constituent_collections = ("Track_", "Neutral_", "Photon_", "N_tracks", "N_neutral_hadrons", "N_photons")
+
+
+def convert(input_path, **kwargs):
+    converter = Converter(input_path, store_n_jets=2, jet_delta_r=0.8, verbosity_level=0, chunk_size=70, **kwargs)
+    converter.convert()
+
+    return converter, {output_type: values[:converter.total_count]
+                       for output_type, values in converter.output_arrays.items()}
+
+
+@pytest.mark.parametrize("input_type", [InputTypes.nanoAOD, InputTypes.PFnanoAOD106X])
+@pytest.mark.parametrize("columnar", [False, True])
+def test_jet_features_only_run_skips_constituents(synthetic_input, input_type, columnar):
+    input_path = synthetic_input(input_type, n_events=150)
+    converter, outputs = convert(input_path, max_n_constituents=-1, efp_degree=-1, substructure=False,
+                                 columnar=columnar)
+
+    variables = converter.get_required_variables(input_type, columnar)
+    assert not [variable for variable in variables if variable.startswith(constituent_collections)]
+
+    # all jets are stored, with zero ptD and axis2
+    jet_features = outputs[OutputTypes.JetFeatures]
+    substructure = [Jet.get_feature_names().index(name) for name in ["PTD", "Axis2"]]
+    assert np.all(jet_features[:, :, substructure] == 0)
+    assert np.all(jet_features[:, :, Jet.get_feature_names().index("Pt")] > 0)
+    assert converter.n_jets_without_constituents == 0
+
+    # other features are the same as in the full conversion
+    _, full_outputs = convert(input_path, max_n_constituents=-1, efp_degree=-1, columnar=columnar)
+    full_jet_features = full_outputs[OutputTypes.JetFeatures]
+    has_constituents = np.any(full_jet_features != 0, axis=2)
+    other = [i for i in range(len(Jet.get_feature_names())) if i not in substructure]
+
+    np.testing.assert_array_equal(outputs[OutputTypes.EventFeatures], full_outputs[OutputTypes.EventFeatures])
+    np.testing.assert_array_equal(jet_features[has_constituents][:, other],
+                                  full_jet_features[has_constituents][:, other])
+
+
+def test_constituents_are_read_for_substructure(synthetic_input):
+    input_path = synthetic_input(n_events=10)
+
+    for kwargs in [dict(), dict(substructure=False, efp_degree=1), dict(substructure=False, max_n_constituents=5)]:
+        converter = Converter(input_path, store_n_jets=2, jet_delta_r=0.8, verbosity_level=0,
+                              **dict(dict(max_n_constituents=-1, efp_degree=-1), **kwargs))
+        variables = converter.get_required_variables(InputTypes.nanoAOD, False)
+
+        assert [variable for variable in variables if variable.startswith("Track_")]
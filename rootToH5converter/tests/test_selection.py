@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from Converter import Converter, OutputTypes
+from EventSelection import EventSelection
+from Jet import Jet
+
+
+def convert(input_path, selection=None):
+    # without substructure all jets are stored, so the cuts can be checked with stored features
+    converter = Converter(input_path, store_n_jets=2, jet_delta_r=0.8, max_n_constituents=-1, efp_degree=-1,
+                          verbosity_level=0, columnar=True, chunk_size=70, selection=selection, substructure=False)
+    converter.convert()
+
+    return converter, {output_type: values[:converter.total_count]
+                       for output_type, values in converter.output_arrays.items()}
+
+
+def get_passing(outputs, max_eta):
+    """
+    Returns mask of events of unselected outputs with both leading jets within max_eta.
+    """
+    eta = outputs[OutputTypes.JetFeatures][:, :, Jet.get_feature_names().index("Eta")]
+    return (np.abs(eta[:, 0]) < max_eta) & (np.abs(eta[:, 1]) < max_eta)
+
+
+def test_compound_cut(synthetic_input):
+    input_path = synthetic_input(n_events=300)
+    _, outputs = convert(input_path)
+    converter, selected = convert(input_path, ["(abs(Eta[0]) < 1.5) & (abs(Eta[1]) < 1.5)"])
+
+    passing = get_passing(outputs, 1.5)
+    assert 0 < passing.sum() < len(passing)
+
+    for output_type, values in selected.items():
+        np.testing.assert_array_equal(values, outputs[output_type][passing])
+
+    assert converter.report.cutflow["(abs(Eta[0]) < 1.5) & (abs(Eta[1]) < 1.5)"]["passed"] == passing.sum()
+
+
+def test_logical_operators_are_evaluated_per_event(synthetic_input):
+    input_path = synthetic_input(n_events=300)
+    _, bitwise = convert(input_path, ["(abs(Eta[0]) < 1.5) & (abs(Eta[1]) < 1.5) | ~(Pt[1] > 100)"])
+    _, logical = convert(input_path, ["abs(Eta[0]) < 1.5 and abs(Eta[1]) < 1.5 or not Pt[1] > 100"])
+
+    for output_type, values in bitwise.items():
+        np.testing.assert_array_equal(values, logical[output_type])
+
+
+@pytest.mark.parametrize("expression", ["abs(Eta[0]) < 2.4 & abs(Eta[1]) < 2.4", "Pt[0] > 100 | MET > 50"])
+def test_unparenthesized_bitwise_comparison_is_rejected(expression):
+    with pytest.raises(SystemExit):
+        EventSelection([expression])
+
+
+def test_cut_must_give_boolean_per_event(synthetic_input):
+    with pytest.raises(SystemExit):
+        convert(synthetic_input(n_events=50), ["MET / 2"])
@@ -1,8 +1,13 @@
 from collections import OrderedDict
 from glob import glob
+import json
+import os
 
 import h5py
 import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from ROOT import TFile
 
 from module.DataTable import DataTable
@@ -11,8 +16,17 @@ from module.DataTable import DataTable
 class DataLoader:
     """
     Allows to load data from h5 files as data table, dropping unused variables and limiting number of jets per event.
+    Rows of per-event tables are indexed by event id and rows of per-jet tables by (event id, jet index). Event ids
+    are unique among all loaded events and their sources (input ROOT file and entry) can be found in the event index
+    (see get_event_index).
     """
     
+    # groups with per-event variables (event features and those added by the feature augmentation)
+    event_keys = ["event_features", "event_augmented_features"]
+    
+    # group with the source of each event, written by the converter
+    index_key = "event_index"
+    
     def __init__(self, variables_to_drop, max_jets):
         """ DataLoader constructor.
         
@@ -29,6 +43,9 @@ class DataLoader:
         self.labels = OrderedDict()
         self.already_added_paths = []
         
+        self.event_ids = np.empty(0, dtype=np.int64)
+        self.event_sources = []
+        
     def get_data(self, data_path, name, weights_path=None, per_event=False):
         """ Loads data from provided path and returns as a data table
         Args:
@@ -41,14 +58,21 @@ class DataLoader:
         Returns:
             (DataTable)
         """
+        
+        if data_path.endswith(".parquet"):
+            return self.get_parquet_data(data_path, name, weights_path=weights_path, per_event=per_event)
 
-        keys_to_skip = [] if per_event else ["event_features"]
+        keys_to_skip = [] if per_event else DataLoader.event_keys
     
         for f in DataLoader.__get_files_from_path(data_path):
             self.__add_sample(f, keys_to_skip)
     
         if per_event:
             data = self.__make_table("event_features")
+            
+            for key in DataLoader.event_keys[1:]:
+                if key in self.sample_keys:
+                    data = data.merge_columns(self.__make_table(key))
         else:
             data = self.__make_tables()
             data.drop(data[data.Eta == 0].index, inplace=True)  # removes empty jets
@@ -96,7 +120,7 @@ class DataLoader:
             print("Adding sample ", sample_path)
             self.already_added_paths.append(sample_path)
             
-            keys = set(h5_file.keys())
+            keys = set(h5_file.keys()) - {DataLoader.index_key}
             
             if self.sample_keys is None:
                 self.sample_keys = keys
@@ -104,8 +128,50 @@ class DataLoader:
                 print("ERROR -- different h5 samples seem to have different groups/keys")
                 exit()
             
+            self.__add_event_index(h5_file, sample_path)
             self.__add_data_and_labels(h5_file, keys_to_skip)
     
+    def __add_event_index(self, h5_file, sample_path):
+        """ Adds ids and sources of events from h5 file, shifting ids by the number of events loaded before. For
+        files without the event index, ids are positions of events in the file and their sources are unknown.
+        
+        Args:
+            h5_file: h5 file to be added
+            sample_path (str): Path to the h5 file
+        """
+        
+        n_events = h5_file["event_features"]["data"].shape[0]
+        first_id = 0 if len(self.event_ids) == 0 else int(self.event_ids.max()) + 1
+        
+        if DataLoader.index_key in h5_file:
+            group = h5_file[DataLoader.index_key]
+            event_ids = group["event_id"][:]
+            files = [path.decode() if isinstance(path, bytes) else str(path) for path in group.attrs["files"]]
+            sources = pd.DataFrame({"file": np.asarray(files, dtype=object)[group["data"][:, 0]],
+                                    "entry": group["data"][:, 1]})
+        else:
+            event_ids = np.arange(n_events, dtype=np.int64)
+            sources = pd.DataFrame({"file": np.full(n_events, None, dtype=object),
+                                    "entry": np.full(n_events, -1, dtype=np.int64)})
+        
+        sources.index = pd.Index(first_id + event_ids, name="event_id")
+        sources["sample"] = sample_path
+        
+        self.event_ids = np.concatenate([self.event_ids, sources.index.values])
+        self.event_sources.append(sources)
+    
+    def get_event_index(self):
+        """ Returns sources of all loaded events.
+        
+        Returns:
+            (pd.DataFrame): Input ROOT file, entry number and h5 sample of each event, indexed by event id
+        """
+        
+        if len(self.event_sources) == 0:
+            return pd.DataFrame(columns=["file", "entry", "sample"], index=pd.Index([], name="event_id"))
+        
+        return pd.concat(self.event_sources)
+    
     def __make_table(self, key):
         """
         Creates a data table for given key, reshaping depending on whether these are event-level, jet-level
@@ -127,10 +193,14 @@ class DataLoader:
             return DataTable(np.expand_dims(data, 1), headers=labels)
         elif len(data.shape) == 2:
             # events features (?)
-            return DataTable(data, headers=labels)
+            table = DataTable(data, headers=labels)
+            table.df.index = pd.Index(self.event_ids, name="event_id")
+            return table
         elif len(data.shape) == 3:
             # jet features
-            return DataTable(np.vstack(data), headers=labels)
+            table = DataTable(np.vstack(data), headers=labels)
+            table.df.index = self.__get_jet_index(data.shape[1])
+            return table
         elif len(data.shape) == 4:
             # jet constituents
 
@@ -144,10 +214,26 @@ class DataLoader:
             stacked_data = np.vstack(stacked_data)
             stacked_data = stacked_data.transpose()
 
-            return DataTable(stacked_data, headers=constituents_labels)
+            table = DataTable(stacked_data, headers=constituents_labels)
+            table.df.index = self.__get_jet_index(data.shape[1])
+            return table
         else:
             raise AttributeError
     
+    def __get_jet_index(self, n_jets):
+        """ Returns index of rows of per-jet tables, with n_jets rows for each loaded event.
+        
+        Args:
+            n_jets (int): Number of jets per event
+
+        Returns:
+            (pd.MultiIndex): (event id, jet index) of each row
+        """
+        
+        return pd.MultiIndex.from_arrays([np.repeat(self.event_ids, n_jets),
+                                          np.tile(np.arange(n_jets), len(self.event_ids))],
+                                         names=["event_id", "jet_index"])
+    
     def __make_tables(self):
         """Prepares a table containing all jet-level information
         
@@ -155,7 +241,7 @@ class DataLoader:
             (DataTable): Table containing all jet-level information
         """
         
-        tables = [self.__make_table(k) for k in self.sample_keys if k != "event_features"]
+        tables = [self.__make_table(k) for k in self.sample_keys if k not in DataLoader.event_keys]
 
         ret, tables = tables[0], tables[1:]
         for table in tables:
@@ -168,7 +254,7 @@ class DataLoader:
         Args:
             h5_file: h5 file to be added
         """
-        keys = [k for k in h5_file.keys() if k not in keys_to_skip]
+        keys = [k for k in h5_file.keys() if k not in keys_to_skip + [DataLoader.index_key]]
         
         for key in keys:
             DataLoader.__check_file_ok(h5_file, key)
@@ -176,8 +262,10 @@ class DataLoader:
             if key not in self.labels:
                 self.labels[key] = np.asarray(h5_file[key]['labels'])
 
-            sample_data = h5_file[key]['data']
-            sample_data = self.__h5_to_array(sample_data, key)
+            if 'offsets' in h5_file[key]:
+                sample_data = self.__ragged_to_array(h5_file[key])
+            else:
+                sample_data = self.__h5_to_array(h5_file[key]['data'], key)
             
             if key not in self.data:
                 self.data[key] = np.asarray(sample_data)
@@ -185,7 +273,10 @@ class DataLoader:
                 self.data[key] = np.concatenate([self.data[key], sample_data])
 
     def __h5_to_array(self, data, key):
-        """ Converts h5 dataset to array, limiting number of jets per event to self.max_jets
+        """ Converts h5 dataset to array, limiting number of jets per event to self.max_jets. Data is read in blocks
+        of events aligned with chunks of the dataset (see 'chunk_events' attribute written by the converter), so that
+        each chunk is decompressed once and chunks of jets above self.max_jets are not read at all. Per-event groups
+        are read as they are.
         
         Args:
             data: Input h5 dataset
@@ -195,13 +286,187 @@ class DataLoader:
             (np.ndarray)
         """
         
-        if key in ["jet_features", "jet_eflow_variables"]:
-            return data[:, 0:self.max_jets, :]
-        if key == "jet_constituents":
-            return data[:, 0:self.max_jets, :, :]
+        if key in DataLoader.event_keys:
+            return data[:]
+        
+        if key not in ["jet_features", "jet_augmented_features", "jet_eflow_variables", "jet_constituents"]:
+            print("ERROR -- no known way to reshape group ", key)
+            exit()
+        
+        n_events = data.shape[0]
+        n_jets = min(self.max_jets, data.shape[1])
+        
+        if "chunk_events" in data.attrs:
+            block_size = int(data.attrs["chunk_events"])
+        elif data.chunks is not None:
+            block_size = data.chunks[0]
+        else:
+            block_size = max(n_events, 1)
+        
+        array = np.empty((n_events, n_jets) + data.shape[2:], dtype=data.dtype)
+        
+        for first in range(0, n_events, block_size):
+            last = min(first + block_size, n_events)
+            data.read_direct(array, np.s_[first:last, 0:n_jets], np.s_[first:last])
+        
+        return array
+
+    def __ragged_to_array(self, group):
+        """ Converts ragged jet constituents (flat 'data' table with per-jet 'offsets' and 'counts') to an array
+        padded with zeros to the number of constituents stored in 'max_n_constituents' attribute, limiting number of
+        jets per event to self.max_jets.
+        
+        Args:
+            group: Input h5 group with ragged constituents
+
+        Returns:
+            (np.ndarray)
+        """
+        
+        flat_data, offsets, counts = self.__read_ragged(group)
+        n_events, n_jets = counts.shape
+        max_n_constituents = int(group.attrs["max_n_constituents"])
+        
+        array = np.zeros((n_events, n_jets, max_n_constituents) + flat_data.shape[1:], dtype=flat_data.dtype)
+        
+        i_constituent = np.arange(max_n_constituents)
+        is_filled = i_constituent < counts[:, :, np.newaxis]
+        array[is_filled] = flat_data[(offsets[:, :, np.newaxis] + i_constituent)[is_filled]]
+        
+        return array
+    
+    def __read_ragged(self, group):
+        """ Reads ragged jet constituents of the first self.max_jets jets of each event. Constituents of other jets
+        are skipped, and offsets are updated to point to the returned flat table.
+        
+        Args:
+            group: Input h5 group with ragged constituents
+
+        Returns:
+            (Tuple[np.ndarray, np.ndarray, np.ndarray]): flat table of constituents, offsets and counts of
+                                                         constituents of each jet
+        """
+        
+        n_jets = min(self.max_jets, group['offsets'].shape[1])
+        offsets = group['offsets'][:, :n_jets]
+        counts = group['counts'][:, :n_jets]
+        
+        if offsets.size == 0 or counts.sum() == 0:
+            return np.empty((0, ) + group['data'].shape[1:], dtype=group['data'].dtype), offsets, counts
+        
+        # constituents are ordered by event and jet, so all requested ones are within a single range of rows
+        first = int(offsets[counts > 0].min())
+        last = int((offsets + counts)[counts > 0].max())
+        data = group['data'][first:last]
+        
+        rows = np.repeat(offsets.ravel() - first, counts.ravel())
+        rows += np.arange(len(rows)) - np.repeat(np.cumsum(counts.ravel()) - counts.ravel(), counts.ravel())
+        
+        new_offsets = (np.cumsum(counts.ravel()) - counts.ravel()).reshape(counts.shape)
+        
+        return data[rows], new_offsets, counts
+    
+    def get_ragged_constituents(self, data_path, key="jet_constituents"):
+        """ Loads jet constituents from provided path in the ragged format, limiting number of jets per event to
+        self.max_jets. Files with padded constituents are converted to the ragged format.
+        
+        Args:
+            data_path (str): Path to data to load (can contain wildcards)
+            key (str): h5 group with jet constituents
+
+        Returns:
+            (Tuple[np.ndarray, np.ndarray, np.ndarray]): flat table of constituents (ordered by event, jet and
+                                                         constituent), offsets of the first constituent and number of
+                                                         constituents of each jet (arrays of shape (n_events, n_jets))
+        """
+        
+        flat_data, offsets, counts = [], [], []
+        n_rows = 0
+        
+        for path in DataLoader.__get_files_from_path(data_path):
+            with h5py.File(path, mode="r") as h5_file:
+                DataLoader.__check_file_ok(h5_file, key)
+                
+                if 'offsets' in h5_file[key]:
+                    sample_data, sample_offsets, sample_counts = self.__read_ragged(h5_file[key])
+                else:
+                    padded = self.__h5_to_array(h5_file[key]['data'], key)
+                    is_filled = np.any(padded != 0, axis=3)
+                    sample_counts = np.where(np.any(is_filled, axis=2),
+                                             padded.shape[2] - np.argmax(is_filled[:, :, ::-1], axis=2), 0)
+                    sample_data = padded[np.arange(padded.shape[2]) < sample_counts[:, :, np.newaxis]]
+                    sample_offsets = (np.cumsum(sample_counts) - sample_counts.ravel()).reshape(sample_counts.shape)
+            
+            flat_data.append(sample_data)
+            offsets.append(sample_offsets + n_rows)
+            counts.append(sample_counts)
+            n_rows += len(sample_data)
+        
+        return np.concatenate(flat_data), np.concatenate(offsets), np.concatenate(counts)
+
+    def get_parquet_data(self, data_path, name, columns=None, filters=None, weights_path=None, per_event=False):
+        """ Loads Parquet dataset(s) written by the converter (directories with tables of events and jets) and
+        returns as a data table. Only requested columns are read and row groups which can't pass the filters are
+        skipped based on their statistics, so reading time scales with the number of used columns and selected rows.
+        Only first self.max_jets jets of each event are loaded. Rows are indexed by event id (and jet index), shifted
+        for each dataset by the number of events loaded before.
+        
+        Args:
+            data_path (str): Path to data to load (can contain wildcards)
+            name (str): Output data table name
+            columns (List[str]): Columns to load. If None, all columns with a single value per row are loaded,
+                                 except for self.variables_to_drop, event ids and jet indices.
+            filters (List[Tuple]): Row filters in the pyarrow format, e.g. [("Pt", ">", 200)]
+            weights_path (str): If specified, will load weights histogram and calculate weights that can be later
+                                accessed via self.weights
+            per_event (Bool): If true, table of events will be loaded instead of the table of jets
+
+        Returns:
+            (DataTable)
+        """
+        
+        table_path = "events.parquet" if per_event else "jets.parquet"
+        filters = list(filters or [])
+        
+        if not per_event:
+            filters.append(("jet_index", "<", self.max_jets))
+        
+        index_columns = ["event_id"] if per_event else ["event_id", "jet_index"]
+        tables = []
+        first_id = 0
+        
+        for path in DataLoader.__get_files_from_path(data_path):
+            print("Adding sample ", path)
+            file_path = os.path.join(path, table_path)
+            file_columns = columns if columns is not None else self.__get_parquet_columns(file_path)
+            file_columns = index_columns + [column for column in file_columns if column not in index_columns]
+            
+            table = pq.read_table(file_path, columns=file_columns, filters=filters or None).to_pandas()
+            table["event_id"] += first_id
+            tables.append(table.set_index(index_columns))
+            
+            first_id += pq.read_metadata(os.path.join(path, "events.parquet")).num_rows
+        
+        data = DataTable(pd.concat(tables))
+        
+        if not per_event:
+            self.__calculate_weights(data, weights_path, name)
+        
+        return data
+    
+    def __get_parquet_columns(self, path):
+        """ Returns names of columns of Parquet table with a single value per row, except for self.variables_to_drop
+        and event/jet indices.
+        
+        Args:
+            path (str): Path to the Parquet table
 
-        print("ERROR -- no known way to reshape group ", key)
-        exit()
+        Returns:
+            (List[str])
+        """
+        
+        return [field.name for field in pq.read_schema(path) if not pa.types.is_list(field.type) and
+                field.name not in self.variables_to_drop + ["event_id", "jet_index", "file_id", "entry"]]
 
     @staticmethod
     def __check_file_ok(h5_file, key):
@@ -218,7 +483,8 @@ class DataLoader:
     @staticmethod
     def __get_files_from_path(path):
         """
-        Returns global paths to files from provided path (can contain wildcards).
+        Returns global paths to files from provided path (can contain wildcards). If path points to a json manifest
+        of shards produced by the converter, returns paths to all shards in the order of events.
         If no files were found, quits application.
         
         Args:
@@ -228,7 +494,12 @@ class DataLoader:
             (List[str]): List of global paths to files
         """
         
-        files = glob(path)
+        if path.endswith(".json"):
+            with open(path, "r") as manifest_file:
+                manifest = json.load(manifest_file)
+            files = [os.path.join(os.path.dirname(path), shard["path"]) for shard in manifest["shards"]]
+        else:
+            files = glob(path)
     
         if len(files) == 0:
             print("ERROR -- no files found in ", path)
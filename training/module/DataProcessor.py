@@ -103,13 +103,14 @@ class DataProcessor:
         
         Args:
             input_data (DataTable): Data table to pick entries from
-            indices (Int64Index): Indices to keep in the output data table.
+            indices (Index): Indices to keep in the output data table.
 
         Returns:
             (DataTable)
         """
-        data = DataTable(input_data.df.loc[np.asarray([indices]).T.flatten()])
+        positions = input_data.df.index.get_indexer(indices)
+        data = DataTable(input_data.df.iloc[positions].copy())
         if input_data.weights is not None:
-            data.weights = np.take(input_data.weights, indices)
+            data.weights = np.take(input_data.weights, positions)
         
         return data
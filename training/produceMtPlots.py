@@ -43,8 +43,9 @@ def get_hist_data(events, event_indices, jets, errors):
         
         mt = events["MT"][iEvent]
         
-        i_jet_1 = 2 * iEvent + 0
-        i_jet_2 = 2 * iEvent + 1
+        # rows of jets are indexed by (event id, jet index)
+        i_jet_1 = (iEvent, 0)
+        i_jet_2 = (iEvent, 1)
         
         jet_1 = jets.loc[i_jet_1, :]
         jet_2 = jets.loc[i_jet_2, :]